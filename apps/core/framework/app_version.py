@@ -0,0 +1,126 @@
+'''
+APP版本校验
+
+一次查询加载全部版本, 预先计算每个版本号 是否有效、是否需要强制更新, 缓存在进程内:
+    有效: 存在未删除的该版本
+    强制更新: 该版本已上架(status=2), 且存在更高的已上架强制更新版本
+版本保存或删除后递增 redis 中的版本号, 各进程据此重新加载。
+'''
+import time
+import threading
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from core.framework.v_exception import VException
+from core.utils.redis_client import RedisClientInstance
+from app_edition.models import AppEdition
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 版本表版本号
+EDITION_VERSION_KEY = 'app_edition:version'
+# 本地校验版本号间隔(秒)
+VERSION_CHECK_INTERVAL = 5
+
+
+# 版本号 -> (是否有效, 是否强制更新)
+def build_edition_map(edition_list):
+    # 已上架的强制更新中最高的版本
+    forced_code = None
+    for edition in edition_list:
+        if edition['status'] == 2 and edition['forced_update'] == 1:
+            if forced_code is None or edition['edition_code'] > forced_code:
+                forced_code = edition['edition_code']
+
+    edition_map = {}
+    for edition in edition_list:
+        if edition['is_delete'] != 0:
+            continue
+        code = str(edition['edition_code'])
+        # 同一版本号取 id 最小的一条
+        if code in edition_map:
+            continue
+        forced = edition['status'] == 2 and forced_code is not None and forced_code > edition['edition_code']
+        edition_map[code] = (True, forced)
+    return edition_map
+
+
+class AppEditionResolver(object):
+    # 线程锁
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.version = None
+        self.checked_time = 0
+        self.edition_map = None
+
+    @classmethod
+    def get_instance(cls):
+        if not hasattr(AppEditionResolver, '_instance'):
+            with AppEditionResolver._instance_lock:
+                if not hasattr(AppEditionResolver, '_instance'):
+                    AppEditionResolver._instance = AppEditionResolver()
+        return AppEditionResolver._instance
+
+    # 校验版本号, 版本变化则清空本地缓存
+    def check_version(self):
+        now = time.time()
+        if self.version is not None and now - self.checked_time < VERSION_CHECK_INTERVAL:
+            return self.version
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            value = redis_client.get_by_name(EDITION_VERSION_KEY)
+            version = int(value) if value else 0
+        except Exception as e:
+            logger.error("app edition version error {}".format(e))
+            # redis 不可用时不使用本地缓存
+            self.version = None
+            self.edition_map = None
+            return None
+        if version != self.version:
+            self.edition_map = None
+            self.version = version
+        self.checked_time = now
+        return version
+
+    def load_edition_map(self):
+        edition_list = AppEdition.objects.order_by('id').values('edition_code', 'is_delete', 'status',
+                                                                'forced_update')
+        return build_edition_map(list(edition_list))
+
+    def get_edition_map(self):
+        version = self.check_version()
+        edition_map = self.edition_map
+        if edition_map is None:
+            edition_map = self.load_edition_map()
+            if version is not None:
+                self.edition_map = edition_map
+        return edition_map
+
+    # 校验请求的APP版本号
+    def check(self, app_code):
+        valid, forced = self.get_edition_map().get(str(app_code), (False, False))
+        if not valid:
+            raise VException(500, '当前APP已失效，请卸载后重新下载')
+        if forced:
+            raise VException(506, 'APP有新版本需要升级')
+
+    # 版本变更, 递增版本号
+    def invalidate(self):
+        self.edition_map = None
+        self.version = None
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.increase_by(EDITION_VERSION_KEY)
+        except Exception as e:
+            logger.error("app edition invalidate error {}".format(e))
+
+
+# 发布、编辑、删除版本后刷新缓存, 事务提交后递增版本号
+def invalidate_app_edition(sender, **kwargs):
+    transaction.on_commit(AppEditionResolver.get_instance().invalidate)
+
+
+post_save.connect(invalidate_app_edition, sender=AppEdition, dispatch_uid='app_edition_version_save')
+post_delete.connect(invalidate_app_edition, sender=AppEdition, dispatch_uid='app_edition_version_delete')
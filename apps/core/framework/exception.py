@@ -39,13 +39,20 @@ def custom_exception_handler(exc, context):
         elif response.status_code == 405:
             detail = "请求方法不被允许"
 
+        elif response.status_code == 429:
+            detail = "访问太频繁，请稍后访问"
+
         elif response.status_code == 502:
             detail = "网络超时"
 
         else:
             detail = "服务器正忙,请稍后再试"
 
+        retry_after = response.get('Retry-After', None)
         response = VResponse(code=response.status_code, detail=detail, url=url)
+        # 限流时返回等待秒数
+        if retry_after:
+            response['Retry-After'] = retry_after
 
     elif response is None:
         # 为空，自定义二次处理
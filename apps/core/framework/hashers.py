@@ -3,8 +3,10 @@ import binascii
 import functools
 import hashlib
 import importlib
+import threading
 import warnings
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
@@ -62,6 +64,110 @@ def check_password(password, encoded, setter=None, preferred='default'):
     return is_correct
 
 
+def verify_password(password, encoded, preferred='default'):
+    """
+    Return (is_correct, new_encoded). new_encoded is the password hashed
+    with the preferred hasher when the stored hash must be updated, else None.
+
+    Pure computation, safe to run in the hashing pool; the caller saves
+    new_encoded.
+    """
+    updated = []
+    is_correct = check_password(password, encoded,
+                                setter=lambda raw: updated.append(make_password(raw, hasher=preferred)),
+                                preferred=preferred)
+    new_encoded = updated[0] if updated else None
+    # Never replace a hash with one of a lower work factor.
+    if new_encoded and is_weaker_hash(new_encoded, encoded):
+        new_encoded = None
+    return is_correct, new_encoded
+
+
+def get_work_factor(encoded):
+    """
+    Return (algorithm, work factor) of an encoded PBKDF2 or bcrypt hash,
+    (algorithm, None) for hashers without a single comparable work factor.
+    """
+    algorithm = encoded.split('$', 1)[0]
+    try:
+        if algorithm in ('pbkdf2_sha256', 'pbkdf2_sha1'):
+            return algorithm, int(encoded.split('$', 3)[1])
+        if algorithm in ('bcrypt_sha256', 'bcrypt'):
+            return algorithm, int(encoded.split('$', 4)[3])
+    except (IndexError, ValueError):
+        pass
+    return algorithm, None
+
+
+def is_weaker_hash(new_encoded, encoded):
+    """
+    Return True if new_encoded uses the same algorithm as encoded with a
+    lower work factor, e.g. after the configured iterations were lowered.
+    """
+    new_algorithm, new_work_factor = get_work_factor(new_encoded)
+    algorithm, work_factor = get_work_factor(encoded)
+    if new_algorithm != algorithm or new_work_factor is None or work_factor is None:
+        return False
+    return new_work_factor < work_factor
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    """
+    Return the bounded pool used for password hashing.
+
+    Under gevent the pool is gevent's native thread pool, so the hashing
+    (which releases the GIL) runs on real OS threads and does not block the
+    hub; otherwise it's a ThreadPoolExecutor. The size is PASSWORD_HASH_WORKERS.
+    """
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                max_workers = getattr(settings, 'PASSWORD_HASH_WORKERS', 4)
+                try:
+                    from gevent import monkey
+                    from gevent.threadpool import ThreadPool
+                    if monkey.is_module_patched('threading'):
+                        _hash_pool = ThreadPool(max_workers)
+                except ImportError:
+                    pass
+                if _hash_pool is None:
+                    _hash_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+    return _hash_pool
+
+
+def run_in_hash_pool(func, *args):
+    """Run func(*args) in the hashing pool and wait for the result."""
+    pool = get_hash_pool()
+    if isinstance(pool, ThreadPoolExecutor):
+        return pool.submit(func, *args).result()
+    return pool.spawn(func, *args).get()
+
+
+def check_password_pooled(password, encoded, updater=None, preferred='default'):
+    """
+    check_password() run in the hashing pool.
+
+    If updater is specified, it's called with the new encoded hash when the
+    password is correct and the stored hash must be updated (rehash on login).
+    A new hash with a lower work factor than the stored one is never passed
+    to updater.
+    """
+    is_correct, new_encoded = run_in_hash_pool(verify_password, password, encoded, preferred)
+    if updater and is_correct and new_encoded:
+        updater(new_encoded)
+    return is_correct
+
+
+def make_password_pooled(password, salt=None, hasher='default'):
+    """make_password() run in the hashing pool."""
+    return run_in_hash_pool(make_password, password, salt, hasher)
+
+
 def make_password(password, salt=None, hasher='default'):
     """
     Turn a plain-text password into a hash for database storage
@@ -87,6 +193,10 @@ def get_hashers():
         if not getattr(hasher, 'algorithm'):
             raise ImproperlyConfigured("hasher doesn't specify an "
                                        "algorithm name: %s" % hasher_path)
+        # Work factor overrides, e.g. {'pbkdf2_sha256': {'iterations': 260000}}.
+        # Existing hashes keep verifying and are upgraded on the next login.
+        for name, value in getattr(settings, 'PASSWORD_HASHER_PARAMS', {}).get(hasher.algorithm, {}).items():
+            setattr(hasher, name, value)
         hashers.append(hasher)
     return hashers
 
@@ -98,7 +208,7 @@ def get_hashers_by_algorithm():
 
 @receiver(setting_changed)
 def reset_hashers(**kwargs):
-    if kwargs['setting'] == 'PASSWORD_HASHERS':
+    if kwargs['setting'] in ('PASSWORD_HASHERS', 'PASSWORD_HASHER_PARAMS'):
         get_hashers.cache_clear()
         get_hashers_by_algorithm.cache_clear()
 
@@ -1,20 +1,70 @@
-import json
 import time
+import uuid
 import logging
 
+from django.conf import settings
 from rest_framework.throttling import BaseThrottle
 from core.utils.functions import get_ip_address
 from config.config import SafeModuleConfig
 from core.utils.redis_client import RedisClientInstance
 from core.framework.v_exception import VException, KException
-from app_edition.models import AppEdition
+from core.framework.app_version import AppEditionResolver
 
 
 logger = logging.getLogger("django")
 
 
-
-# 登录频率限制（缓存redis）
+'''
+滑动窗口限流脚本, 一次往返内完成检查与记录
+KEYS: 各限流窗口的 zset, 成员为请求标识, 分值为请求时间(毫秒)
+ARGV: 当前时间(毫秒), 请求标识, 之后每个窗口依次为 请求次数, 窗口时长(毫秒)
+全部窗口未超限时才记录本次请求, 返回 {是否允许, 需等待的毫秒数}
+'''
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+for index, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[index * 2 + 1])
+    local duration = tonumber(ARGV[index * 2 + 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - duration)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local key_wait = duration
+        if oldest[2] then
+            key_wait = tonumber(oldest[2]) + duration - now
+        end
+        if key_wait > wait then
+            wait = key_wait
+        end
+    end
+end
+if wait > 0 then
+    return {0, wait}
+end
+for index, key in ipairs(KEYS) do
+    local duration = tonumber(ARGV[index * 2 + 2])
+    redis.call('ZADD', key, now, ARGV[2])
+    redis.call('PEXPIRE', key, duration)
+end
+return {1, 0}
+"""
+
+
+def parse_rate(rate):
+    num, period = rate.split('/')
+    num_requests = int(num)
+    duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return num_requests, duration
+
+
+'''
+访问频率限制(redis 滑动窗口)
+
+默认按 user / anon 限流, 频率在配置文件 safe_module 中设置;
+视图可设置 throttle_scope 追加限流窗口, 为字典时按 action 区分:
+    throttle_scope = {'login_handler': 'login'}
+scope 对应的频率在 REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] 中设置, 视图也可通过 throttle_rates 覆盖
+'''
 class UserRateThrottle(BaseThrottle):
 
     def __init__(self):
@@ -23,17 +73,18 @@ class UserRateThrottle(BaseThrottle):
             'anon': SafeModuleConfig.anon_time_request,
             'user': SafeModuleConfig.user_time_request
         }
+        self.rates.update(settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}))
         self.requests_limit = self.parse_rate(self.rates)
-        self.history = []
+        self.wait_seconds = None
 
 
     def parse_rate(self, rates):
         requests_limit = {}
 
         for scope, rate in rates.items():
-            num, period = rate.split('/')
-            num_requests = int(num)
-            duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+            if not rate:
+                continue
+            num_requests, duration = parse_rate(rate)
             requests_limit[scope] = {
                 'num_requests': num_requests,
                 'duration': duration
@@ -42,80 +93,68 @@ class UserRateThrottle(BaseThrottle):
         return requests_limit
 
 
-    def allow_request(self, request, view):
-        '''
-        日志记录访问
-        '''
-        try:
-            request_body = json.loads(request.body)
-        except:
-            request_body = dict()
-        if request.method == 'GET':
-            request_body.update(dict(request.GET))
-        else:
-            request_body.update(dict(request.POST))
-        logger.info("url: {}, method: {}, body: {}".format(request.get_full_path(), request.method, json.dumps(request_body)))
+    # 视图设置的限流 scope
+    def get_view_scope(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if isinstance(scope, dict):
+            scope = scope.get(getattr(view, 'action', None), None)
+        return scope
 
-        # 访问频率控制
-        try:
-            ident_ip = get_ip_address(request)
-            user = request.user
-            if user:
-                # 验证用户
-                scope = 'user'
-                ident = user.id
-                duration = self.requests_limit['user']['duration']
-                num_requests = self.requests_limit['user']['num_requests']
 
+    # 本次请求需检查的限流窗口 [(缓存key, 请求次数, 窗口时长)]
+    def get_windows(self, request, view):
+        user = request.user
+        if user:
+            # 验证用户
+            scope = 'user'
+            ident = user.id
+        else:
+            # 匿名用户
+            scope = 'anon'
+            ident = get_ip_address(request)
+
+        scope_list = [scope]
+        view_scope = self.get_view_scope(view)
+        if view_scope:
+            scope_list.append(view_scope)
+
+        view_rates = getattr(view, 'throttle_rates', None) or {}
+        windows = []
+        for item in scope_list:
+            if item in view_rates:
+                num_requests, duration = parse_rate(view_rates[item])
+            elif item in self.requests_limit:
+                num_requests = self.requests_limit[item]['num_requests']
+                duration = self.requests_limit[item]['duration']
             else:
-                # 匿名用户
-                scope = 'anon'
-                ident = ident_ip
-                duration = self.requests_limit['anon']['duration']
-                num_requests = self.requests_limit['anon']['num_requests']
+                logger.error("throttle scope {} 未配置频率".format(item))
+                continue
+            windows.append(('throttle:{}:{}'.format(item, ident), num_requests, duration))
+        return windows
+
 
+    def allow_request(self, request, view):
+        # 访问频率控制
+        try:
             # APP校验版本号
             app_code = request.META.get('HTTP_VERSION_CODE', None)
             if app_code:
-                current_version = AppEdition.objects.filter(edition_code=app_code,
-                                                            is_delete=0).first()
-                if not current_version:
-                    raise VException(500, '当前APP已失效，请卸载后重新下载')
-
-                # 审核中的APP忽略升级
-                if current_version.status == 2:
-                    '''
-                    APP请求 校验是否强制更新
-                    当前版本号向上寻找，查找是否有已上架的强制更新
-                    '''
-                    last_code = AppEdition.objects.filter(status=2,
-                                                          forced_update=1,
-                                                          edition_code__gt=app_code).first()
-                    if last_code:
-                        raise VException(506, 'APP有新版本需要升级')
-
-            # 缓存key
-            cache_key = 'throttle:{}:{}'.format(scope, ident)
-
-            # 获取访问记录
-            self.history = []
-            cache_history = self.redis_client.get_by_name(cache_key)
-            if cache_history:
-                self.history = json.loads(cache_history)
-
-            # 当前时间
-            self.now = time.time()
-            while self.history and self.history[-1] <= self.now - duration:
-                self.history.pop()
-            # 请求总数
-            if len(self.history) >= num_requests:
+                AppEditionResolver.get_instance().check(app_code)
+
+            windows = self.get_windows(request, view)
+            if not windows:
+                return True
+
+            keys = []
+            args = [int(time.time() * 1000), uuid.uuid4().hex]
+            for cache_key, num_requests, duration in windows:
+                keys.append(cache_key)
+                args.extend([num_requests, duration * 1000])
+            allowed, wait = self.redis_client.run_script(SLIDING_WINDOW_SCRIPT, keys=keys, args=args)
+            if not allowed:
                 logger.error("访问太频繁，请稍后访问")
-                raise VException(500, '访问太频繁，请稍后访问')
-
-            # 头部插入访问记录
-            self.history.insert(0, self.now)
-
-            self.redis_client.single_set_string_with_expire_time(cache_key, "second", duration, json.dumps(self.history))
+                self.wait_seconds = int(wait) / 1000
+                return False
 
             return True
 
@@ -124,3 +163,8 @@ class UserRateThrottle(BaseThrottle):
         except Exception as e:
             logger.error("operate log error {}".format(e))
             raise VException(500,  '服务器正忙，请稍后再试')
+
+
+    # 距离窗口内最早一次请求过期的秒数, 用于 Retry-After
+    def wait(self):
+        return self.wait_seconds
@@ -1,8 +1,6 @@
 from rest_framework.authentication import BaseAuthentication
 from core.framework.v_exception import VException
-from permcontrol.models import User
-from permcontrol.service import check_cache_token
-from permcontrol.service import get_cache_role_permission
+from permcontrol.service import get_cache_principal
 
 
 class CommonAuthentication(BaseAuthentication):
@@ -12,16 +10,7 @@ class CommonAuthentication(BaseAuthentication):
         access_token = request.META.get('HTTP_ACCESS_TOKEN', '')
         if not access_token:
             raise VException(401, "当前未登录")
-        # 校验缓存里的token
-        user_id = check_cache_token(access_token)
-        # 用户校验
-        user = User.objects.filter(id=user_id,
-                                   is_delete=0).first()
-        if not user:
-            raise VException(401, "用户未注册")
-        # 缓存角色、权限
-        user_role, user_perms = get_cache_role_permission(user)
-        user.role = user_role
-        user.permission = user_perms
+        # 校验缓存里的token, 获取用户及角色、权限
+        user = get_cache_principal(access_token)
         result = (user,  None)
         return result
\ No newline at end of file
@@ -1,6 +1,6 @@
 from rest_framework.permissions import DjangoModelPermissions
 from core.framework.v_exception import VException, PermissException
-from permcontrol.service import get_permissions_role
+from permcontrol.service import has_role_permission, get_permissions_role
 
 import logging
 
@@ -20,7 +20,7 @@ class CustomPermissions(DjangoModelPermissions):
             raise VException(404, '请求路由不存在')
 
         try:
-            user_perms = request.user.permission
+            role_id = request.user.role_id
             # 权限名称
             module_perms = view.module_perms
             action_perms = view.action
@@ -37,7 +37,7 @@ class CustomPermissions(DjangoModelPermissions):
         except:
             raise VException(500, '请求异常，请稍后再试')
         logger.info("need_perms {}".format(need_perms))
-        if need_perms not in user_perms:
+        if not has_role_permission(role_id, need_perms):
             # 查找权限所需的角色
             roles = get_permissions_role(need_perms)
             raise PermissException(403, "没有权限访问", roles)
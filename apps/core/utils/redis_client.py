@@ -1,7 +1,9 @@
 # -*- coding:utf-8 -*-
+import json
 import redis
 import logging
 import threading
+from contextlib import contextmanager
 from config.config import CommonConfig
 from core.framework.v_exception import KException
 from apps.core.utils.functions import get_rest_seconds
@@ -19,7 +21,11 @@ class RedisClient:
         self.socket_timeout = 5
         self.socket_connect_timeout = 2
         self.max_connections = 100
+        # 连接池在取出空闲超过该时间(秒)的连接时检查连接, 命令不再单独 PING
+        self.health_check_interval = 30
         self.redis_client = None
+        # 已注册的 lua 脚本
+        self.script_map = {}
         # 创建连接
         self.connect()
 
@@ -35,6 +41,8 @@ class RedisClient:
                 'decode_responses': self.decode_responses,
                 'socket_timeout': self.socket_timeout,
                 'socket_connect_timeout': self.socket_connect_timeout,
+                'health_check_interval': self.health_check_interval,
+                'retry_on_timeout': True,
             }
 
             if self.password:
@@ -47,6 +55,7 @@ class RedisClient:
         except:
             return False
 
+    # 主动检查连接(命令执行前无需调用)
     def ping_connect(self):
         try:
             self.redis_client.ping()
@@ -60,8 +69,6 @@ class RedisClient:
 
     # 获取Redis服务器的时间 UNIX时间戳 + 这一秒已经逝去的微秒数
     def get_time(self):
-        self.ping_connect()
-
         try:
             return self.redis_client.time()
         except:
@@ -70,7 +77,6 @@ class RedisClient:
 
     # 获取所有对象名称
     def get_all_keys(self, pattern='*'):
-        self.ping_connect()
         try:
             return self.redis_client.keys(pattern=pattern)
         except:
@@ -80,7 +86,6 @@ class RedisClient:
 
     # 随机获取一个Key
     def get_random_key(self):
-        self.ping_connect()
         try:
             return self.redis_client.randomkey()
         except:
@@ -89,7 +94,6 @@ class RedisClient:
 
     # 设置Key在固定时间之后过期
     def set_key_expire_after(self, name, unit, time):
-        self.ping_connect()
         try:
             if unit == "second":
                 return self.redis_client.expire(name, time)
@@ -103,7 +107,6 @@ class RedisClient:
 
     # 设置Key在到达固定时间之时过期
     def set_key_expire_at(self, name, unit, time):
-        self.ping_connect()
         try:
             if unit == "second":
                 return self.redis_client.expireat(name, time)
@@ -117,7 +120,6 @@ class RedisClient:
 
     # 重新命名对象
     def rename_key(self, old_name, new_name):
-        self.ping_connect()
         try:
             return self.redis_client.rename(old_name, new_name)
 
@@ -128,7 +130,6 @@ class RedisClient:
 
     # 新Key不存在的情况下重命名
     def rename_key_if_not_exists(self, old_name, new_name):
-        self.ping_connect()
         try:
             return self.redis_client.renamenx(old_name, new_name)
 
@@ -139,7 +140,6 @@ class RedisClient:
 
     # 设置对象为永久保存
     def persist(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.persist(name)
 
@@ -149,7 +149,6 @@ class RedisClient:
 
     # 判断是否有某个名字的对象
     def exists(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.exists(name)
 
@@ -160,7 +159,6 @@ class RedisClient:
 
     # 删除对象
     def delete_by_name(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.delete(name)
 
@@ -169,7 +167,6 @@ class RedisClient:
             raise KException()
 
     def get_by_name(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.get(name)
         except:
@@ -178,7 +175,6 @@ class RedisClient:
 
     # 删除指定数据库中的内容
     def flush_database(self):
-        self.ping_connect()
         try:
             return self.redis_client.flushdb()
 
@@ -188,7 +184,6 @@ class RedisClient:
 
     # 删除整个Redis中的内容
     def flush_all(self):
-        self.ping_connect()
         try:
             return self.redis_client.flushall()
         except:
@@ -202,7 +197,6 @@ class RedisClient:
 
     # 单个添加字符串
     def single_set_string(self, name, value):
-        self.ping_connect()
         try:
             return self.redis_client.set(name, value)
 
@@ -213,7 +207,6 @@ class RedisClient:
 
     # 批量添加字符串
     def multi_set_string(self, *args, **kwargs):
-        self.ping_connect()
         try:
             return self.redis_client.mset(*args, **kwargs)
 
@@ -223,7 +216,6 @@ class RedisClient:
 
     # 获取单个字符串
     def single_get_string(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.get(name)
 
@@ -233,7 +225,6 @@ class RedisClient:
 
     # 批量获取字符串
     def multi_get_string(self, keys):
-        self.ping_connect()
         try:
             return self.redis_client.mget(keys)
 
@@ -243,7 +234,6 @@ class RedisClient:
 
     # 设置字符串并设置Key过期时间
     def single_set_string_with_expire_time(self, key, unit, time, value):
-        self.ping_connect()
         try:
             if unit == "second":
                 return self.redis_client.setex(key, time, value)
@@ -255,7 +245,6 @@ class RedisClient:
 
     # 并发设置字符串
     def singe_setnx_string(self, key, value, time=None):
-        self.ping_connect()
         try:
             return self.redis_client.set(key, value, ex=time, nx=True)
         except:
@@ -264,7 +253,6 @@ class RedisClient:
 
     # 将给定 name 的值设为 value ，并返回 name 的旧值(old value)
     def get_and_set_string(self, name, value):
-        self.ping_connect()
         try:
             return self.redis_client.getset(name, value)
 
@@ -274,7 +262,6 @@ class RedisClient:
 
     # 获取指定区间的字符串
     def get_string_by_range(self, name, start, end):
-        self.ping_connect()
         try:
             return self.redis_client.getrange(name, start, end)
 
@@ -284,7 +271,6 @@ class RedisClient:
 
     # 获取字符串的长度
     def get_string_length(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.strlen(name)
 
@@ -294,7 +280,6 @@ class RedisClient:
 
     # 将String中指定偏移量的字符串更换为指定字符串
     def set_string_by_range(self, name, offset, value):
-        self.ping_connect()
         try:
             return self.redis_client.setrange(name, offset, value)
 
@@ -304,7 +289,6 @@ class RedisClient:
 
     # 添加字符串到尾部
     def append_to_string_tail(self, name, value):
-        self.ping_connect()
         try:
             return self.redis_client.append(name, value)
 
@@ -315,7 +299,6 @@ class RedisClient:
 
     # Key中存储的数字值按给定值增加
     def increase_by(self, name, type="int", increment=1):
-        self.ping_connect()
         try:
             if type == "int":
                 return self.redis_client.incrby(name, increment)
@@ -328,7 +311,6 @@ class RedisClient:
 
     # Key中存储的数字值按给定值减少
     def decrease_by(self, name, decrement=1):
-        self.ping_connect()
         try:
             return self.redis_client.decrby(name, decrement)
 
@@ -343,7 +325,6 @@ class RedisClient:
 
     # 获取List中元素个数
     def len_of_list(self, name):
-        self.ping_connect()
         try:
             return self.redis_client.llen(name)
 
@@ -354,8 +335,6 @@ class RedisClient:
 
     # 插入元素到List头部
     def insert_to_list_head(self, name, *values):
-        self.ping_connect()
-
         try:
             return self.redis_client.lpush(name, *values)
 
@@ -366,8 +345,6 @@ class RedisClient:
 
     # 插入元素到List尾部
     def insert_to_list_tail(self, name, *values):
-        self.ping_connect()
-
         try:
             return self.redis_client.rpush(name, *values)
 
@@ -377,8 +354,6 @@ class RedisClient:
 
     # 从List头部获取一个元素并删除
     def get_and_delete_from_list_head(self, name):
-        self.ping_connect()
-
         try:
             return self.redis_client.lpop(name)
 
@@ -389,8 +364,6 @@ class RedisClient:
 
     # 从List尾部获取一个元素并删除
     def get_and_delete_from_list_tail(self, name):
-        self.ping_connect()
-
         try:
             return self.redis_client.rpop(name)
 
@@ -400,8 +373,6 @@ class RedisClient:
 
     # 移出并获取列表的第一个元素， 如果列表没有元素会阻塞列表直到等待超时或发现可弹出元素为止
     def block_and_pop_first_item_in_list(self, keys, timeout=1):
-        self.ping_connect()
-
         try:
             return self.redis_client.blpop(keys, timeout=timeout)
 
@@ -412,8 +383,6 @@ class RedisClient:
 
     # 移出并获取列表的最后一个元素， 如果列表没有元素会阻塞列表直到等待超时或发现可弹出元素为止
     def block_and_pop_last_item_in_list(self, keys, timeout=1):
-        self.ping_connect()
-
         try:
             return self.redis_client.brpop(keys, timeout=timeout)
 
@@ -424,8 +393,6 @@ class RedisClient:
 
     # 从列表中弹出一个值，将弹出的元素插入到另外一个列表中并返回它， 如果列表没有元素会阻塞列表直到等待超时或发现可弹出元素为止
     def block_pop_item_from_list_and_push_to_list(self, src, dst, timeout=1):
-        self.ping_connect()
-
         try:
             return self.redis_client.brpoplpush(src, dst, timeout=timeout)
 
@@ -436,8 +403,6 @@ class RedisClient:
 
     # 从列表中弹出一个值，将弹出的元素插入到另外一个列表中并返回它
     def pop_item_from_list_and_push_to_list(self, src, dst):
-        self.ping_connect()
-
         try:
             return self.redis_client.rpoplpush(src, dst)
 
@@ -448,8 +413,6 @@ class RedisClient:
 
     # 获取List中的元素
     def get_item_in_list_by_index(self, name, index):
-        self.ping_connect()
-
         try:
             return self.redis_client.lindex(name, index)
 
@@ -460,8 +423,6 @@ class RedisClient:
 
     # 将一个值插入到已存在的列表头部
     def insert_item_to_the_head_of_existent_list(self, name, item):
-        self.ping_connect()
-
         try:
             return self.redis_client.lpushx(name, item)
 
@@ -472,8 +433,6 @@ class RedisClient:
 
     # 将一个值插入到已存在的列表尾部
     def insert_item_to_the_tail_of_existent_list(self, name, item):
-        self.ping_connect()
-
         try:
             return self.redis_client.rpushx(name, item)
 
@@ -484,8 +443,6 @@ class RedisClient:
 
     # 获取List中指定区间的元素
     def get_items_in_list_by_range(self, name, start, stop):
-        self.ping_connect()
-
         try:
             return self.redis_client.lrange(name, start, stop)
 
@@ -504,8 +461,6 @@ class RedisClient:
            count < 0: Remove elements equal to value moving from tail to head.
            count = 0: Remove all elements equal to value.
         """
-        self.ping_connect()
-
         try:
             return self.redis_client.lrem(name, count, value)
 
@@ -516,8 +471,6 @@ class RedisClient:
 
     # 根据索引设置List中的元素
     def set_item_in_list_by_index(self, name, index):
-        self.ping_connect()
-
         try:
             return self.redis_client.lset(name, index)
 
@@ -527,8 +480,6 @@ class RedisClient:
 
     #  保留List中指定区间元素
     def trim_items_in_list_by_range(self, name, start, end):
-        self.ping_connect()
-
         try:
             return self.redis_client.ltrim(name, start, end)
 
@@ -538,7 +489,6 @@ class RedisClient:
 
     # 设置字符串并设置Key隔天失效
     def single_set_string_expire_next_day(self, key, value):
-        self.ping_connect()
         try:
             time = get_rest_seconds()
             self.redis_client.setex(key, time, value)
@@ -548,8 +498,6 @@ class RedisClient:
 
     # 发布数据
     def publish(self, channel, message):
-        self.ping_connect()
-
         try:
             return self.redis_client.publish(channel, message)
 
@@ -560,7 +508,6 @@ class RedisClient:
 
     # 订阅
     def pubsub(self):
-        self.ping_connect()
         try:
             return self.redis_client.pubsub()
         except:
@@ -568,6 +515,174 @@ class RedisClient:
             raise KException()
 
 
+    '''
+    Pipeline
+    '''
+
+    # 管道, 退出上下文时一次往返执行, 结果保存在 batch.results
+    @contextmanager
+    def pipeline(self, transaction=False):
+        batch = RedisBatch(self.redis_client.pipeline(transaction=transaction))
+        try:
+            yield batch
+            batch.results = batch.pipe.execute()
+        except redis.exceptions.RedisError as e:
+            log.error('{}  执行失败 {}'.format('Redis pipeline', e))
+            raise KException()
+        finally:
+            batch.pipe.reset()
+
+    # 事务 MULTI/EXEC
+    def transaction(self):
+        return self.pipeline(transaction=True)
+
+    # 批量获取字符串并解析 JSON, 不存在或解析失败为 None
+    def multi_get_json(self, keys):
+        if not keys:
+            return []
+        value_list = self.multi_get_string(keys)
+        result = []
+        for key, value in zip(keys, value_list):
+            if value is None:
+                result.append(None)
+                continue
+            try:
+                result.append(json.loads(value))
+            except ValueError:
+                log.error('{}  解析失败 {}'.format('Redis multi_get_json', key))
+                result.append(None)
+        return result
+
+    # 批量删除, 返回删除数量
+    def multi_delete(self, names):
+        if not names:
+            return 0
+        try:
+            return self.redis_client.delete(*names)
+        except:
+            log.error('{}  执行失败'.format('Redis multi_delete'))
+            raise KException()
+
+    # 批量设置字符串, 每个 Key 单独的过期时间(秒) {key: (value, time)}, time 为 None 时不过期
+    def multi_set_with_expire_time(self, mapping):
+        if not mapping:
+            return []
+        with self.pipeline() as batch:
+            for key, (value, time) in mapping.items():
+                if time is None:
+                    batch.set(key, value)
+                else:
+                    batch.setex(key, time, value)
+        return batch.results
+
+    '''
+    Hash
+    '''
+
+    # 批量获取哈希, 一次往返
+    def multi_get_hash(self, names):
+        with self.pipeline() as batch:
+            for name in names:
+                batch.hgetall(name)
+        return batch.results
+
+    # 整体替换哈希并设置过期时间
+    def replace_hash_with_expire_time(self, name, mapping, time):
+        with self.transaction() as batch:
+            batch.delete(name)
+            if mapping:
+                batch.hset(name, mapping=mapping)
+                batch.expire(name, time)
+        return batch.results
+
+    '''
+    Script
+    '''
+
+    # 执行 lua 脚本, 脚本按 sha 缓存
+    def run_script(self, script, keys=None, args=None):
+        try:
+            script_object = self.script_map.get(script, None)
+            if script_object is None:
+                script_object = self.redis_client.register_script(script)
+                self.script_map[script] = script_object
+            return script_object(keys=keys or [], args=args or [])
+        except:
+            log.error('{}  执行失败'.format('Redis run_script'))
+            raise KException()
+
+    '''
+    Stream
+    '''
+
+    # 添加消息
+    def add_to_stream(self, name, fields, maxlen=None):
+        try:
+            return self.redis_client.xadd(name, fields, maxlen=maxlen, approximate=True)
+        except:
+            log.error('{}  执行失败'.format('Redis add_to_stream'))
+            raise KException()
+
+    # 创建消费组, 已存在时忽略
+    def create_stream_group(self, name, group, id='0'):
+        try:
+            return self.redis_client.xgroup_create(name, group, id=id, mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' in str(e):
+                return False
+            log.error('{}  执行失败'.format('Redis create_stream_group'))
+            raise KException()
+        except:
+            log.error('{}  执行失败'.format('Redis create_stream_group'))
+            raise KException()
+
+    # 消费组读取消息, id 为 '>' 时读取新消息, '0' 时读取未确认的消息
+    def read_stream_group(self, name, group, consumer, id='>', count=None, block=None):
+        try:
+            return self.redis_client.xreadgroup(group, consumer, {name: id}, count=count, block=block)
+        except:
+            log.error('{}  执行失败'.format('Redis read_stream_group'))
+            raise KException()
+
+    # 确认消息
+    def ack_stream(self, name, group, *ids):
+        try:
+            return self.redis_client.xack(name, group, *ids)
+        except:
+            log.error('{}  执行失败'.format('Redis ack_stream'))
+            raise KException()
+
+    # 查询消费组未确认的消息 [{'message_id', 'consumer', 'time_since_delivered', 'times_delivered'}, ...]
+    def pending_stream(self, name, group, min='-', max='+', count=100, consumer=None):
+        try:
+            return self.redis_client.xpending_range(name, group, min, max, count, consumername=consumer)
+        except:
+            log.error('{}  执行失败'.format('Redis pending_stream'))
+            raise KException()
+
+    # 将空闲超过 min_idle_time(毫秒) 的未确认消息转移给 consumer, 只返回消息 id
+    def claim_stream(self, name, group, consumer, min_idle_time, *ids):
+        try:
+            return self.redis_client.xclaim(name, group, consumer, min_idle_time, list(ids), justid=True)
+        except:
+            log.error('{}  执行失败'.format('Redis claim_stream'))
+            raise KException()
+
+
+
+class RedisBatch(object):
+    '''
+    管道命令, 通过 RedisClient.pipeline() / transaction() 获取
+    '''
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.results = None
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+
 
 class RedisClientInstance(object):
     # 线程锁
@@ -6,10 +6,12 @@ logger = logging.getLogger("django")
 
 '''
 统计数据库的查询次数和时间
+queries 默认为当前连接记录的查询(需 DEBUG 或 CaptureQueriesContext)
 '''
-def query_time():
+def query_time(queries=None):
     total_time = 0
-    queries = connection.queries
+    if queries is None:
+        queries = connection.queries
     for query in queries:
         query_time = query['time']
         query_time = float(query_time)
@@ -19,5 +21,5 @@ def query_time():
         'time': total_time
     }
     logger.info(count_info)
-
+    return count_info
 
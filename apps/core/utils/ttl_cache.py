@@ -0,0 +1,50 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+'''
+进程内 LRU 缓存, 每项在 ttl 秒后失效
+超过 maxsize 时淘汰最久未使用的项
+'''
+class TTLCache(object):
+
+    def __init__(self, maxsize=1024, ttl=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key: (失效时间, value)
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self.lock:
+            item = self.data.get(key, None)
+            if item is None:
+                return default
+            if item[0] <= now:
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    # 删除满足条件的项 predicate(key, value)
+    def delete_if(self, predicate):
+        with self.lock:
+            for key in [key for key, item in self.data.items() if predicate(key, item[1])]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
@@ -0,0 +1,283 @@
+'''
+门禁打卡事件
+
+回调只做校验并写入 redis stream，由消费进程(manage.py consume_admit_event)按批读取，
+在内存中匹配 admit_guid -> user_id，去重后 bulk_create 入库，提交后更新当天实时状态(attendance_live)。
+去重键为 (admit_guid, device_no, show_time)，批内与库内记录均不重复写入。
+入库成功或数据无效的消息才确认，数据库不可用时消息保持未确认，消费进程重启后重新处理。
+消费者名称默认取主机名，重启后沿用同一名称；启动时另将其他消费者空闲超过 ADMIT_CLAIM_IDLE 的
+未确认消息(如已下线的消费者)转移到本消费者，再一并处理。
+'''
+import time
+import json
+import socket
+import datetime
+import threading
+from django.db import transaction, close_old_connections, OperationalError, InterfaceError
+from config.config import WOModuleConfig
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import User, AdmitRecord
+from permcontrol.attendance_live import update_live_states
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 打卡事件队列
+ADMIT_STREAM_KEY = 'admit_event:stream'
+# 消费组
+ADMIT_STREAM_GROUP = 'admit_event:consumer'
+# 队列保留长度(近似)
+ADMIT_STREAM_MAXLEN = 100000
+# admit_guid 映射全量刷新间隔(秒)
+GUID_MAP_REFRESH_INTERVAL = 60
+# 未匹配到人员时最短刷新间隔(秒)
+GUID_MAP_MISS_INTERVAL = 5
+# 其他消费者的未确认消息空闲超过该时间(毫秒)后转移
+ADMIT_CLAIM_IDLE = 60000
+
+EVENT_FIELDS = ['admit_name', 'admit_guid', 'device_no', 'rec_mode', 'file_path', 'show_time']
+
+
+# 解析回调数据, 非注册用户返回 None
+def parse_face_event(event_msg):
+    msg_dict = json.loads(event_msg)
+    result = int(msg_dict['result'])
+    # 识别为注册用户
+    if result != 1:
+        return None
+    show_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(msg_dict['showTime'] / 1000)))
+    return {
+        'admit_name': msg_dict['admitName'],
+        'admit_guid': msg_dict['admitGuid'],
+        'device_no': msg_dict['deviceNo'],
+        # 1:人像识别, 2:刷卡识别 ,3:人卡合一 4,人证比对 7:密码识别 8 二维码识别
+        'rec_mode': int(msg_dict['recMode']),
+        'file_path': msg_dict.get('filePath', '') or '',
+        'show_time': show_time,
+    }
+
+
+# 写入队列, redis 不可用时直接入库
+def push_face_event(event):
+    try:
+        redis_client = RedisClientInstance.get_storage_instance()
+        redis_client.add_to_stream(ADMIT_STREAM_KEY, event, maxlen=ADMIT_STREAM_MAXLEN)
+    except Exception as e:
+        logger.error("admit event push error {}, save directly".format(e))
+        save_admit_events([event])
+
+
+class AdmitGuidMap(object):
+    '''
+    admit_guid -> user_id
+    '''
+    # 线程锁
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.guid_map = {}
+        self.loaded_time = 0
+
+    @classmethod
+    def get_instance(cls):
+        if not hasattr(AdmitGuidMap, '_instance'):
+            with AdmitGuidMap._instance_lock:
+                if not hasattr(AdmitGuidMap, '_instance'):
+                    AdmitGuidMap._instance = AdmitGuidMap()
+        return AdmitGuidMap._instance
+
+    def load(self):
+        guid_map = {}
+        # 同一 guid 对应多个人员时取 id 最小者
+        queryset = User.objects.filter(is_delete=0, admit_guid__isnull=False).order_by('-id')
+        for admit_guid, user_id in queryset.values_list('admit_guid', 'id'):
+            guid_map[admit_guid] = user_id
+        self.guid_map = guid_map
+        self.loaded_time = time.time()
+
+    def get_user_id(self, admit_guid):
+        elapsed = time.time() - self.loaded_time
+        if elapsed > GUID_MAP_REFRESH_INTERVAL:
+            self.load()
+        elif admit_guid not in self.guid_map and elapsed > GUID_MAP_MISS_INTERVAL:
+            # 新录入的人员
+            self.load()
+        return self.guid_map.get(admit_guid, None)
+
+
+# 打卡类型
+def get_admit_type(device_no):
+    if device_no in WOModuleConfig.in_device_no:
+        return 0
+    elif device_no in WOModuleConfig.out_device_no:
+        return 1
+    return 2
+
+
+def event_key(event):
+    return event['admit_guid'], event['device_no'], event['show_time']
+
+
+# 批量入库, 返回写入条数
+def save_admit_events(events):
+    # 批内去重
+    event_map = {}
+    for event in events:
+        event = dict(event)
+        event['show_time'] = datetime.datetime.strptime(event['show_time'], "%Y-%m-%d %H:%M:%S")
+        event_map.setdefault(event_key(event), event)
+    if not event_map:
+        return 0
+
+    # 库内去重
+    show_time_list = [key[2] for key in event_map]
+    queryset = AdmitRecord.objects.filter(admit_guid__in={key[0] for key in event_map},
+                                          show_time__gte=min(show_time_list),
+                                          show_time__lte=max(show_time_list))
+    exist_keys = set(queryset.values_list('admit_guid', 'device_no', 'show_time'))
+
+    guid_map = AdmitGuidMap.get_instance()
+    record_list = []
+    for key, event in event_map.items():
+        if key in exist_keys:
+            continue
+        admit_record = AdmitRecord()
+        admit_record.admit_name = event['admit_name']
+        admit_record.user_id = guid_map.get_user_id(event['admit_guid'])
+        admit_record.admit_guid = event['admit_guid']
+        admit_record.device_no = event['device_no']
+        admit_record.admit_type = get_admit_type(event['device_no'])
+        admit_record.rec_mode = int(event['rec_mode'])
+        admit_record.file_path = event['file_path']
+        admit_record.show_time = event['show_time']
+        record_list.append(admit_record)
+    if record_list:
+        AdmitRecord.objects.bulk_create(record_list, batch_size=500)
+        # 提交后更新当天实时状态
+        transaction.on_commit(lambda: refresh_live_states(record_list))
+    return len(record_list)
+
+
+def refresh_live_states(record_list):
+    try:
+        update_live_states(record_list)
+    except Exception as e:
+        logger.error("attendance live update error {}".format(e))
+
+
+def to_str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def decode_event(fields):
+    event = {}
+    for name in EVENT_FIELDS:
+        event[name] = to_str(fields.get(name.encode(), b''))
+    return event
+
+
+class AdmitEventConsumer(object):
+    '''
+    打卡事件消费者
+    '''
+
+    def __init__(self, consumer=None, batch_size=500, block=2000):
+        # 名称需在重启后保持不变, 否则未确认的消息留在旧名称下
+        self.consumer = consumer or socket.gethostname()
+        self.batch_size = batch_size
+        self.block = block
+        self.running = True
+        self.redis_client = RedisClientInstance.get_storage_instance()
+        self.redis_client.create_stream_group(ADMIT_STREAM_KEY, ADMIT_STREAM_GROUP)
+
+    def stop(self, *args):
+        self.running = False
+
+    # 转移其他消费者空闲的未确认消息, 返回转移条数
+    def claim_idle(self):
+        count = 0
+        start = '-'
+        while True:
+            pending_list = self.redis_client.pending_stream(ADMIT_STREAM_KEY, ADMIT_STREAM_GROUP, min=start,
+                                                           count=self.batch_size)
+            if not pending_list:
+                return count
+            message_ids = [pending['message_id'] for pending in pending_list
+                           if to_str(pending['consumer']) != self.consumer
+                           and pending['time_since_delivered'] >= ADMIT_CLAIM_IDLE]
+            if message_ids:
+                count += len(self.redis_client.claim_stream(ADMIT_STREAM_KEY, ADMIT_STREAM_GROUP, self.consumer,
+                                                            ADMIT_CLAIM_IDLE, *message_ids))
+            if len(pending_list) < self.batch_size:
+                return count
+            # 从下一条继续
+            last_id = to_str(pending_list[-1]['message_id'])
+            millisecond, sequence = last_id.split('-')
+            start = '{}-{}'.format(millisecond, int(sequence) + 1)
+
+    # 读取一批消息 [(message_id, fields), ...]
+    def read(self, message_id):
+        response = self.redis_client.read_stream_group(ADMIT_STREAM_KEY, ADMIT_STREAM_GROUP, self.consumer,
+                                                       id=message_id, count=self.batch_size,
+                                                       block=None if message_id == '0' else self.block)
+        if not response:
+            return []
+        return response[0][1]
+
+    # 处理一批消息, 只确认已入库或无效的消息
+    # 数据库不可用时不确认, 抛出异常由命令重试, 重启后从未确认的消息继续处理
+    def handle(self, messages):
+        message_ids = [message_id for message_id, fields in messages]
+        event_list = []
+        ack_ids = []
+        for message_id, fields in messages:
+            # 已被裁剪的消息
+            if not fields:
+                ack_ids.append(message_id)
+                continue
+            try:
+                event_list.append((message_id, decode_event(fields)))
+            except Exception as e:
+                logger.error("admit event invalid {} error {}".format(message_id, e))
+                ack_ids.append(message_id)
+        count = 0
+        # 长时间运行, 释放失效的数据库连接
+        close_old_connections()
+        try:
+            try:
+                with transaction.atomic():
+                    count = save_admit_events([event for message_id, event in event_list])
+                ack_ids.extend(message_id for message_id, event in event_list)
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception as e:
+                logger.error("admit event batch error {}, retry one by one".format(e))
+                # 单条重试, 无效的消息记录日志后丢弃
+                for message_id, event in event_list:
+                    try:
+                        with transaction.atomic():
+                            count += save_admit_events([event])
+                    except (OperationalError, InterfaceError):
+                        raise
+                    except Exception as e:
+                        logger.error("admit event drop {} error {}".format(event, e))
+                    ack_ids.append(message_id)
+        finally:
+            if ack_ids:
+                self.redis_client.ack_stream(ADMIT_STREAM_KEY, ADMIT_STREAM_GROUP, *ack_ids)
+        return len(message_ids), count
+
+    def run(self, callback=None):
+        # 先处理本消费者及转移过来的未确认消息
+        self.claim_idle()
+        message_id = '0'
+        while self.running:
+            messages = self.read(message_id)
+            if not messages:
+                if message_id == '0':
+                    message_id = '>'
+                continue
+            result = self.handle(messages)
+            if callback:
+                callback(*result)
@@ -0,0 +1,173 @@
+'''
+考勤配置
+
+配置按名称加载全部历史记录，按生效日期排序建立索引，二分查找某天生效的配置。
+解析后的配置缓存在进程内，redis 中的版本号在编辑配置后递增，各进程据此重新加载。
+'''
+import time
+import json
+import bisect
+import datetime
+import threading
+from core.framework.v_exception import VException
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import AttendanceConfig
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 配置版本
+CONFIG_VERSION_KEY = 'attendance_config:version'
+# 本地校验版本号间隔(秒)
+VERSION_CHECK_INTERVAL = 5
+
+
+# 解析配置值, 解析失败时返回异常在使用时抛出
+def parse_time_interval_tuple(config):
+    try:
+        return json.loads(config.value)
+    except:
+        logger.error("attendance config error {}".format(config))
+        return VException(500, '上班时间段配置错误')
+
+
+def parse_out_limit(config):
+    try:
+        return float(config.value)
+    except:
+        logger.error("attendance config error {}".format(config))
+        return VException(500, '外出时长配置错误')
+
+
+def parse_exclude_user(config):
+    try:
+        if config.value:
+            return config.value.split(',')
+        return []
+    except:
+        logger.error("attendance config error {}".format(config))
+        return VException(500, '考勤人员配置错误')
+
+
+CONFIG_PARSER = {
+    'time_interval_tuple': parse_time_interval_tuple,
+    'out_limit': parse_out_limit,
+    'exclude_user': parse_exclude_user,
+}
+
+
+class ConfigIndex(object):
+    '''
+    单个配置项的生效日期索引
+
+    某天生效的配置为 日期早于当天(或无日期) 的记录中 id 最大的一条，
+    dates 为按日期排序的记录日期，values[k] 为前 k+1 条记录中 id 最大者的解析值。
+    '''
+
+    def __init__(self, config_list, parser):
+        config_list = sorted(config_list, key=lambda config: (config.date or datetime.date.min, config.id))
+        self.dates = []
+        self.values = []
+        self.latest = None
+        best_id = None
+        best_value = None
+        for config in config_list:
+            if best_id is None or config.id > best_id:
+                best_id = config.id
+                best_value = parser(config)
+            self.dates.append(config.date or datetime.date.min)
+            self.values.append(best_value)
+        self.latest = best_value
+
+    # 当天生效的配置
+    def resolve(self, date):
+        index = bisect.bisect_left(self.dates, date)
+        if index == 0:
+            return None
+        return self.values[index - 1]
+
+
+class AttendanceConfigResolver(object):
+    # 线程锁
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.version = None
+        self.checked_time = 0
+        self.index_map = None
+
+    @classmethod
+    def get_instance(cls):
+        if not hasattr(AttendanceConfigResolver, '_instance'):
+            with AttendanceConfigResolver._instance_lock:
+                if not hasattr(AttendanceConfigResolver, '_instance'):
+                    AttendanceConfigResolver._instance = AttendanceConfigResolver()
+        return AttendanceConfigResolver._instance
+
+    # 校验版本号, 版本变化则清空本地缓存
+    def check_version(self):
+        now = time.time()
+        if self.version is not None and now - self.checked_time < VERSION_CHECK_INTERVAL:
+            return self.version
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            value = redis_client.get_by_name(CONFIG_VERSION_KEY)
+            version = int(value) if value else 0
+        except Exception as e:
+            logger.error("attendance config version error {}".format(e))
+            # redis 不可用时不使用本地缓存
+            self.version = None
+            self.index_map = None
+            return None
+        if version != self.version:
+            self.index_map = None
+            self.version = version
+        self.checked_time = now
+        return version
+
+    # 一次查询加载全部配置
+    def load_index_map(self):
+        config_map = {name: [] for name in CONFIG_PARSER}
+        queryset = AttendanceConfig.objects.filter(name__in=list(CONFIG_PARSER)).only('id', 'name', 'value', 'date')
+        for config in queryset:
+            config_map[config.name].append(config)
+        return {name: ConfigIndex(config_map[name], CONFIG_PARSER[name]) for name in CONFIG_PARSER}
+
+    def get_index_map(self):
+        version = self.check_version()
+        index_map = self.index_map
+        if index_map is None:
+            index_map = self.load_index_map()
+            if version is not None:
+                self.index_map = index_map
+        return index_map
+
+    # 获取当天生效的考勤配置, 人员配置修改后立即生效
+    def resolve(self, date):
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        index_map = self.get_index_map()
+        attendance_config = {
+            'time_interval_tuple': index_map['time_interval_tuple'].resolve(date),
+            'out_limit': index_map['out_limit'].resolve(date),
+            'exclude_user': index_map['exclude_user'].latest,
+        }
+        for value in attendance_config.values():
+            if isinstance(value, VException):
+                raise value
+        if attendance_config['exclude_user'] is None:
+            attendance_config['exclude_user'] = []
+        else:
+            attendance_config['exclude_user'] = list(attendance_config['exclude_user'])
+        return attendance_config
+
+    # 配置变更, 递增版本号
+    def invalidate(self):
+        self.index_map = None
+        self.version = None
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.increase_by(CONFIG_VERSION_KEY)
+        except Exception as e:
+            logger.error("attendance config invalidate error {}".format(e))
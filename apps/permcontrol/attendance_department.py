@@ -0,0 +1,221 @@
+'''
+部门考勤汇总
+
+按 部门、周/月 在数据库中分组统计考勤记录:
+    每人每天取修正记录，没有修正记录时取原始记录
+    缺勤为出勤时长为 0 的考勤日，与月度汇总的出勤天数一致
+每条考勤记录只统计当天在职的人员(与 get_attendance_user_queryset 一致)，
+各部门自身的统计结果按 (周期, 考勤配置、日历、考勤记录、人员版本) 缓存在 redis，
+上级部门沿 Department.parent_id 汇总下级部门的结果。
+'''
+import json
+import datetime
+from django.db.models import Q, Exists, OuterRef, Subquery, Count, Sum, Case, When, IntegerField
+from django.db.models.functions import TruncWeek, TruncMonth
+from core.framework.v_exception import VException
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import User, Department, AttendanceRecord
+from permcontrol.attendance_config import CONFIG_VERSION_KEY
+from permcontrol.work_calendar import CALENDAR_VERSION_KEY
+from permcontrol.service import ATTENDANCE_RECORD_VERSION_KEY, ATTENDANCE_USER_VERSION_KEY, get_attendance_config, get_attendance_calendar, \
+    get_attendance_day_list, get_attendance_user_queryset, ensure_origin_records
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 统计周期
+PERIOD_TRUNC = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# 部门汇总缓存 period:start:end:version
+DEPARTMENT_SUMMARY_KEY = 'attendance_department:{}:{}:{}:{}'
+# 缓存时间
+DEPARTMENT_SUMMARY_EXPIRE = 60 * 60
+
+# 累加的统计字段
+COUNT_FIELDS = ['person_days', 'late_count', 'leave_early_count', 'out_timeout_count', 'absence_count',
+                'duty_duration']
+
+
+# 区间内的考勤日(不含今天和假期)
+def get_range_day_list(start_date:datetime.date, end_date:datetime.date):
+    day_list = []
+    month = datetime.datetime(start_date.year, start_date.month, 1)
+    while month.date() <= end_date:
+        for day in get_attendance_day_list(get_attendance_calendar(month), start_date):
+            if day.date() <= end_date:
+                day_list.append(day)
+        if month.month == 12:
+            month = datetime.datetime(month.year + 1, 1, 1)
+        else:
+            month = datetime.datetime(month.year, month.month + 1, 1)
+    return day_list
+
+
+# 考勤配置、日历、考勤记录、人员的版本, redis 不可用时返回 None
+def get_summary_version():
+    try:
+        redis_client = RedisClientInstance.get_storage_instance()
+        value_list = redis_client.multi_get_string([CONFIG_VERSION_KEY, CALENDAR_VERSION_KEY,
+                                                    ATTENDANCE_RECORD_VERSION_KEY, ATTENDANCE_USER_VERSION_KEY])
+    except Exception as e:
+        logger.error("department summary version error {}".format(e))
+        return None
+    return '-'.join(value.decode() if value else '0' for value in value_list)
+
+
+# 每人每天的有效考勤记录: 修正记录, 或没有修正记录的原始记录, 只取当天在职的人员
+def effective_record_queryset(day_list, exclude_user):
+    revise_queryset = AttendanceRecord.objects.filter(code=OuterRef('code'), is_revise=1)
+    active_user_queryset = User.objects.filter(Q(quit_date__isnull=True) | Q(quit_date__gt=OuterRef('date')),
+                                               ~Q(id__in=exclude_user),
+                                               Q(status=1),
+                                               id=OuterRef('user_id'))
+    return AttendanceRecord.objects.filter(Q(is_revise=1) | (Q(is_revise=0) & ~Q(Exists(revise_queryset))),
+                                           Exists(active_user_queryset),
+                                           date__in=[day.date() for day in day_list])
+
+
+def count_when(condition):
+    return Sum(Case(When(condition, then=1), default=0, output_field=IntegerField()))
+
+
+# 数据库分组统计各部门自身的考勤 [{department_id, period, ...}]
+def query_department_rows(day_list, exclude_user, period):
+    department_queryset = User.objects.filter(id=OuterRef('user_id')).values('department_id')[:1]
+    queryset = effective_record_queryset(day_list, exclude_user).annotate(
+        department_id=Subquery(department_queryset),
+        period=PERIOD_TRUNC[period]('date'),
+    ).values('department_id', 'period').annotate(
+        person_days=Count('id'),
+        late_count=count_when(Q(is_late=1)),
+        leave_early_count=count_when(Q(is_leave_early=1)),
+        out_timeout_count=count_when(Q(is_out_timeout=1)),
+        absence_count=count_when(Q(duty_duration__isnull=True) | Q(duty_duration__lte=0)),
+        duty_duration=Sum('duty_duration'),
+    ).order_by()
+    row_list = []
+    for row in queryset:
+        row['period'] = row['period'].strftime('%Y-%m-%d')
+        row['duty_duration'] = round(row['duty_duration'] or 0, 2)
+        row_list.append(row)
+    return row_list
+
+
+# 各部门自身的考勤统计, 优先读取缓存
+def load_department_rows(start_date:datetime.date, end_date:datetime.date, period):
+    version = get_summary_version()
+    cache_key = DEPARTMENT_SUMMARY_KEY.format(period, start_date, end_date, version)
+    if version is not None:
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            value = redis_client.get_by_name(cache_key)
+            if value:
+                return json.loads(value)
+        except Exception as e:
+            logger.error("department summary cache read error {}".format(e))
+
+    day_list = get_range_day_list(start_date, end_date)
+    if not day_list:
+        return []
+    exclude_user = get_attendance_config(day_list[-1])['exclude_user']
+    # 补齐当天在职人员缺失的原始记录
+    for day in day_list:
+        attendance_config = get_attendance_config(day)
+        ensure_origin_records(get_attendance_user_queryset(day, exclude_user), day,
+                              attendance_config['time_interval_tuple'], attendance_config['out_limit'])
+    row_list = query_department_rows(day_list, exclude_user, period)
+
+    if version is not None:
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.single_set_string_with_expire_time(cache_key, 'second', DEPARTMENT_SUMMARY_EXPIRE,
+                                                            json.dumps(row_list))
+        except Exception as e:
+            logger.error("department summary cache write error {}".format(e))
+    return row_list
+
+
+# 部门及全部下级部门 {department_id: [department_id, ...]}
+def department_subtree_map(department_list):
+    children_map = {}
+    for department in department_list:
+        children_map.setdefault(department.parent_id, []).append(department.id)
+    subtree_map = {}
+    for department in department_list:
+        subtree = []
+        visited = set()
+        pending = [department.id]
+        while pending:
+            department_id = pending.pop()
+            # 防止上级部门成环
+            if department_id in visited:
+                continue
+            visited.add(department_id)
+            subtree.append(department_id)
+            pending.extend(children_map.get(department_id, []))
+        subtree_map[department.id] = subtree
+    return subtree_map
+
+
+def rate(count, total):
+    if not total:
+        return 0
+    return round(count / total, 4)
+
+
+# 上级部门汇总下级部门, department_id 不为空时只返回该部门及其下级部门
+def rollup_department_rows(row_list, department_list, department_id=None):
+    own_map = {}
+    period_list = set()
+    for row in row_list:
+        own_map[(row['department_id'], row['period'])] = row
+        period_list.add(row['period'])
+    period_list = sorted(period_list)
+    subtree_map = department_subtree_map(department_list)
+
+    if department_id is not None:
+        if department_id not in subtree_map:
+            raise VException(500, '部门不存在')
+        department_ids = set(subtree_map[department_id])
+        department_list = [department for department in department_list if department.id in department_ids]
+
+    data = []
+    for department in department_list:
+        for period in period_list:
+            info = {
+                'department_id': department.id,
+                'name': department.name,
+                'parent_id': department.parent_id,
+                'period': period,
+            }
+            for field in COUNT_FIELDS:
+                info[field] = 0
+            for sub_id in subtree_map[department.id]:
+                row = own_map.get((sub_id, period), None)
+                if row is None:
+                    continue
+                for field in COUNT_FIELDS:
+                    info[field] += row[field]
+            info['duty_duration'] = round(info['duty_duration'], 2)
+            info['late_rate'] = rate(info['late_count'], info['person_days'])
+            info['leave_early_rate'] = rate(info['leave_early_count'], info['person_days'])
+            info['absence_rate'] = rate(info['absence_count'], info['person_days'])
+            data.append(info)
+    return data
+
+
+# 部门考勤汇总
+def summary_department_attendance(start_date:datetime.date, end_date:datetime.date, period, department_id=None):
+    if period not in PERIOD_TRUNC:
+        raise VException(500, '统计周期参数错误')
+    # 不统计今天及以后
+    end_date = min(end_date, datetime.date.today() - datetime.timedelta(days=1))
+    if start_date > end_date:
+        return []
+    row_list = load_department_rows(start_date, end_date, period)
+    department_list = list(Department.objects.filter(is_delete=0).order_by('id'))
+    return rollup_department_rows(row_list, department_list, department_id)
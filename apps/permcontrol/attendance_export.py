@@ -0,0 +1,157 @@
+'''
+考勤报表导出
+
+人员按 id 分批读取、分批计算，每批计算完成即写出，内存占用与人数无关。
+csv 通过 StreamingHttpResponse 边计算边返回；xlsx 使用 constant_memory 模式逐行写入临时文件，
+写完后以 FileResponse 分块返回。
+'''
+import os
+import csv
+import datetime
+import tempfile
+import xlsxwriter
+from django.http import StreamingHttpResponse, FileResponse
+from permcontrol.service import summary_days_attendance, read_month_summary, is_abnormal_info
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 每批计算人数
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_FILE_TYPES = ['xlsx', 'csv']
+
+EXPORT_CONTENT_TYPE = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def format_time(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M:%S')
+    return value
+
+
+def format_number(value):
+    if value is None:
+        return ''
+    return value
+
+
+def format_flag(value):
+    return '是' if value == 1 else '否'
+
+
+# 单日统计导出列 (字段, 表头, 格式化)
+DAY_EXPORT_COLUMNS = [
+    ('name', '姓名', format_number),
+    ('job_number', '工号', format_number),
+    ('date', '日期', format_number),
+    ('origin_first_admit', '签到时间', format_time),
+    ('origin_last_admit', '签退时间', format_time),
+    ('first_admit', '修正签到时间', format_time),
+    ('last_admit', '修正签退时间', format_time),
+    ('result_duty_duration', '上班时长', format_number),
+    ('result_out_duration', '外出时长', format_number),
+    ('valid_duty_duration', '有效时长', format_number),
+    ('is_late', '迟到', format_flag),
+    ('is_leave_early', '早退', format_flag),
+    ('is_out_timeout', '外出过长', format_flag),
+]
+
+# 月度统计导出列
+MONTH_EXPORT_COLUMNS = [
+    ('name', '姓名', format_number),
+    ('job_number', '工号', format_number),
+    ('date', '月份', format_number),
+    ('attendance_days', '应打卡天数', format_number),
+    ('duty_days', '出勤天数', format_number),
+    ('duty_duration_hours', '出勤时长', format_number),
+    ('out_duration_hours', '外出时长', format_number),
+    ('abnormal_days', '异常天数', format_number),
+    ('late_days', '迟到天数', format_number),
+    ('leave_early_days', '早退天数', format_number),
+    ('out_timeout_days', '外出过长天数', format_number),
+]
+
+
+# 按 id 分批读取人员
+def iter_user_chunks(user_queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset = user_queryset.order_by('id')
+    last_id = 0
+    while True:
+        user_list = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not user_list:
+            return
+        yield user_list
+        last_id = user_list[-1].id
+
+
+# 单日统计行
+def iter_day_summary_rows(user_queryset, input_datetime:datetime.datetime, time_interval_tuple, out_limit,
+                          abnormal=None):
+    for user_list in iter_user_chunks(user_queryset):
+        info_map = summary_days_attendance(user_list, [input_datetime], time_interval_tuple, out_limit)
+        for user in user_list:
+            info = info_map[user.id][0]
+            if abnormal and not is_abnormal_info(info, abnormal):
+                continue
+            yield info
+
+
+# 月度统计行
+def iter_month_summary_rows(user_queryset, month_datetime:datetime.datetime, calendar_data, time_interval_tuple,
+                            out_limit):
+    for user_list in iter_user_chunks(user_queryset):
+        for info in read_month_summary(user_list, month_datetime, calendar_data, time_interval_tuple, out_limit):
+            yield info
+
+
+def format_row(info, columns):
+    return [formatter(info[field]) for field, _, formatter in columns]
+
+
+# csv 逐行写出
+class EchoBuffer(object):
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_content(rows, columns):
+    writer = csv.writer(EchoBuffer())
+    # excel 识别 utf-8
+    yield '\ufeff' + writer.writerow([header for _, header, _ in columns])
+    for info in rows:
+        yield writer.writerow(format_row(info, columns))
+
+
+# xlsx 写入临时文件, 返回已定位到开头的文件
+def write_xlsx_file(rows, columns, sheet_name):
+    export_file = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(export_file, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [header for _, header, _ in columns])
+    row_index = 1
+    for info in rows:
+        worksheet.write_row(row_index, 0, format_row(info, columns))
+        row_index += 1
+    workbook.close()
+    export_file.seek(0)
+    return export_file
+
+
+# 导出响应
+def export_response(rows, columns, file_type, file_name):
+    if file_type == 'csv':
+        response = StreamingHttpResponse(iter_csv_content(rows, columns), content_type=EXPORT_CONTENT_TYPE['csv'])
+    else:
+        export_file = write_xlsx_file(rows, columns, file_name)
+        response = FileResponse(export_file, content_type=EXPORT_CONTENT_TYPE['xlsx'])
+        response['Content-Length'] = os.fstat(export_file.fileno()).st_size
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(file_name, file_type)
+    return response
@@ -0,0 +1,246 @@
+'''
+当天实时考勤状态
+
+每人每天一个 redis 哈希，随打卡事件增量更新:
+    first / last       首次、最近打卡(当天秒数)
+    last_type          最近打卡类型
+    out_open           未结束的外出(出门打卡时间)
+    out_seconds        已完成外出累计秒数
+    pairs              已完成的外出区间 "出门-进门," 列表
+    count              打卡次数
+外出只统计相邻的 出门 -> 进门，与 service.summary_out 规则一致；
+考勤时段内的外出时长由 pairs 按时段筛选得到，迟到、早退、工作时长沿用 attendance_schedule.Schedule.check。
+实时状态按自然日记录，跨零点的班次以当天0点后的打卡计算。
+事件晚于已记录的最近打卡时从数据库重建。
+'''
+import datetime
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import User, AdmitRecord
+from permcontrol.attendance_schedule import compile_schedule, time_to_seconds
+from permcontrol.service import check_out_limit
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 实时状态 date:user_id
+LIVE_STATE_KEY = 'attendance_live:{}:{}'
+# 状态保留时间
+LIVE_STATE_EXPIRE = 2 * 24 * 60 * 60
+
+ADMIT_IN = 0
+ADMIT_OUT = 1
+
+# 追加一次打卡, 打卡早于最近打卡时返回 0 由调用方重建
+LIVE_UPDATE_SCRIPT = """
+local key = KEYS[1]
+local t = tonumber(ARGV[1])
+local kind = tonumber(ARGV[2])
+local last = redis.call('HGET', key, 'last')
+if last and t < tonumber(last) then
+    return 0
+end
+if not last then
+    redis.call('HSET', key, 'first', t)
+end
+if kind == 0 and redis.call('HGET', key, 'last_type') == '1' then
+    local out_open = tonumber(redis.call('HGET', key, 'out_open'))
+    redis.call('HINCRBY', key, 'out_seconds', t - out_open)
+    redis.call('HSET', key, 'pairs', (redis.call('HGET', key, 'pairs') or '') .. out_open .. '-' .. t .. ',')
+end
+if kind == 1 then
+    redis.call('HSET', key, 'out_open', t)
+else
+    redis.call('HDEL', key, 'out_open')
+end
+redis.call('HSET', key, 'last', t, 'last_type', kind)
+redis.call('HINCRBY', key, 'count', 1)
+redis.call('EXPIRE', key, tonumber(ARGV[3]))
+return 1
+"""
+
+
+def live_state_key(day, user_id):
+    return LIVE_STATE_KEY.format(day.strftime('%Y%m%d'), user_id)
+
+
+# 由当天全部打卡生成状态
+def build_live_state(punch_list):
+    # punch_list: [(秒数, 打卡类型), ...] 按时间排序
+    state = {}
+    if not punch_list:
+        return state
+    out_open = None
+    last_type = None
+    out_seconds = 0
+    pairs = []
+    for second, admit_type in punch_list:
+        if admit_type == ADMIT_IN and last_type == ADMIT_OUT:
+            out_seconds += second - out_open
+            pairs.append('{}-{},'.format(out_open, second))
+        out_open = second if admit_type == ADMIT_OUT else None
+        last_type = admit_type
+    state['first'] = punch_list[0][0]
+    state['last'] = punch_list[-1][0]
+    state['last_type'] = last_type
+    state['out_seconds'] = out_seconds
+    state['pairs'] = ''.join(pairs)
+    state['count'] = len(punch_list)
+    if out_open is not None:
+        state['out_open'] = out_open
+    return state
+
+
+# 从数据库重建人员当天状态
+def rebuild_live_state(user, day):
+    punch_list = [(time_to_seconds(record.show_time), record.admit_type)
+                  for record in AdmitRecord.objects.user_day(user, day)]
+    redis_client = RedisClientInstance.get_storage_instance()
+    redis_client.replace_hash_with_expire_time(live_state_key(day, user.id), build_live_state(punch_list),
+                                               LIVE_STATE_EXPIRE)
+
+
+# 从数据库重建当天全部人员状态
+def rebuild_live_day(day):
+    start = datetime.datetime(day.year, day.month, day.day)
+    user_list = list(User.objects.filter(is_delete=0))
+    record_map = AdmitRecord.objects.group_by_user(user_list, start, start + datetime.timedelta(days=1))
+    redis_client = RedisClientInstance.get_storage_instance()
+    # 一次往返写入全部人员, 事务内执行避免与打卡更新交错
+    with redis_client.transaction() as batch:
+        for user_id, admit_record in record_map.items():
+            if not admit_record:
+                continue
+            punch_list = [(time_to_seconds(record.show_time), record.admit_type) for record in admit_record]
+            name = live_state_key(day, user_id)
+            batch.delete(name)
+            batch.hset(name, mapping=build_live_state(punch_list))
+            batch.expire(name, LIVE_STATE_EXPIRE)
+
+
+# 入库后的打卡记录更新实时状态, 只处理当天的记录
+def update_live_states(record_list):
+    today = datetime.date.today()
+    redis_client = RedisClientInstance.get_storage_instance()
+    rebuild_ids = set()
+    for record in record_list:
+        if record.user_id is None or record.show_time.date() != today:
+            continue
+        if record.user_id in rebuild_ids:
+            continue
+        result = redis_client.run_script(LIVE_UPDATE_SCRIPT,
+                                         keys=[live_state_key(today, record.user_id)],
+                                         args=[time_to_seconds(record.show_time), record.admit_type,
+                                               LIVE_STATE_EXPIRE])
+        if not result:
+            rebuild_ids.add(record.user_id)
+    # 乱序到达的打卡, 入库后整体重建
+    for user in User.objects.filter(id__in=rebuild_ids):
+        rebuild_live_state(user, today)
+
+
+def decode_live_state(value):
+    state = {}
+    for name, field_value in value.items():
+        if isinstance(name, bytes):
+            name = name.decode()
+        if isinstance(field_value, bytes):
+            field_value = field_value.decode()
+        state[name] = field_value
+    return state
+
+
+# 批量读取实时状态 {user_id: state}
+def read_live_states(user_ids, day):
+    redis_client = RedisClientInstance.get_storage_instance()
+    value_list = redis_client.multi_get_hash([live_state_key(day, user_id) for user_id in user_ids])
+    return {user_id: decode_live_state(value) for user_id, value in zip(user_ids, value_list)}
+
+
+def seconds_to_datetime(second):
+    # 与 strptime("%H:%M:%S") 的日期一致
+    return datetime.datetime(1900, 1, 1) + datetime.timedelta(seconds=second)
+
+
+# 时段内已完成的外出时长(小时)
+def interval_out_duration(pair_list, interval_start, interval_end):
+    start = min(interval_start, interval_end)
+    end = max(interval_start, interval_end)
+    total_out = 0
+    for out_second, in_second in pair_list:
+        if start <= out_second and in_second <= end:
+            total_out += in_second - out_second
+    return round(total_out / 3600, 2)
+
+
+# 由实时状态计算当天考勤
+def evaluate_live_state(state, time_interval_tuple, out_limit):
+    result = {
+        'first_admit': None,
+        'last_admit': None,
+        'is_out': 0,
+        'out_seconds': 0,
+        'is_late': 0,
+        'is_leave_early': 0,
+        'duty_duration': 0,
+        'out_duration': 0,
+        'is_out_timeout': 0,
+    }
+    if not state or 'first' not in state:
+        return result
+    first = int(state['first'])
+    last = int(state['last'])
+    result['first_admit'] = seconds_to_datetime(first).strftime('%H:%M:%S')
+    result['last_admit'] = seconds_to_datetime(last).strftime('%H:%M:%S')
+    result['is_out'] = 1 if 'out_open' in state else 0
+    result['out_seconds'] = int(state.get('out_seconds', 0))
+
+    attendance_result = compile_schedule(time_interval_tuple).check(first, last)
+    pair_list = []
+    for pair in state.get('pairs', '').split(','):
+        if pair:
+            out_second, in_second = pair.split('-')
+            pair_list.append((int(out_second), int(in_second)))
+    out_duration = 0
+    for interval in attendance_result['interval_list']:
+        out_duration += interval_out_duration(pair_list, interval[0], interval[1])
+    out_duration = round(out_duration, 2)
+    result['is_late'] = attendance_result['is_late']
+    result['is_leave_early'] = attendance_result['is_leave_early']
+    result['duty_duration'] = attendance_result['duty_duration']
+    result['out_duration'] = out_duration
+    result['is_out_timeout'] = check_out_limit(out_duration, out_limit)
+    return result
+
+
+# 从数据库生成实时状态(redis 不可用时使用)
+def load_live_states(user_list, day):
+    start = datetime.datetime(day.year, day.month, day.day)
+    record_map = AdmitRecord.objects.group_by_user(user_list, start, start + datetime.timedelta(days=1))
+    state_map = {}
+    for user_id, admit_record in record_map.items():
+        punch_list = [(time_to_seconds(record.show_time), record.admit_type) for record in admit_record]
+        state_map[user_id] = {name: str(value) for name, value in build_live_state(punch_list).items()}
+    return state_map
+
+
+# 当天实时考勤
+def summary_live_attendance(user_list, time_interval_tuple, out_limit):
+    user_list = list(user_list)
+    today = datetime.date.today()
+    try:
+        state_map = read_live_states([user.id for user in user_list], today)
+    except Exception as e:
+        logger.error("attendance live read error {}".format(e))
+        state_map = load_live_states(user_list, today)
+    data = []
+    for user in user_list:
+        info = {
+            'user_id': user.id,
+            'name': user.display_name,
+            'job_number': user.job_number,
+            'date': today.strftime('%Y-%m-%d'),
+        }
+        info.update(evaluate_live_state(state_map.get(user.id), time_interval_tuple, out_limit))
+        data.append(info)
+    return data
@@ -0,0 +1,192 @@
+'''
+考勤数值计算
+
+打卡时间统一转换为当天秒数(0-86399)，打卡类型使用门禁类型编码(0 进门, 1 出门, 2 抓拍)，
+多个人员-日期的打卡数据按 CSR 方式拼接: times/types 为所有打卡, offsets[i]:offsets[i+1] 为第 i 天的打卡。
+计算结果与 attendance_schedule.Schedule.evaluate 保持一致, 批量计算只支持两个班次且不跨零点的考勤时段,
+其他班次逐天使用 Schedule.evaluate 计算。
+'''
+import datetime
+import numpy as np
+
+from permcontrol.attendance_schedule import compile_schedule, time_to_seconds
+
+import logging
+
+logger = logging.getLogger("django")
+
+DAY_SECONDS = 86400
+
+ADMIT_IN = 0
+ADMIT_OUT = 1
+
+# 秒数 -> round(秒数 / 3600, 2) 查找表, 与python round保持一致
+_HOURS_TABLE = None
+
+
+def hours_table():
+    global _HOURS_TABLE
+    if _HOURS_TABLE is None:
+        # 上午、下午各自取模, 总时长小于2天
+        _HOURS_TABLE = np.array([round(second / 3600, 2) for second in range(2 * DAY_SECONDS)], dtype=np.float64)
+    return _HOURS_TABLE
+
+
+# 秒数转为时间
+def seconds_to_time(value):
+    value = int(value)
+    return datetime.time(value // 3600, value % 3600 // 60, value % 60)
+
+
+class PunchBatch(object):
+    '''
+    多个人员-日期的打卡数据
+    '''
+
+    def __init__(self, times, types, offsets):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.types = np.asarray(types, dtype=np.int8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_record_lists(cls, record_lists):
+        # record_list: [{'admit_type': 0, 'show_time': '09:00:00'}, ...] 按时间排序
+        times = []
+        types = []
+        offsets = [0]
+        for record_list in record_lists:
+            for record in record_list:
+                times.append(time_to_seconds(record['show_time']))
+                types.append(record['admit_type'])
+            offsets.append(len(times))
+        return cls(times, types, offsets)
+
+
+# 批量计算迟到、早退、工作时长、外出时长
+def evaluate_batch(batch: PunchBatch, time_interval_tuple, out_limit):
+    day_count = len(batch)
+    counts = np.diff(batch.offsets)
+    has_record = counts > 0
+    result = {
+        'has_record': has_record,
+        'first_admit': np.zeros(day_count, dtype=np.int64),
+        'last_admit': np.zeros(day_count, dtype=np.int64),
+        'is_late': np.zeros(day_count, dtype=np.int64),
+        'is_leave_early': np.zeros(day_count, dtype=np.int64),
+        'duty_duration': np.zeros(day_count, dtype=np.float64),
+        'out_duration': np.zeros(day_count, dtype=np.float64),
+        'is_out_timeout': np.zeros(day_count, dtype=np.int64),
+    }
+    if out_limit is not None:
+        result['is_out_timeout'] = (result['out_duration'] >= out_limit).astype(np.int64)
+    if not has_record.any():
+        return result
+
+    (morning_start, morning_end), (afternoon_start, afternoon_end) = compile_schedule(time_interval_tuple).shifts
+    times = batch.times
+    types = batch.types
+    day_index = np.flatnonzero(has_record)
+    first = times[batch.offsets[day_index]]
+    last = times[batch.offsets[day_index + 1] - 1]
+    result['first_admit'][day_index] = first
+    result['last_admit'][day_index] = last
+
+    # 打卡区间
+    absent = (first > afternoon_end) | (last < morning_start)
+    morning_only = ~absent & (last >= min(morning_start, afternoon_start)) & (last <= max(morning_start, afternoon_start))
+    afternoon_only = ~absent & ~morning_only & (first >= min(morning_end, afternoon_end)) & (first <= max(morning_end, afternoon_end))
+    full_day = ~absent & ~morning_only & ~afternoon_only
+
+    late_after_start = first > morning_start
+    is_late = np.where(absent, ~(first <= morning_start),
+                       np.where(afternoon_only, True, late_after_start))
+    is_leave_early = np.where(absent | morning_only, True,
+                              last < afternoon_end)
+
+    # 有效区间
+    start_1 = np.where(morning_only | full_day, np.where(late_after_start, first, morning_start),
+                       np.where(first > afternoon_start, first, afternoon_start))
+    end_1 = np.where(morning_only, np.where(last < morning_end, last, morning_end),
+                     np.where(full_day, morning_end, np.where(last < afternoon_end, last, afternoon_end)))
+    start_2 = np.full(len(day_index), afternoon_start, dtype=np.int64)
+    end_2 = np.where(last < afternoon_end, last, afternoon_end)
+
+    # timedelta.seconds 对负数取模
+    duty_seconds = np.where(absent, 0, np.mod(end_1 - start_1, DAY_SECONDS))
+    duty_seconds = duty_seconds + np.where(full_day, np.mod(end_2 - start_2, DAY_SECONDS), 0)
+
+    # 一次完整外出: 区间内相邻两次打卡为 出门 -> 进门
+    pair_seconds = np.zeros(len(times), dtype=np.int64)
+    if len(times) > 1:
+        pair_mask = (types[1:] == ADMIT_IN) & (types[:-1] == ADMIT_OUT)
+        pair_seconds[1:] = np.where(pair_mask, times[1:] - times[:-1], 0)
+    pair_prefix = np.cumsum(pair_seconds)
+    # 按天偏移, 保证 searchsorted 不跨天
+    day_of_punch = np.repeat(np.arange(day_count, dtype=np.int64), np.diff(batch.offsets))
+    sort_key = day_of_punch * (2 * DAY_SECONDS) + times
+
+    table = hours_table()
+
+    def interval_out(mask, interval_start, interval_end):
+        lower = np.minimum(interval_start, interval_end) + day_index * (2 * DAY_SECONDS)
+        upper = np.maximum(interval_start, interval_end) + day_index * (2 * DAY_SECONDS)
+        low = np.searchsorted(sort_key, lower, side='left')
+        high = np.searchsorted(sort_key, upper, side='right')
+        # 区间内第一次打卡不与区间外的打卡配对
+        valid = mask & (high - low >= 2)
+        total = np.where(valid, pair_prefix[np.maximum(high - 1, 0)] - pair_prefix[np.minimum(low, len(times) - 1)], 0)
+        return np.where(mask, table[total], 0.0)
+
+    out_hours = interval_out(~absent, start_1, end_1) + interval_out(full_day, start_2, end_2)
+
+    result['is_late'][day_index] = is_late.astype(np.int64)
+    result['is_leave_early'][day_index] = is_leave_early.astype(np.int64)
+    result['duty_duration'][day_index] = table[duty_seconds]
+    result['out_duration'][day_index] = np.round(out_hours, 2)
+    if out_limit is not None:
+        result['is_out_timeout'] = (result['out_duration'] >= out_limit).astype(np.int64)
+    return result
+
+
+# 逐天计算, 用于多班次、夜班
+def evaluate_schedule_record_lists(record_lists, schedule, out_limit):
+    result_list = []
+    for record_list in record_lists:
+        result = {
+            'has_record': False,
+            'is_late': 0,
+            'is_leave_early': 0,
+            'duty_duration': 0.0,
+            'out_duration': 0.0,
+            'is_out_timeout': 0,
+        }
+        if record_list:
+            day_result = schedule.evaluate(schedule.punches(record_list))
+            result['has_record'] = True
+            result['is_late'] = day_result['is_late']
+            result['is_leave_early'] = day_result['is_leave_early']
+            result['duty_duration'] = day_result['duty_duration']
+            result['out_duration'] = day_result['out_duration']
+        if out_limit is not None:
+            result['is_out_timeout'] = 1 if result['out_duration'] >= out_limit else 0
+        result_list.append(result)
+    return result_list
+
+
+# 批量计算, 返回每天的结果
+def evaluate_record_lists(record_lists, time_interval_tuple, out_limit):
+    schedule = compile_schedule(time_interval_tuple)
+    if not schedule.is_standard:
+        return evaluate_schedule_record_lists(record_lists, schedule, out_limit)
+    result = evaluate_batch(PunchBatch.from_record_lists(record_lists), time_interval_tuple, out_limit)
+    keys = ['has_record', 'is_late', 'is_leave_early', 'duty_duration', 'out_duration', 'is_out_timeout']
+    columns = [result[key].tolist() for key in keys]
+    return [dict(zip(keys, values)) for values in zip(*columns)]
+
+
+# 单日计算
+def evaluate_day(record_list, time_interval_tuple, out_limit):
+    return evaluate_record_lists([record_list], time_interval_tuple, out_limit)[0]
@@ -0,0 +1,195 @@
+'''
+考勤班次
+
+考勤时段 time_interval_tuple 编译为 Schedule, 班次边界预先转换为秒数, 按班次定义缓存, 计算时不再解析字符串。
+支持任意多个班次, 跨零点的班次(夜班)结束时间加一天, 各班次边界依次递增:
+    不跨零点时考勤窗口为当天 [0点, 次日0点)
+    跨零点时窗口起点移到 最后下班 与 次日首次上班 的中点, 早于窗口起点的打卡时间属于次日
+两个班次且不跨零点时, 结果与原 check_summary_attendance / summary_out 一致。
+'''
+import datetime
+from core.framework.v_exception import VException
+
+import logging
+
+logger = logging.getLogger("django")
+
+DAY_SECONDS = 86400
+
+ADMIT_IN = 0
+ADMIT_OUT = 1
+
+# 编译后的班次 {班次定义: Schedule}
+_SCHEDULE_CACHE = {}
+
+
+# 时间字符串转为秒数
+def time_to_seconds(value):
+    if isinstance(value, str):
+        return int(value[0:2]) * 3600 + int(value[3:5]) * 60 + int(value[6:8])
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+# "%H:%M" 转为秒数
+def clock_to_seconds(value):
+    clock = datetime.datetime.strptime(value, "%H:%M")
+    return clock.hour * 3600 + clock.minute * 60
+
+
+class Schedule(object):
+    '''
+    编译后的考勤班次
+
+    shifts 为 [(上班秒数, 下班秒数), ...], 相对考勤日0点, 跨零点的部分大于 DAY_SECONDS
+    '''
+
+    def __init__(self, time_interval_tuple):
+        self.time_interval_tuple = time_interval_tuple
+        shifts = []
+        offset = 0
+        for interval in time_interval_tuple:
+            start = clock_to_seconds(interval[0]) + offset
+            end = clock_to_seconds(interval[1]) + offset
+            if shifts and start < shifts[-1][1]:
+                # 上班时间早于上一班次下班, 属于次日
+                start += DAY_SECONDS
+                end += DAY_SECONDS
+                offset += DAY_SECONDS
+            if end < start:
+                # 跨零点
+                end += DAY_SECONDS
+                offset += DAY_SECONDS
+            shifts.append((start, end))
+        if not shifts:
+            raise VException(500, "获取考勤结果错误")
+        if shifts[-1][1] - shifts[0][0] > DAY_SECONDS:
+            raise VException(500, "考勤时段超过24小时")
+        self.shifts = tuple(shifts)
+        self.start = shifts[0][0]
+        self.end = shifts[-1][1]
+        if self.end <= DAY_SECONDS:
+            self.window_start = 0
+        else:
+            self.window_start = (self.end - DAY_SECONDS + self.start) // 2
+        # 两个班次且不跨零点, 可使用批量计算
+        self.is_standard = len(shifts) == 2 and self.end <= DAY_SECONDS
+        # 规定上班总时长
+        self.total_duty = sum(round((end - start) / 3600, 2) for start, end in shifts)
+
+    # 考勤日的打卡时间区间 [窗口起点, 窗口起点 + 1天)
+    def day_range(self, day):
+        start = datetime.datetime(day.year, day.month, day.day) + datetime.timedelta(seconds=self.window_start)
+        return start, start + datetime.timedelta(days=1)
+
+    # 打卡时间(时间字符串、time、datetime) 转为考勤窗口内的秒数
+    def to_seconds(self, value):
+        second = time_to_seconds(value)
+        if second < self.window_start:
+            second += DAY_SECONDS
+        return second
+
+    # 门禁数据 [{'admit_type', 'show_time'}, ...] 转为 [(秒数, 打卡类型), ...]
+    def punches(self, record_list):
+        return [(self.to_seconds(record['show_time']), record['admit_type']) for record in record_list]
+
+    # 由首次、最后打卡判断迟到、早退, 计算工作时长和有效区间(秒数)
+    def check(self, first, last):
+        result = {
+            'is_late': 0,
+            'is_leave_early': 0,
+            'duty_duration': 0,
+            'interval_list': []
+        }
+        if first is None or last is None or last < first:
+            return result
+
+        shifts = self.shifts
+        if first > self.end or last < self.start:
+            # 签到在下班后 或 签退在上班前, 缺勤
+            result['is_late'] = 0 if first <= self.start else 1
+            result['is_leave_early'] = 1
+            result['duty_duration'] = 0.0
+            return result
+
+        # 首个出勤班次: 签到早于下班
+        first_index = len(shifts) - 1
+        for index, shift in enumerate(shifts):
+            if first < shift[1]:
+                first_index = index
+                break
+        # 最后出勤班次: 签退晚于上班
+        last_index = 0
+        for index in range(len(shifts) - 1, 0, -1):
+            if last > shifts[index][0]:
+                last_index = index
+                break
+        # 打卡都在两个班次之间, 按前一个班次计算
+        first_index = min(first_index, last_index)
+
+        interval_list = []
+        duty_seconds = 0
+        for index in range(first_index, last_index + 1):
+            start, end = shifts[index]
+            if index == first_index and first > start:
+                start = first
+            if index == last_index and last < end:
+                end = last
+            duty_seconds += (end - start) % DAY_SECONDS
+            interval_list.append((start, end))
+
+        result['is_late'] = 1 if first > self.start else 0
+        result['is_leave_early'] = 1 if last_index < len(shifts) - 1 or last < self.end else 0
+        result['duty_duration'] = round(duty_seconds / 3600, 2)
+        result['interval_list'] = interval_list
+        return result
+
+    # 区间内的外出时长(小时): 区间内相邻两次打卡为 出门 -> 进门
+    @staticmethod
+    def interval_out(punches, start, end):
+        lower = min(start, end)
+        upper = max(start, end)
+        total_out = 0
+        out_second = None
+        for second, admit_type in punches:
+            if second < lower:
+                continue
+            if second > upper:
+                break
+            if admit_type == ADMIT_OUT:
+                out_second = second
+                continue
+            if out_second is not None and admit_type == ADMIT_IN:
+                total_out += second - out_second
+            out_second = None
+        return round(total_out / 3600, 2)
+
+    # 计算当天考勤, punches 按时间排序且不为空
+    def evaluate(self, punches):
+        result = self.check(punches[0][0], punches[-1][0])
+        out_duration = 0
+        for start, end in result['interval_list']:
+            out_duration += self.interval_out(punches, start, end)
+        result['out_duration'] = round(out_duration, 2)
+        return result
+
+
+# 获取编译后的班次, 同样的班次定义只编译一次
+def compile_schedule(time_interval_tuple):
+    if isinstance(time_interval_tuple, Schedule):
+        return time_interval_tuple
+    try:
+        cache_key = tuple(tuple(interval[:2]) for interval in time_interval_tuple)
+    except Exception as e:
+        logger.error("获取考勤结果 error {}".format(e))
+        raise VException(500, "获取考勤结果错误")
+    schedule = _SCHEDULE_CACHE.get(cache_key, None)
+    if schedule is None:
+        try:
+            schedule = Schedule(cache_key)
+        except VException:
+            raise
+        except Exception as e:
+            logger.error("获取考勤结果 error {}".format(e))
+            raise VException(500, "获取考勤结果错误")
+        _SCHEDULE_CACHE[cache_key] = schedule
+    return schedule
@@ -0,0 +1,163 @@
+'''
+考勤压测数据生成
+
+固定随机种子，同样的人数生成同样的数据:
+    人员及部门、整月的门禁打卡(上下班高峰集中打卡)、日历编辑记录、考勤配置历史
+'''
+import json
+import random
+import datetime
+from config.config import WOModuleConfig
+from permcontrol.models import Department, User, AdmitRecord, CalendarEditRecord, AttendanceConfig, AttendanceRecord, \
+    AttendanceMonthSummary
+
+# 考勤时段
+TIME_INTERVAL_TUPLE = [["09:00", "12:00"], ["13:30", "18:00"]]
+# 外出限制
+OUT_LIMIT = 1.0
+# 每个部门人数
+DEPARTMENT_SIZE = 20
+
+# 打卡高峰 (时刻(秒), 标准差(秒), 打卡类型)
+PUNCH_PEAKS = [
+    (9 * 3600, 15 * 60, 0),
+    (12 * 3600, 10 * 60, 1),
+    (13 * 3600 + 30 * 60, 10 * 60, 0),
+    (18 * 3600, 20 * 60, 1),
+]
+
+
+# 压测月份: 上个月, 全部为历史日期
+def benchmark_month():
+    today = datetime.date.today()
+    first_day = datetime.date(today.year, today.month, 1)
+    last_month_day = first_day - datetime.timedelta(days=1)
+    return datetime.datetime(last_month_day.year, last_month_day.month, 1)
+
+
+def month_days(month_datetime):
+    day = month_datetime
+    day_list = []
+    while day.month == month_datetime.month:
+        day_list.append(day)
+        day += datetime.timedelta(days=1)
+    return day_list
+
+
+def device_no(admit_type):
+    if admit_type == 0:
+        return WOModuleConfig.in_device_no[0]
+    if admit_type == 1:
+        return WOModuleConfig.out_device_no[0]
+    return 'capture'
+
+
+def generate_users(user_count, rng):
+    department_list = []
+    for index in range((user_count + DEPARTMENT_SIZE - 1) // DEPARTMENT_SIZE):
+        department_list.append(Department(name='部门{}'.format(index)))
+    Department.objects.bulk_create(department_list)
+    department_ids = list(Department.objects.order_by('id').values_list('id', flat=True))
+
+    user_list = []
+    for index in range(user_count):
+        user_list.append(User(name='bench{}'.format(index),
+                              password='',
+                              display_name='员工{}'.format(index),
+                              job_number='{:06d}'.format(index),
+                              department_id=department_ids[index // DEPARTMENT_SIZE],
+                              admit_guid='guid{}'.format(index),
+                              join_date=datetime.date(2020, 1, 1)))
+    User.objects.bulk_create(user_list, batch_size=500)
+    return list(User.objects.order_by('id'))
+
+
+# 单人单日打卡: 高峰打卡 + 白天零散外出
+def generate_day_punches(day, rng):
+    punch_list = []
+    if rng.random() < 0.05:
+        # 缺勤
+        return punch_list
+    for peak, sigma, admit_type in PUNCH_PEAKS:
+        if rng.random() < 0.9:
+            second = int(rng.gauss(peak, sigma))
+            punch_list.append((second, admit_type))
+    for _ in range(rng.randint(0, 3)):
+        # 外出 -> 返回
+        out_second = rng.randint(9 * 3600, 17 * 3600)
+        punch_list.append((out_second, 1))
+        punch_list.append((out_second + rng.randint(60, 5400), 0))
+    if rng.random() < 0.2:
+        punch_list.append((rng.randint(8 * 3600, 19 * 3600), 2))
+    return [(max(0, min(second, 86399)), admit_type) for second, admit_type in punch_list]
+
+
+def generate_admit_records(user_list, day_list, rng):
+    record_list = []
+    total = 0
+    for user in user_list:
+        for day in day_list:
+            for second, admit_type in generate_day_punches(day, rng):
+                record_list.append(AdmitRecord(admit_name=user.display_name[:11],
+                                               admit_guid=user.admit_guid,
+                                               user_id=user.id if rng.random() < 0.7 else None,
+                                               device_number='',
+                                               device_no=device_no(admit_type),
+                                               rec_mode=1,
+                                               file_path='',
+                                               admit_type=admit_type,
+                                               show_time=day + datetime.timedelta(seconds=second)))
+        if len(record_list) >= 5000:
+            AdmitRecord.objects.bulk_create(record_list, batch_size=1000)
+            total += len(record_list)
+            record_list = []
+    AdmitRecord.objects.bulk_create(record_list, batch_size=1000)
+    return total + len(record_list)
+
+
+# 日历编辑: 调休上班的周末、调休放假的工作日, 部分日期多次编辑
+def generate_calendar(day_list, rng):
+    record_list = []
+    for day in day_list:
+        if rng.random() < 0.1:
+            is_holiday = 0 if day.weekday() > 4 else 1
+            record_list.append(CalendarEditRecord(day=day, is_holiday=is_holiday))
+            if rng.random() < 0.3:
+                record_list.append(CalendarEditRecord(day=day, is_holiday=1 - is_holiday))
+    CalendarEditRecord.objects.bulk_create(record_list)
+    return len(record_list)
+
+
+# 考勤配置历史: 当月之前的初始配置 + 月内多次修改
+def generate_config_history(month_datetime, rng):
+    config_list = []
+    change_days = [month_datetime - datetime.timedelta(days=90)]
+    change_days += sorted(month_datetime + datetime.timedelta(days=rng.randint(1, 27)) for _ in range(3))
+    for day in change_days:
+        for name, value in [('time_interval_tuple', json.dumps(TIME_INTERVAL_TUPLE)),
+                            ('out_limit', str(OUT_LIMIT)),
+                            ('exclude_user', '')]:
+            config_list.append(AttendanceConfig(name=name, value=value, date=day, create_user_id=0))
+    AttendanceConfig.objects.bulk_create(config_list)
+    return len(config_list)
+
+
+# 生成全部数据, 返回数据量
+def generate(user_count, seed=0):
+    rng = random.Random(seed)
+    month_datetime = benchmark_month()
+    day_list = month_days(month_datetime)
+    user_list = generate_users(user_count, rng)
+    return {
+        'users': len(user_list),
+        'admit_records': generate_admit_records(user_list, day_list, rng),
+        'calendar_records': generate_calendar(day_list, rng),
+        'config_records': generate_config_history(month_datetime, rng),
+    }
+
+
+# 清空生成的数据
+def clear():
+    for model in [AttendanceMonthSummary, AttendanceRecord, AdmitRecord, CalendarEditRecord, AttendanceConfig, User,
+                  Department]:
+        model.objects.all().delete()
@@ -0,0 +1,94 @@
+'''
+登录压测
+
+多线程并发执行登录校验(UserTokenSerializer, 哈希线程池) 与 token 缓存, 统计吞吐量和耗时分布。
+old_iterations 不为空时用旧的加密参数生成密码, 首次登录会按当前参数重新加密。
+'''
+import time
+import threading
+import datetime
+from django.db import connection
+from core.framework.hashers import make_password, get_hasher
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import User
+from permcontrol.serializers import UserTokenSerializer
+from permcontrol.service import cache_user_expire_token, USER_TOKEN_KEY
+
+# 压测密码
+BENCHMARK_PASSWORD = 'benchmark'
+
+
+def generate_login_users(user_count, old_iterations=None):
+    hasher = get_hasher()
+    if old_iterations:
+        encoded = hasher.encode(BENCHMARK_PASSWORD, hasher.salt(), old_iterations)
+    else:
+        encoded = make_password(BENCHMARK_PASSWORD)
+    user_list = []
+    for index in range(user_count):
+        user_list.append(User(name='login{}'.format(index),
+                              password=encoded,
+                              display_name='登录{}'.format(index),
+                              join_date=datetime.date(2020, 1, 1)))
+    User.objects.bulk_create(user_list, batch_size=500)
+    return list(User.objects.filter(name__startswith='login').order_by('id').values_list('name', flat=True))
+
+
+def percentile(value_list, rate):
+    if not value_list:
+        return 0
+    value_list = sorted(value_list)
+    return value_list[min(len(value_list) - 1, int(len(value_list) * rate))]
+
+
+# 并发登录, 每个线程依次登录分配到的账号 rounds 轮
+def run_login_benchmark(user_count, concurrency, rounds=1, old_iterations=None):
+    account_list = generate_login_users(user_count, old_iterations)
+    cost_list = []
+    token_list = []
+    error_list = []
+    lock = threading.Lock()
+
+    def worker(worker_index):
+        try:
+            for _ in range(rounds):
+                for account in account_list[worker_index::concurrency]:
+                    start_time = time.perf_counter()
+                    serializer = UserTokenSerializer(data={'account': account, 'password': BENCHMARK_PASSWORD})
+                    if not serializer.is_valid():
+                        with lock:
+                            error_list.append(account)
+                        continue
+                    user = serializer.validated_data['user']
+                    token_key = 'benchmark-{}-{}'.format(user.id, worker_index)
+                    cache_user_expire_token(token_key, user.id, datetime.datetime.now())
+                    with lock:
+                        cost_list.append(time.perf_counter() - start_time)
+                        token_list.append(token_key)
+        finally:
+            connection.close()
+
+    start_time = time.perf_counter()
+    thread_list = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    wall_time = time.perf_counter() - start_time
+
+    # 清除压测 token
+    redis_client = RedisClientInstance.get_storage_instance()
+    redis_client.multi_delete([USER_TOKEN_KEY.format(token_key) for token_key in set(token_list)])
+    rehashed = User.objects.filter(name__startswith='login').exclude(
+        password__startswith='{}${}$'.format(get_hasher().algorithm, old_iterations)).count() if old_iterations else 0
+    User.objects.filter(name__startswith='login').delete()
+    return {
+        'logins': len(cost_list),
+        'errors': len(error_list),
+        'wall_time': round(wall_time, 4),
+        'throughput': round(len(cost_list) / wall_time, 2) if wall_time else 0,
+        'avg': round(sum(cost_list) / len(cost_list), 4) if cost_list else 0,
+        'p50': round(percentile(cost_list, 0.5), 4),
+        'p95': round(percentile(cost_list, 0.95), 4),
+        'rehashed': rehashed,
+    }
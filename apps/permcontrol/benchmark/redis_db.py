@@ -0,0 +1,51 @@
+'''
+压测使用独立的 redis 库
+
+压测期间 RedisClientInstance 切换到单独的库(默认 15), 并清空进程内缓存,
+日历/配置/权限版本号、假期位图、token 等只写入该库, 不影响线上进程读取的缓存。
+该库必须为空, 结束后清空并切回业务库。
+'''
+from contextlib import contextmanager
+from django.core.management.base import CommandError
+from config.config import CommonConfig
+from core.utils.redis_client import RedisClient, RedisClientInstance
+from permcontrol.work_calendar import WorkCalendar
+from permcontrol.attendance_config import AttendanceConfigResolver
+from permcontrol.permission_index import PermissionIndexResolver
+from permcontrol.admit_event import AdmitGuidMap
+from permcontrol.service import _PRINCIPAL_LOCAL_CACHE
+
+# 默认压测 redis 库
+BENCHMARK_REDIS_DB = 15
+
+
+# 清空进程内缓存的单例, 下次使用时按当前 redis 重新加载
+def reset_local_instances():
+    for cls in [WorkCalendar, AttendanceConfigResolver, PermissionIndexResolver, AdmitGuidMap]:
+        if hasattr(cls, '_instance'):
+            delattr(cls, '_instance')
+    _PRINCIPAL_LOCAL_CACHE.clear()
+
+
+@contextmanager
+def benchmark_redis(db=BENCHMARK_REDIS_DB):
+    if str(db) == str(CommonConfig.redis_position_db):
+        raise CommandError('压测 redis 库不能与业务库 {} 相同'.format(db))
+    client = RedisClient(host=CommonConfig.redis_host,
+                         port=CommonConfig.redis_port,
+                         password=CommonConfig.redis_password,
+                         db=db)
+    if client.redis_client.dbsize():
+        raise CommandError('压测 redis 库 {} 不为空'.format(db))
+    old_instance = getattr(RedisClientInstance, '_instance', None)
+    RedisClientInstance._instance = client
+    reset_local_instances()
+    try:
+        yield client
+    finally:
+        client.flush_database()
+        if old_instance is None:
+            delattr(RedisClientInstance, '_instance')
+        else:
+            RedisClientInstance._instance = old_instance
+        reset_local_instances()
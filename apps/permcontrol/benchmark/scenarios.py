@@ -0,0 +1,194 @@
+'''
+考勤压测场景
+
+每个场景统计 耗时、查询次数、SQL 总耗时，与基线比较:
+    查询次数超过基线即失败；耗时超过 基线 * (1 + tolerance) 且差值超过 MIN_TIME_DELTA 时失败。
+'''
+import os
+import json
+import time
+import datetime
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.utils.test_tools import query_time
+from permcontrol.models import AttendanceRecord, AttendanceMonthSummary
+from permcontrol.service import check_summary_attendance, summary_out, summary_database_function, read_month_summary, \
+    get_attendance_config, get_attendance_calendar, get_attendance_user_queryset, load_admit_record_map, \
+    get_attendance_day_list
+from permcontrol.work_calendar import WorkCalendar
+from permcontrol.attendance_config import AttendanceConfigResolver
+from permcontrol.benchmark.generator import benchmark_month
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# 耗时比较的最小差值(秒), 避免小数据量下的抖动
+MIN_TIME_DELTA = 0.05
+
+
+# 执行并统计
+def measure(func):
+    with CaptureQueriesContext(connection) as context:
+        start_time = time.perf_counter()
+        func()
+        wall_time = time.perf_counter() - start_time
+    count_info = query_time(context.captured_queries)
+    return {
+        'wall_time': round(wall_time, 4),
+        'queries': count_info['count'],
+        'sql_time': round(count_info['time'], 4),
+    }
+
+
+# 清空进程内缓存, 模拟冷启动
+def reset_cache():
+    WorkCalendar.get_instance().invalidate()
+    AttendanceConfigResolver.get_instance().invalidate()
+
+
+# 压测月份的人员、考勤日、打卡数据
+class BenchmarkContext(object):
+
+    def __init__(self):
+        self.month_datetime = benchmark_month()
+        calendar_data = get_attendance_calendar(self.month_datetime)
+        self.day_list = get_attendance_day_list(calendar_data)
+        # 月中的考勤日
+        self.day = self.day_list[len(self.day_list) // 2]
+        attendance_config = get_attendance_config(self.day)
+        self.time_interval_tuple = attendance_config['time_interval_tuple']
+        self.out_limit = attendance_config['out_limit']
+        self.user_list = list(get_attendance_user_queryset(self.day, attendance_config['exclude_user']))
+        # [(record_list, first_admit, last_admit)]
+        self.day_records = []
+        end_datetime = self.day_list[-1] + datetime.timedelta(days=1)
+        record_map = load_admit_record_map(self.user_list, self.day_list[0], end_datetime)
+        for day_map in record_map.values():
+            for record_list in day_map.values():
+                first_admit = datetime.datetime.strptime(record_list[0]['show_time'], '%H:%M:%S')
+                last_admit = datetime.datetime.strptime(record_list[-1]['show_time'], '%H:%M:%S')
+                self.day_records.append((record_list, first_admit, last_admit))
+
+
+def scenario_check_summary_attendance(context):
+    def run():
+        for record_list, first_admit, last_admit in context.day_records:
+            check_summary_attendance(first_admit, last_admit, context.time_interval_tuple)
+    return run
+
+
+def scenario_summary_out(context):
+    interval_records = []
+    for record_list, first_admit, last_admit in context.day_records:
+        result = check_summary_attendance(first_admit, last_admit, context.time_interval_tuple)
+        for interval in result['interval_list']:
+            interval_records.append((record_list, interval))
+
+    def run():
+        for record_list, interval in interval_records:
+            summary_out(record_list, interval[0], interval[1])
+    return run
+
+
+# 单日统计, 首次计算并生成原始记录
+def scenario_summary_database_function_cold(context):
+    AttendanceRecord.objects.filter(date=context.day).delete()
+    reset_cache()
+
+    def run():
+        for user in context.user_list:
+            summary_database_function(user, context.day, context.time_interval_tuple, context.out_limit)
+    return run
+
+
+# 单日统计, 已有原始记录
+def scenario_summary_database_function_warm(context):
+    def run():
+        for user in context.user_list:
+            summary_database_function(user, context.day, context.time_interval_tuple, context.out_limit)
+    return run
+
+
+def month_summary(context):
+    # 与 AttendanceView.month_summary 一致
+    calendar_data = get_attendance_calendar(context.month_datetime)
+    attendance_config = get_attendance_config(context.month_datetime)
+    user_queryset = get_attendance_user_queryset(context.month_datetime, attendance_config['exclude_user'])
+    read_month_summary(user_queryset, context.month_datetime, calendar_data,
+                       attendance_config['time_interval_tuple'], attendance_config['out_limit'])
+
+
+# 月度统计, 没有汇总和原始记录
+def scenario_month_summary_cold(context):
+    AttendanceMonthSummary.objects.all().delete()
+    AttendanceRecord.objects.all().delete()
+    reset_cache()
+    return lambda: month_summary(context)
+
+
+# 月度统计, 已有汇总
+def scenario_month_summary_warm(context):
+    return lambda: month_summary(context)
+
+
+SCENARIOS = [
+    ('check_summary_attendance', scenario_check_summary_attendance),
+    ('summary_out', scenario_summary_out),
+    ('summary_database_function_cold', scenario_summary_database_function_cold),
+    ('summary_database_function_warm', scenario_summary_database_function_warm),
+    ('month_summary_cold', scenario_month_summary_cold),
+    ('month_summary_warm', scenario_month_summary_warm),
+]
+
+
+# 执行全部场景
+def run_scenarios(user_count):
+    context = BenchmarkContext()
+    results = []
+    for name, scenario in SCENARIOS:
+        result = measure(scenario(context))
+        result['scenario'] = name
+        result['users'] = user_count
+        results.append(result)
+    return results
+
+
+def result_key(result):
+    return '{}:{}'.format(result['scenario'], result['users'])
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# 保存当前数据库类型的基线
+def save_baseline(results, vendor, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    vendor_baseline = baseline.setdefault(vendor, {})
+    for result in results:
+        vendor_baseline[result_key(result)] = {
+            'wall_time': result['wall_time'],
+            'queries': result['queries'],
+            'sql_time': result['sql_time'],
+        }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+# 与基线比较, 返回超出基线的说明
+def compare_baseline(results, vendor_baseline, tolerance):
+    failures = []
+    for result in results:
+        base = vendor_baseline.get(result_key(result), None)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            failures.append('{} 查询次数 {} > 基线 {}'.format(result_key(result), result['queries'], base['queries']))
+        for field in ['sql_time', 'wall_time']:
+            limit = base[field] * (1 + tolerance)
+            if result[field] > limit and result[field] - base[field] > MIN_TIME_DELTA:
+                failures.append('{} {} {:.4f}s > 基线 {:.4f}s'.format(result_key(result), field, result[field],
+                                                                      base[field]))
+    return failures
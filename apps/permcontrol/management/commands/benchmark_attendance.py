@@ -0,0 +1,64 @@
+import traceback
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from permcontrol.benchmark.redis_db import benchmark_redis, BENCHMARK_REDIS_DB
+from permcontrol.benchmark import generator
+from permcontrol.benchmark.scenarios import run_scenarios, load_baseline, save_baseline, compare_baseline, \
+    result_key, BASELINE_PATH
+
+
+class Command(BaseCommand):
+    help = '考勤性能压测，在临时测试库中生成数据并与基线比较'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', dest='users', default='50,200', help='人数，多个用逗号分隔')
+        parser.add_argument('--seed', dest='seed', type=int, default=0, help='随机种子')
+        parser.add_argument('--tolerance', dest='tolerance', type=float, default=1.0,
+                            help='耗时允许超出基线的比例')
+        parser.add_argument('--baseline', dest='baseline', default=BASELINE_PATH, help='基线文件')
+        parser.add_argument('--update-baseline', dest='update_baseline', action='store_true', help='以本次结果更新基线')
+        parser.add_argument('--redis-db', dest='redis_db', type=int, default=BENCHMARK_REDIS_DB,
+                            help='压测使用的 redis 库，必须为空，结束后清空')
+
+    def handle(self, *args, **options):
+        try:
+            user_counts = [int(value) for value in options['users'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('人数格式错误')
+
+        # 使用临时测试库(mysql 为 test_ 前缀库, sqlite 为内存库)和单独的 redis 库, 不影响业务数据和缓存
+        with benchmark_redis(options['redis_db']):
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            vendor = connection.vendor
+            results = []
+            try:
+                for user_count in user_counts:
+                    data_info = generator.generate(user_count, options['seed'])
+                    self.stdout.write('数据: {}'.format(data_info))
+                    for result in run_scenarios(user_count):
+                        results.append(result)
+                        self.stdout.write('{:<40} 耗时 {:>8.4f}s  查询 {:>6}  SQL {:>8.4f}s'.format(
+                            result_key(result), result['wall_time'], result['queries'], result['sql_time']))
+                    generator.clear()
+            except:
+                self.stdout.write(traceback.format_exc())
+                raise CommandError('压测执行出错')
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['update_baseline']:
+            save_baseline(results, vendor, options['baseline'])
+            self.stdout.write(self.style.SUCCESS('已更新基线 {} ({})'.format(options['baseline'], vendor)))
+            return
+
+        vendor_baseline = load_baseline(options['baseline']).get(vendor, {})
+        if not vendor_baseline:
+            self.stdout.write(self.style.WARNING('没有 {} 的基线，可使用 --update-baseline 生成'.format(vendor)))
+            return
+        failures = compare_baseline(results, vendor_baseline, options['tolerance'])
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(failure))
+            raise CommandError('性能低于基线')
+        self.stdout.write(self.style.SUCCESS('性能符合基线'))
@@ -0,0 +1,43 @@
+import traceback
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from permcontrol.benchmark.redis_db import benchmark_redis, BENCHMARK_REDIS_DB
+from permcontrol.benchmark.login import run_login_benchmark
+
+
+class Command(BaseCommand):
+    help = '登录性能压测，在临时测试库中生成账号并发登录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', dest='users', type=int, default=50, help='账号数')
+        parser.add_argument('--concurrency', dest='concurrency', default='1,4,16', help='并发数，多个用逗号分隔')
+        parser.add_argument('--rounds', dest='rounds', type=int, default=1, help='每个账号登录轮数')
+        parser.add_argument('--old-iterations', dest='old_iterations', type=int, default=None,
+                            help='以旧的迭代次数生成密码，统计登录时重新加密')
+        parser.add_argument('--redis-db', dest='redis_db', type=int, default=BENCHMARK_REDIS_DB,
+                            help='压测使用的 redis 库，必须为空，结束后清空')
+
+    def handle(self, *args, **options):
+        try:
+            concurrency_list = [int(value) for value in options['concurrency'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('并发数格式错误')
+
+        # 使用临时测试库和单独的 redis 库, 不影响业务数据和缓存
+        with benchmark_redis(options['redis_db']):
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                for concurrency in concurrency_list:
+                    result = run_login_benchmark(options['users'], concurrency, options['rounds'],
+                                                 options['old_iterations'])
+                    self.stdout.write('并发 {:>4}  登录 {:>6}  失败 {:>4}  耗时 {:>8.4f}s  吞吐 {:>8.2f}/s  '
+                                      '平均 {:.4f}s  p50 {:.4f}s  p95 {:.4f}s  重新加密 {}'.format(
+                                          concurrency, result['logins'], result['errors'], result['wall_time'],
+                                          result['throughput'], result['avg'], result['p50'], result['p95'],
+                                          result['rehashed']))
+            except:
+                self.stdout.write(traceback.format_exc())
+                raise CommandError('压测执行出错')
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import datetime
+import traceback
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from permcontrol.service import generate_origin_database, get_attendance_config, get_attendance_calendar, \
+    get_attendance_user_queryset, invalidate_attendance_record
+
+
+# 子进程使用独立的数据库连接
+def init_worker():
+    connections.close_all()
+
+
+# 生成单日考勤记录
+def build_day(day_str):
+    day = datetime.datetime.strptime(day_str, "%Y-%m-%d")
+    attendance_config = get_attendance_config(day)
+    time_interval_tuple = attendance_config['time_interval_tuple']
+    out_limit = attendance_config['out_limit']
+    exclude_user = attendance_config['exclude_user']
+    count = 0
+    with transaction.atomic():
+        for user in get_attendance_user_queryset(day, exclude_user).iterator():
+            generate_origin_database(user, day, time_interval_tuple, out_limit)
+            count += 1
+        invalidate_attendance_record()
+    return day_str, count
+
+
+class Command(BaseCommand):
+    help = '离线生成考勤统计记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', required=True, help='开始日期(Y-m-d)')
+        parser.add_argument('--to', dest='to_date', required=True, help='结束日期(Y-m-d)，包含当天')
+        parser.add_argument('--processes', dest='processes', type=int, default=os.cpu_count() or 1, help='进程数')
+        parser.add_argument('--checkpoint', dest='checkpoint',
+                            default=os.path.join(settings.BASE_DIR, 'logs', 'build_attendance.checkpoint'),
+                            help='断点文件')
+        parser.add_argument('--reset', dest='reset', action='store_true', help='忽略断点重新生成')
+
+    def handle(self, *args, **options):
+        try:
+            from_date = datetime.datetime.strptime(options['from_date'], "%Y-%m-%d")
+            to_date = datetime.datetime.strptime(options['to_date'], "%Y-%m-%d")
+        except ValueError:
+            raise CommandError('日期格式错误')
+        # 不生成今天及以后的统计
+        time_now = datetime.datetime.now()
+        today_datetime = datetime.datetime(time_now.year, time_now.month, time_now.day)
+        to_date = min(to_date, today_datetime - datetime.timedelta(days=1))
+        if from_date > to_date:
+            raise CommandError('没有需要生成的日期')
+
+        checkpoint = options['checkpoint']
+        done_days = set()
+        if not options['reset'] and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as f:
+                done_days = set(json.load(f).get('done', []))
+
+        try:
+            # 考勤日（跳过假期）
+            day_list = []
+            calendar_month = None
+            holiday_map = {}
+            day = from_date
+            while day <= to_date:
+                if calendar_month != (day.year, day.month):
+                    calendar_month = (day.year, day.month)
+                    for info in get_attendance_calendar(day):
+                        holiday_map[info['day']] = info['is_holiday']
+                day_str = day.strftime("%Y-%m-%d")
+                if holiday_map.get(day_str) == 0 and day_str not in done_days:
+                    day_list.append(day_str)
+                day += datetime.timedelta(days=1)
+            if not day_list:
+                self.stdout.write(self.style.SUCCESS('已全部生成'))
+                return
+
+            # fork前关闭连接，避免子进程共用
+            connections.close_all()
+            processes = max(1, min(options['processes'], len(day_list)))
+            total = 0
+            start_time = time.time()
+            with multiprocessing.Pool(processes=processes, initializer=init_worker) as pool:
+                for day_str, count in pool.imap_unordered(build_day, day_list):
+                    total += count
+                    done_days.add(day_str)
+                    # 记录断点
+                    os.makedirs(os.path.dirname(checkpoint) or '.', exist_ok=True)
+                    with open(checkpoint, 'w') as f:
+                        json.dump({'done': sorted(done_days)}, f)
+                    elapsed = time.time() - start_time
+                    self.stdout.write('{} 生成 {} 条, 累计 {} 条, {:.1f} rows/s'.format(
+                        day_str, count, total, total / elapsed if elapsed else 0))
+
+            elapsed = time.time() - start_time
+            self.stdout.write(self.style.SUCCESS('生成完成, {} 天, {} 条, 耗时 {:.1f}s, {:.1f} rows/s'.format(
+                len(day_list), total, elapsed, total / elapsed if elapsed else 0)))
+        except:
+            self.stdout.write(traceback.format_exc())
+
+            self.stdout.write(self.style.ERROR('命令执行出错'))
@@ -0,0 +1,52 @@
+import time
+import datetime
+import signal
+import traceback
+from django.core.management.base import BaseCommand
+from core.framework.v_exception import KException
+from permcontrol.admit_event import AdmitEventConsumer
+from permcontrol.attendance_live import rebuild_live_day
+
+
+class Command(BaseCommand):
+    help = '消费门禁打卡事件队列'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', dest='consumer', default=None, help='消费者名称，默认主机名, 重启后需保持不变')
+        parser.add_argument('--batch', dest='batch', type=int, default=500, help='每批读取条数')
+        parser.add_argument('--block', dest='block', type=int, default=2000, help='无消息时阻塞等待(毫秒)')
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true', help='启动时从数据库重建当天实时状态')
+
+    def handle(self, *args, **options):
+        consumer = None
+        stopped = []
+
+        def stop(*args):
+            stopped.append(True)
+            if consumer:
+                consumer.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        def report(message_count, record_count):
+            self.stdout.write('处理 {} 条消息, 入库 {} 条'.format(message_count, record_count))
+
+        if options['rebuild']:
+            rebuild_live_day(datetime.date.today())
+            self.stdout.write('已重建当天实时状态')
+
+        while not stopped:
+            try:
+                consumer = AdmitEventConsumer(consumer=options['consumer'], batch_size=options['batch'],
+                                              block=options['block'])
+                consumer.run(report)
+            except KException:
+                # redis 不可用, 稍后重连
+                self.stdout.write(self.style.ERROR('redis 连接失败, 稍后重试'))
+                time.sleep(5)
+            except:
+                self.stdout.write(traceback.format_exc())
+                self.stdout.write(self.style.ERROR('命令执行出错'))
+                time.sleep(5)
+        self.stdout.write(self.style.SUCCESS('已停止'))
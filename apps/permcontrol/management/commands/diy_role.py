@@ -1,6 +1,7 @@
 import traceback
 from django.core.management.base import BaseCommand
 from permcontrol.models import User, PermissionGroup, Role
+from permcontrol.service import invalidate_permission_index, invalidate_role_permission
 from core.framework.hashers import make_password
 
 class Command(BaseCommand):
@@ -14,6 +15,8 @@ class Command(BaseCommand):
 
             role = Role.objects.filter(id=1).first()
             role.permission.add(*per_list)
+            invalidate_permission_index()
+            invalidate_role_permission(role.id)
 
             self.stdout.write(self.style.SUCCESS('更新权限成功， 权限：{}'.format(per_list)))
         except:
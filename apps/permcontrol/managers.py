@@ -0,0 +1,77 @@
+import datetime
+from django.db import models
+
+
+# 按天的时间区间 [当天0点, 次日0点)
+def day_range(day):
+    start = datetime.datetime(day.year, day.month, day.day)
+    return start, start + datetime.timedelta(days=1)
+
+
+# 按月的时间区间 [当月1日0点, 次月1日0点)
+def month_range(day):
+    start = datetime.datetime(day.year, day.month, 1)
+    if day.month == 12:
+        end = datetime.datetime(day.year + 1, 1, 1)
+    else:
+        end = datetime.datetime(day.year, day.month + 1, 1)
+    return start, end
+
+
+'''
+门禁打卡记录查询
+show_time 使用半开区间，OR 条件拆分为 UNION，分别走 (user_id, show_time)、(admit_guid, show_time) 索引
+'''
+class AdmitRecordManager(models.Manager):
+
+    # 人员时间区间内的打卡记录
+    def user_range(self, user, start, end):
+        queryset = self.filter(user_id=user.id,
+                               show_time__gte=start,
+                               show_time__lt=end)
+        if user.admit_guid:
+            guid_queryset = self.filter(admit_guid=user.admit_guid,
+                                        show_time__gte=start,
+                                        show_time__lt=end)
+            queryset = queryset.union(guid_queryset)
+        return queryset.order_by('show_time', 'id')
+
+    # 人员当天打卡记录
+    def user_day(self, user, day):
+        start, end = day_range(day)
+        return self.user_range(user, start, end)
+
+    # 人员当月打卡记录
+    def user_month(self, user, day):
+        start, end = month_range(day)
+        return self.user_range(user, start, end)
+
+    # 多人时间区间内的打卡记录, 按人员分组 {user_id: [record, ...]}
+    def group_by_user(self, user_list, start, end):
+        record_map = {}
+        user_ids = set()
+        guid_map = {}
+        for user in user_list:
+            record_map[user.id] = []
+            user_ids.add(user.id)
+            if user.admit_guid:
+                guid_map.setdefault(user.admit_guid, []).append(user.id)
+        if not user_ids:
+            return record_map
+
+        queryset = self.filter(user_id__in=user_ids,
+                               show_time__gte=start,
+                               show_time__lt=end)
+        if guid_map:
+            guid_queryset = self.filter(admit_guid__in=list(guid_map.keys()),
+                                        show_time__gte=start,
+                                        show_time__lt=end)
+            queryset = queryset.union(guid_queryset)
+        for record in queryset.order_by('show_time', 'id'):
+            # 同一条记录可能同时命中 user_id 和 admit_guid
+            target_ids = set(guid_map.get(record.admit_guid, []))
+            if record.user_id in user_ids:
+                target_ids.add(record.user_id)
+            for user_id in target_ids:
+                record_map[user_id].append(record)
+        return record_map
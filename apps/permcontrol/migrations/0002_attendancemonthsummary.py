@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permcontrol', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceMonthSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(verbose_name='用户id')),
+                ('month', models.DateField(verbose_name='月份')),
+                ('summary_date', models.DateField(null=True, verbose_name='已汇总至日期')),
+                ('duty_days', models.IntegerField(default=0, verbose_name='出勤天数')),
+                ('late_days', models.IntegerField(default=0, verbose_name='迟到天数')),
+                ('leave_early_days', models.IntegerField(default=0, verbose_name='早退天数')),
+                ('out_timeout_days', models.IntegerField(default=0, verbose_name='外出过长天数')),
+                ('abnormal_days', models.IntegerField(default=0, verbose_name='异常天数')),
+                ('duty_duration_hours', models.FloatField(default=0, verbose_name='出勤时长')),
+                ('out_duration_hours', models.FloatField(default=0, verbose_name='外出时长')),
+                ('created_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '月度考勤汇总',
+                'verbose_name_plural': '月度考勤汇总',
+                'db_table': 'attendance_month_summary',
+                'unique_together': {('user_id', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permcontrol', '0002_attendancemonthsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='admitrecord',
+            index=models.Index(fields=['user_id', 'show_time'], name='admit_record_user_time'),
+        ),
+        migrations.AddIndex(
+            model_name='admitrecord',
+            index=models.Index(fields=['admit_guid', 'show_time'], name='admit_record_guid_time'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from common.component import StandardModel
+from permcontrol.managers import AdmitRecordManager
 
 # 部门表
 class Department(StandardModel):
@@ -123,10 +124,16 @@ class AdmitRecord(models.Model):
     admit_type = models.IntegerField(choices=((0, '进门'), (1, '出门'), (2, '抓拍')), verbose_name="打卡类型")
     show_time = models.DateTimeField(verbose_name="识别时间")
 
+    objects = AdmitRecordManager()
+
     class Meta:
         verbose_name = '门禁考勤记录'
         verbose_name_plural = verbose_name
         db_table = 'admit_record'
+        indexes = [
+            models.Index(fields=['user_id', 'show_time'], name='admit_record_user_time'),
+            models.Index(fields=['admit_guid', 'show_time'], name='admit_record_guid_time'),
+        ]
 
 
 
@@ -189,3 +196,25 @@ class AttendanceConfig(models.Model):
         verbose_name_plural = verbose_name
         db_table = 'attendance_config'
 
+
+
+# 月度考勤汇总
+class AttendanceMonthSummary(models.Model):
+    user_id = models.IntegerField(verbose_name="用户id")
+    month = models.DateField(verbose_name="月份")
+    summary_date = models.DateField(null=True, verbose_name="已汇总至日期")
+    duty_days = models.IntegerField(default=0, verbose_name="出勤天数")
+    late_days = models.IntegerField(default=0, verbose_name="迟到天数")
+    leave_early_days = models.IntegerField(default=0, verbose_name="早退天数")
+    out_timeout_days = models.IntegerField(default=0, verbose_name="外出过长天数")
+    abnormal_days = models.IntegerField(default=0, verbose_name="异常天数")
+    duty_duration_hours = models.FloatField(default=0, verbose_name="出勤时长")
+    out_duration_hours = models.FloatField(default=0, verbose_name="外出时长")
+    created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '月度考勤汇总'
+        verbose_name_plural = verbose_name
+        db_table = 'attendance_month_summary'
+        unique_together = (('user_id', 'month'),)
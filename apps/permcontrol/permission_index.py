@@ -0,0 +1,240 @@
+'''
+权限索引
+
+权限按 PermissionGroup.id 编为整数位, 每个角色的权限为位掩码, 每个权限路由对应一个位掩码:
+    角色有权限  <=>  角色掩码 & 路由掩码 != 0
+同时预先计算每个路由所需的角色名称, 无权限时不再查询数据库。
+权限树沿 parent_id 预先计算每个权限到根节点的路径(自身及全部上级), 批量查询上级、输出嵌套树时不再逐级查询。
+索引快照按版本号保存在 redis 中供各进程共享, 角色、权限变更后递增版本号, 首个读取新版本的进程从数据库重建快照。
+'''
+import time
+import json
+import threading
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import Role, PermissionGroup
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 索引版本
+PERMISSION_VERSION_KEY = 'permission_index:version'
+# 索引快照 version
+PERMISSION_SNAPSHOT_KEY = 'permission_index:snapshot:{}'
+# 快照缓存时间
+PERMISSION_SNAPSHOT_EXPIRE = 24 * 60 * 60
+# 本地校验版本号间隔(秒)
+VERSION_CHECK_INTERVAL = 5
+# 权限树节点字段
+TREE_FIELDS = ('id', 'name', 'parent_id', 'action', 'type')
+
+
+class PermissionIndex(object):
+    '''
+    permission_list: [[id, parent_id, action, name, type], ...]
+    role_list: [[role_id, name, [permission_id, ...]], ...]
+    '''
+
+    def __init__(self, permission_list, role_list):
+        self.permission_list = permission_list
+        self.role_list = role_list
+        # 权限 id -> 到根节点的路径 (自身, 父级, ..., 根), 上级不存在时为 None
+        parent_map = {item[0]: item[1] for item in permission_list}
+        self.path_map = {}
+        for permission_id in parent_map:
+            self.path_map[permission_id] = self.build_path(permission_id, parent_map)
+        # 父级 id -> 下级权限, 按 id 排序
+        self.children_map = {}
+        for item in permission_list:
+            self.children_map.setdefault(item[1] or None, []).append(item)
+        # 路由 -> 位掩码
+        self.action_masks = {}
+        for permission_id, parent_id, action, name, type in permission_list:
+            if action:
+                self.action_masks[action] = self.action_masks.get(action, 0) | (1 << permission_id)
+        # 角色 -> 位掩码
+        self.role_masks = {}
+        for role_id, name, permission_ids in role_list:
+            mask = 0
+            for permission_id in permission_ids:
+                mask |= 1 << permission_id
+            self.role_masks[role_id] = mask
+        # 路由 -> 所需角色名称
+        self.action_roles = {}
+        for action, action_mask in self.action_masks.items():
+            self.action_roles[action] = sorted(set(name for role_id, name, permission_ids in role_list
+                                                   if self.role_masks[role_id] & action_mask))
+
+    # 沿 parent_id 查找全部上级, 上级不存在或成环时返回 None
+    @staticmethod
+    def build_path(permission_id, parent_map):
+        path = []
+        current_id = permission_id
+        while current_id:
+            if current_id not in parent_map or current_id in path:
+                return None
+            path.append(current_id)
+            current_id = parent_map[current_id]
+        return tuple(path)
+
+    @classmethod
+    def from_database(cls):
+        permission_list = [list(item) for item in PermissionGroup.objects.order_by('id').values_list(
+            'id', 'parent_id', 'action', 'name', 'type')]
+        role_map = {}
+        for role_id, name in Role.objects.filter(is_delete=0).order_by('id').values_list('id', 'name'):
+            role_map[role_id] = [role_id, name, []]
+        through_queryset = Role.permission.through.objects.filter(role_id__in=list(role_map)).values_list(
+            'role_id', 'permissiongroup_id')
+        for role_id, permission_id in through_queryset:
+            role_map[role_id][2].append(permission_id)
+        return cls(permission_list, list(role_map.values()))
+
+    def dump(self):
+        return json.dumps({'permission_list': self.permission_list, 'role_list': self.role_list})
+
+    @classmethod
+    def load(cls, snapshot):
+        data = json.loads(snapshot)
+        return cls(data['permission_list'], data['role_list'])
+
+    def has_permission(self, role_id, action):
+        return bool(self.role_masks.get(role_id, 0) & self.action_masks.get(action, 0))
+
+    def get_roles(self, action):
+        return list(self.action_roles.get(action, []))
+
+    # 权限及其全部上级, 权限不存在时返回 None
+    def get_path(self, permission_id):
+        return self.path_map.get(permission_id, None)
+
+    # 嵌套权限树, parent_id 为空或 0 时从根节点开始
+    # permission_type 不为空时只保留该类型的节点, 节点挂在最近的同类型上级下, 没有时提升到顶层
+    # ordering 为同级节点的排序字段, 如 ['-type', 'id']
+    def get_tree(self, parent_id=None, permission_type=None, ordering=None):
+        tree = self.build_tree(parent_id or None, permission_type)
+        if ordering:
+            self.sort_tree(tree, ordering)
+        return tree
+
+    def build_tree(self, parent_id, permission_type):
+        tree = []
+        for permission_id, item_parent_id, action, name, item_type in self.children_map.get(parent_id, []):
+            # 上级成环的节点
+            if self.path_map[permission_id] is None:
+                continue
+            children = self.build_tree(permission_id, permission_type)
+            if permission_type is not None and item_type != permission_type:
+                tree.extend(children)
+                continue
+            tree.append({
+                'id': permission_id,
+                'name': name,
+                'parent_id': item_parent_id,
+                'action': action,
+                'type': item_type,
+                'children': children,
+            })
+        return tree
+
+    @classmethod
+    def sort_tree(cls, tree, ordering):
+        # 依次按次级到首要字段稳定排序
+        for field in reversed(ordering):
+            name = field.lstrip('-')
+            if name not in TREE_FIELDS:
+                continue
+            tree.sort(key=lambda node: (node[name] is not None, node[name] if node[name] is not None else 0),
+                      reverse=field.startswith('-'))
+        for node in tree:
+            cls.sort_tree(node['children'], ordering)
+
+
+class PermissionIndexResolver(object):
+    # 线程锁
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.version = None
+        self.checked_time = 0
+        self.index = None
+
+    @classmethod
+    def get_instance(cls):
+        if not hasattr(PermissionIndexResolver, '_instance'):
+            with PermissionIndexResolver._instance_lock:
+                if not hasattr(PermissionIndexResolver, '_instance'):
+                    PermissionIndexResolver._instance = PermissionIndexResolver()
+        return PermissionIndexResolver._instance
+
+    # 校验版本号, 版本变化则清空本地缓存
+    def check_version(self):
+        now = time.time()
+        if self.version is not None and now - self.checked_time < VERSION_CHECK_INTERVAL:
+            return self.version
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            value = redis_client.get_by_name(PERMISSION_VERSION_KEY)
+            version = int(value) if value else 0
+        except Exception as e:
+            logger.error("permission index version error {}".format(e))
+            # redis 不可用时不使用本地缓存
+            self.version = None
+            self.index = None
+            return None
+        if version != self.version:
+            self.index = None
+            self.version = version
+        self.checked_time = now
+        return version
+
+    # 读取该版本的快照, 不存在时从数据库重建并保存
+    def load_index(self, version):
+        if version is None:
+            return PermissionIndex.from_database()
+        cache_key = PERMISSION_SNAPSHOT_KEY.format(version)
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            snapshot = redis_client.get_by_name(cache_key)
+            if snapshot:
+                return PermissionIndex.load(snapshot)
+        except Exception as e:
+            logger.error("permission index snapshot read error {}".format(e))
+        index = PermissionIndex.from_database()
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.single_set_string_with_expire_time(cache_key, 'second', PERMISSION_SNAPSHOT_EXPIRE,
+                                                            index.dump())
+        except Exception as e:
+            logger.error("permission index snapshot write error {}".format(e))
+        return index
+
+    def get_index(self):
+        version = self.check_version()
+        index = self.index
+        if index is None:
+            index = self.load_index(version)
+            if version is not None:
+                self.index = index
+        return index
+
+    # 角色、权限变更, 递增版本号
+    def invalidate(self):
+        self.index = None
+        self.version = None
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.increase_by(PERMISSION_VERSION_KEY)
+        except Exception as e:
+            logger.error("permission index invalidate error {}".format(e))
+
+
+# 权限表变更后刷新索引, 事务提交后递增版本号
+def invalidate_permission_group(sender, **kwargs):
+    transaction.on_commit(PermissionIndexResolver.get_instance().invalidate)
+
+
+post_save.connect(invalidate_permission_group, sender=PermissionGroup, dispatch_uid='permission_index_save')
+post_delete.connect(invalidate_permission_group, sender=PermissionGroup, dispatch_uid='permission_index_delete')
@@ -5,11 +5,11 @@ from collections import OrderedDict
 
 from rest_framework import serializers
 from core.utils.functions import filter_space
-from core.framework.hashers import check_password
+from core.framework.hashers import check_password_pooled
 from core.utils.functions import match_mobile, match_email
 from core.framework.v_exception import VException
 from permcontrol.models import User, PermissionGroup, Role, Department, AttendanceConfig, CalendarEditRecord, AttendanceRecord, PersonnelRecord
-from permcontrol.service import get_full_tree_permission
+from permcontrol.service import get_permission_ancestors
 from common.component import StandardSerializer
 
 
@@ -33,8 +33,12 @@ class UserTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError("账号未注册", code='authorization')
         if user.status == 0:
             raise serializers.ValidationError("该账号已被注销", code='authorization')
-        # 密码校验
-        pwd_valid = check_password(password, user.password)
+        # 密码校验(哈希线程池), 加密参数变化时用新参数重新加密保存
+        def update_password(encoded):
+            user.password = encoded
+            user.save(update_fields=['password'])
+
+        pwd_valid = check_password_pooled(password, user.password, update_password)
         if not pwd_valid:
             raise serializers.ValidationError("密码不正确", code='authorization')
         attrs['user'] = user
@@ -92,18 +96,10 @@ class RoleSerializer(serializers.ModelSerializer):
 
 
     def validate_permission(self, attrs):
-        permission_list = []
-        for permission_id in attrs:
-            if not permission_id:
-                continue
-            if permission_id in permission_list:
-                continue
-            child_list = get_full_tree_permission(permission_id)
-            if child_list:
-                permission_list += child_list
-        # 去重
-        permission_list = list(set(permission_list))
-        return permission_list
+        if not attrs:
+            return []
+        # 所选权限及其全部父级, 已去重
+        return get_permission_ancestors([permission_id for permission_id in attrs if permission_id])
 
 
 
@@ -371,6 +367,18 @@ class UserQuitSerializer(serializers.Serializer):
 
 
 
+# 批量注销登录
+class RevokeTokenSerializer(serializers.Serializer):
+    role_id = serializers.IntegerField(required=False, allow_null=True, error_messages={"invalid": "请选择正确的角色"})
+    department_id = serializers.IntegerField(required=False, allow_null=True, error_messages={"invalid": "请选择正确的部门"})
+
+    def validate(self, attrs):
+        if attrs.get('role_id', None) is None and attrs.get('department_id', None) is None:
+            raise VException(500, '请选择角色或部门')
+        return attrs
+
+
+
 class UpdateAttendanceSerializer(serializers.Serializer):
     user_id = serializers.IntegerField(required=True, error_messages={"required": "请填写用户id", "invalid": "请输入正确的用户id", "null": "用户id不能为空"})
     date = serializers.DateTimeField(required=True, input_formats=["%Y-%m-%d"], error_messages={"required": "请输入日期", "null": "日期不能为空", "invalid": "日期格式错误", "date": "日期格式错误", "make_aware": "日期格式错误", "overflow": "日期格式错误"}, format="%Y-%m-%d")
@@ -389,6 +397,19 @@ class EditAttendanceSerializer(serializers.ModelSerializer):
 
 
 
+class BatchEditAttendanceItemSerializer(UpdateAttendanceSerializer):
+    first_admit = serializers.TimeField(required=False, allow_null=True, input_formats=["%H:%M:%S"], error_messages={"required": "请输入签到时间", "invalid": "签到时间格式错误"}, format="%H:%M:%S")
+    last_admit = serializers.TimeField(required=False, allow_null=True, input_formats=["%H:%M:%S"], error_messages={"required": "请输入签退时间", "invalid": "签退时间格式错误"}, format="%H:%M:%S")
+    out_duration = serializers.FloatField(required=False, allow_null=True, error_messages={"required": "缺少外出时长", "invalid": "外出时长格式错误"})
+    comment = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+
+class BatchEditAttendanceSerializer(serializers.Serializer):
+    records = serializers.ListField(child=BatchEditAttendanceItemSerializer(), required=True, allow_empty=False, max_length=500, error_messages={"required": "缺少修正数组", "not_a_list": "修正数组错误", "empty": "修正数组不能为空", "max_length": "单次最多修正500条"})
+
+
+
 class UpdateCalendarSerializer(serializers.Serializer):
     day = serializers.DateField(required=True, input_formats=["%Y-%m-%d"], error_messages={"required": "请输入日期", "null": "日期不能为空", "invalid": "日期格式错误", "date": "日期格式错误", "make_aware": "日期格式错误", "overflow": "日期格式错误"}, format="%Y-%m-%d")
     is_holiday = serializers.ChoiceField(required=True, allow_null=True, choices=((0, '否'), (1, '是')), error_messages={"required": "请选择是否放假", "invalid_choice": "请选择正确是否放假"})
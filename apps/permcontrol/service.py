@@ -3,85 +3,289 @@ import random
 import json
 from interval import Interval
 import calendar
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Exists, OuterRef
+from django.core.serializers.json import DjangoJSONEncoder
 
 from config.config import SafeModuleConfig
 from core.utils.redis_client import RedisClientInstance
+from core.utils.ttl_cache import TTLCache
 from core.framework.v_exception import VException, KException
-from permcontrol.models import Role, User, PermissionGroup, AdmitRecord, AttendanceRecord, CalendarEditRecord, AttendanceConfig
+from permcontrol.models import Role, User, Token, AdmitRecord, AttendanceRecord, CalendarEditRecord, AttendanceConfig, \
+    AttendanceMonthSummary
+from permcontrol.attendance_numeric import evaluate_record_lists
+from permcontrol.attendance_schedule import compile_schedule
+from permcontrol.work_calendar import WorkCalendar
+from permcontrol.attendance_config import AttendanceConfigResolver
+from permcontrol.permission_index import PermissionIndexResolver
 from warehouse.models import Warehouse
 import logging
 
 logger = logging.getLogger("django")
 
 
+# token 缓存
+USER_TOKEN_KEY = 'token_expire:user_token:{}'
+# 用户的全部 token 缓存key user_id
+USER_TOKEN_SET_KEY = 'token_expire:user_tokens:{}'
+# 用户认证信息缓存(用户快照、角色id) user_id
+PRINCIPAL_CACHE_KEY = 'auth_principal:{}'
+# 角色版本号 role_id, 编辑角色后递增
+ROLE_VERSION_KEY = 'role_permission:version:{}'
+# 角色名称、权限缓存 role_id, hash {version, value}, 版本号与角色版本号不一致时重新生成
+ROLE_PERMISSION_KEY = 'role_permission:{}'
+# 用户快照不缓存的字段
+USER_SNAPSHOT_EXCLUDE = ('password',)
+# 进程内认证信息缓存时间(秒), 其他进程的变更最多延迟该时间生效
+PRINCIPAL_LOCAL_EXPIRE = 5
+
+_PRINCIPAL_LOCAL_CACHE = TTLCache(maxsize=2048, ttl=PRINCIPAL_LOCAL_EXPIRE)
+
+# 校验 token, 超过 expire_time 时在脚本内刷新并重置过期时间
+# token 为 hash {user_id, expire_time}, 兼容 json 格式
+# KEYS: token; ARGV: 当前时间戳, token 有效时长, token 过期时长
+# 返回 {user_id, expire_time, 是否刷新}, token 无效时返回 nil
+TOKEN_SCRIPT = """
+local key_type = redis.call('TYPE', KEYS[1])['ok']
+local user_id = nil
+local expire_time = nil
+if key_type == 'hash' then
+    local token = redis.call('HMGET', KEYS[1], 'user_id', 'expire_time')
+    user_id = token[1]
+    expire_time = token[2]
+elseif key_type == 'string' then
+    local token = cjson.decode(redis.call('GET', KEYS[1]))
+    user_id = token['user_id']
+    expire_time = token['expire_time']
+end
+if not user_id or not expire_time then
+    return nil
+end
+local refreshed = 0
+local now = tonumber(ARGV[1])
+if now > tonumber(expire_time) then
+    expire_time = now + tonumber(ARGV[2])
+    redis.call('DEL', KEYS[1])
+    redis.call('HMSET', KEYS[1], 'user_id', user_id, 'expire_time', expire_time)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    refreshed = 1
+end
+return {user_id, expire_time, refreshed}
+"""
+
+
 # 清除token缓存
 def clean_user_expire_token(access_token):
     if not access_token:
         return
+    _PRINCIPAL_LOCAL_CACHE.delete(access_token)
     try:
         redis_client = RedisClientInstance.get_storage_instance()
-        cache_key = 'token_expire:user_token:{}'.format(access_token)
-        redis_client.delete_by_name(cache_key)
+        redis_client.delete_by_name(USER_TOKEN_KEY.format(access_token))
     except:
         raise VException(500, "服务器正忙，请稍后再试")
 
 
-# 更新token缓存
+# token 有效时长、过期时长(秒)
+def token_expire_seconds():
+    return 60 * SafeModuleConfig.access_token_exp, 60 * SafeModuleConfig.access_token_refresh_exp
+
+
+# 更新token缓存, 返回失效时间
 def cache_user_expire_token(access_token, user_id, time_now):
     if not access_token:
         return
-    expire_time = 60 * SafeModuleConfig.access_token_exp
-    refresh_time = 60 * SafeModuleConfig.access_token_refresh_exp
+    expire_time, refresh_time = token_expire_seconds()
     now_timestamp = int(time_now.timestamp())
     try:
         redis_client = RedisClientInstance.get_storage_instance()
-        cache_key = 'token_expire:user_token:{}'.format(access_token)
+        cache_key = USER_TOKEN_KEY.format(access_token)
         cache_value = {
             'user_id': user_id,
             'expire_time': now_timestamp + expire_time
         }
-        # 更新缓存
-        redis_client.single_set_string_with_expire_time(cache_key, 'second', refresh_time, json.dumps(cache_value))
+        set_key = USER_TOKEN_SET_KEY.format(user_id)
+        # 更新缓存, 记录到用户的 token 集合
+        with redis_client.transaction() as batch:
+            batch.delete(cache_key)
+            batch.hset(cache_key, mapping=cache_value)
+            batch.expire(cache_key, refresh_time)
+            batch.sadd(set_key, cache_key)
+            batch.expire(set_key, refresh_time)
     except Exception as e:
         raise VException(500, "服务器正忙，请稍后再试")
+    return cache_value['expire_time']
+
+
+# 注销用户的全部 token(redis 缓存及数据库记录), 返回注销的 token 数
+# 先读取用户的 token 集合, 再一次删除全部 token 及集合, 与用户数无关固定两次往返
+def revoke_user_tokens(user_ids):
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return 0
+    id_set = set(user_ids)
+    _PRINCIPAL_LOCAL_CACHE.delete_if(lambda key, principal: principal['user_id'] in id_set)
+    token_queryset = Token.objects.filter(user_id__in=user_ids)
+    # 集合之外的 token (如集合已过期) 以数据库记录为准
+    token_keys = set(USER_TOKEN_KEY.format(key) for key in token_queryset.values_list('key', flat=True))
+    set_keys = [USER_TOKEN_SET_KEY.format(user_id) for user_id in user_ids]
+    try:
+        redis_client = RedisClientInstance.get_storage_instance()
+        with redis_client.pipeline() as batch:
+            for set_key in set_keys:
+                batch.smembers(set_key)
+        for members in batch.results:
+            token_keys.update(decode_redis_value(member) for member in members)
+        with redis_client.transaction() as batch:
+            if token_keys:
+                batch.delete(*token_keys)
+            batch.delete(*set_keys)
+        count = batch.results[0] if token_keys else 0
+    except Exception as e:
+        logger.error("revoke token error {}".format(e))
+        raise VException(500, "操作失败，服务器正忙，请稍后再试")
+    token_queryset.delete()
+    return count
 
 
-def check_cache_token(access_token):
-    '''
-    缓存创建时间、失效时间
-    如果超过失效时间, 刷新有效期
-    '''
-    if not access_token:
-        return None
-    user_id = None
-    expire_time = None
-    time_now = datetime.datetime.now()
-    now_timestamp = int(time_now.timestamp())
+# 用户快照字段, 不含密码
+def user_snapshot_fields():
+    return [field for field in User._meta.concrete_fields if field.attname not in USER_SNAPSHOT_EXCLUDE]
+
+
+# 用户快照
+def dump_user_snapshot(user):
+    return json.dumps({field.attname: getattr(user, field.attname) for field in user_snapshot_fields()},
+                      cls=DjangoJSONEncoder)
+
+
+# 快照还原的用户, 密码为延迟加载字段, 只作读取用, 修改需重新查询
+def load_user_snapshot(snapshot):
+    field_names = []
+    values = []
+    for field in user_snapshot_fields():
+        field_names.append(field.attname)
+        values.append(field.to_python(snapshot.get(field.attname, None)))
+    return User.from_db('default', field_names, values)
+
+
+def decode_redis_value(value):
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+# 认证信息随机失效时间
+def principal_cache_expire():
+    return random.randint(1, 10) * 60 + 3 * 60 * 60
+
+
+# 从 redis 读取认证信息, 缺失时从数据库生成
+# 依次读取 token、用户认证信息、角色权限, 每次往返只访问已知的 key
+def load_cache_principal(access_token, time_now):
+    expire_seconds, refresh_seconds = token_expire_seconds()
+    token_key = USER_TOKEN_KEY.format(access_token)
     try:
         redis_client = RedisClientInstance.get_storage_instance()
-        cache_key = 'token_expire:user_token:{}'.format(access_token)
-        cache_value = redis_client.get_by_name(cache_key)
-        if cache_value:
-            value = json.loads(cache_value)
-            user_id = value.get('user_id', None)
-            expire_time = value.get('expire_time', None)
+        value = redis_client.run_script(TOKEN_SCRIPT, keys=[token_key],
+                                        args=[int(time_now.timestamp()), expire_seconds, refresh_seconds])
     except:
         raise VException(500, "服务器正忙，请稍后再试")
-    if not user_id or not expire_time:
+    if not value:
         raise VException(401, "登录已失效")
-    # 刷新token
-    if now_timestamp > expire_time:
-        cache_user_expire_token(access_token, user_id, time_now)
-    return user_id
+    user_id = int(value[0])
+    expire_time = int(value[1])
+
+    # token 刷新后同时延长用户 token 集合
+    try:
+        with redis_client.pipeline() as batch:
+            batch.hgetall(PRINCIPAL_CACHE_KEY.format(user_id))
+            if int(value[2]):
+                set_key = USER_TOKEN_SET_KEY.format(user_id)
+                batch.sadd(set_key, token_key)
+                batch.expire(set_key, refresh_seconds)
+    except:
+        raise VException(500, "服务器正忙，请稍后再试")
+    principal_map = {decode_redis_value(key): decode_redis_value(item) for key, item in batch.results[0].items()}
+    if 'user' not in principal_map or 'role_id' not in principal_map:
+        user = User.objects.filter(id=user_id,
+                                   is_delete=0).first()
+        if not user:
+            raise VException(401, "用户未注册")
+        principal_map = {
+            'user': dump_user_snapshot(user),
+            'role_id': str(user.role_id) if user.role_id else '',
+        }
+        try:
+            redis_client.replace_hash_with_expire_time(PRINCIPAL_CACHE_KEY.format(user_id), principal_map,
+                                                       principal_cache_expire())
+        except Exception as e:
+            logger.error("init permission error {}".format(e))
+            raise VException(500, "服务器正忙，请稍后再试")
+
+    user_snapshot = json.loads(principal_map['user'])
+    role_id = user_snapshot.get('role_id', None)
+    if not role_id:
+        role_value = json.dumps({'role': None, 'permission': []})
+    else:
+        role_value = cache_role_permission(role_id)
+    role_info = json.loads(role_value)
+    return {
+        'user_id': user_id,
+        'expire_time': expire_time,
+        'user': user_snapshot,
+        'role': role_info['role'],
+        'permission': role_info['permission'],
+    }
 
 
-# 获取权限
-def init_role_permissions(user):
+# 角色名称、权限缓存, 一次往返读取角色版本号和缓存, 版本不一致时重新生成
+def cache_role_permission(role_id):
+    cache_key = ROLE_PERMISSION_KEY.format(role_id)
+    try:
+        redis_client = RedisClientInstance.get_storage_instance()
+        with redis_client.pipeline() as batch:
+            batch.get(ROLE_VERSION_KEY.format(role_id))
+            batch.hmget(cache_key, 'version', 'value')
+        role_version = decode_redis_value(batch.results[0]) or '0'
+        cache_version, role_value = batch.results[1]
+        if role_value and decode_redis_value(cache_version) == role_version:
+            return decode_redis_value(role_value)
+        role, perms_list = init_role_permissions(role_id)
+        role_value = json.dumps({'role': role, 'permission': perms_list})
+        redis_client.replace_hash_with_expire_time(cache_key, {'version': role_version, 'value': role_value},
+                                                   principal_cache_expire())
+    except VException:
+        raise
+    except Exception as e:
+        logger.error("init permission error {}".format(e))
+        raise VException(500, "服务器正忙，请稍后再试")
+    return role_value
+
+
+def get_cache_principal(access_token):
+    '''
+    token 对应的用户(含角色、权限)
+    先查进程内缓存, 未命中时从 redis 读取 token 和认证信息
+    token 超过失效时间时刷新有效期
+    '''
+    time_now = datetime.datetime.now()
+    principal = _PRINCIPAL_LOCAL_CACHE.get(access_token, None)
+    if principal is None or int(time_now.timestamp()) > principal['expire_time']:
+        principal = load_cache_principal(access_token, time_now)
+        _PRINCIPAL_LOCAL_CACHE.set(access_token, principal)
+    user = load_user_snapshot(principal['user'])
+    user.role = principal['role']
+    user.permission = list(principal['permission'])
+    return user
+
+
+# 获取角色名称、权限
+def init_role_permissions(role_id):
     role_name = None
     perms_name_list = []
     # 获取所有角色
-    role = Role.objects.filter(id=user.role_id,
+    role = Role.objects.filter(id=role_id,
                                is_delete=0).first()
 
     if role:
@@ -95,64 +299,66 @@ def init_role_permissions(user):
     return role_name, perms_name_list
 
 
+# 角色是否有该权限
+def has_role_permission(role_id, need_perms):
+    return PermissionIndexResolver.get_instance().get_index().has_permission(role_id, need_perms)
+
+
 # 查找权限所需的角色
 def get_permissions_role(need_perms):
-    role_name_list = []
-    need_role = Role.objects.filter(permission__action=need_perms,
-                                    is_delete=0).all()
-    for role in need_role:
-        role_name_list.append(role.name)
-    role_name_list = list(set(role_name_list))
-    return role_name_list
-
-
-# 缓存权限
-def get_cache_role_permission(user):
-    if not user:
-        return None, []
-    try:
-        redis_client = RedisClientInstance.get_storage_instance()
-        cache_key = 'permissions_cache:user_role:{}'.format(user.id)
-        cache_value = redis_client.get_by_name(cache_key)
-        if cache_value is None:
-            # 随机失效时间
-            expire_time = random.randint(1, 10) * 60 + 3 * 60 * 60
-            # 缓存权限组
-            role, perms_list = init_role_permissions(user)
-            role_perms = {
-                'role': role,
-                'permission': perms_list
-            }
-            redis_client.single_set_string_with_expire_time(cache_key, 'second', expire_time, json.dumps(role_perms))
-        else:
-            # 解码权限组
-            role_perms = json.loads(cache_value)
-            role = role_perms.get('role', None)
-            perms_list = role_perms.get('permission', [])
-    except Exception as e:
-        logger.error("init permission error {}".format(e))
-        raise VException(500, "服务器正忙，请稍后再试")
+    return PermissionIndexResolver.get_instance().get_index().get_roles(need_perms)
+
 
-    return role, perms_list
+# 角色、权限变更, 事务提交后通知各进程重新加载权限索引
+def invalidate_permission_index():
+    transaction.on_commit(PermissionIndexResolver.get_instance().invalidate)
 
 
-# 清空用户角色、权限缓存
+# 清空用户认证信息(用户快照、角色、权限)缓存
 def clean_cache_role_permission(user_ids):
     # 判断是否为数组
     if not isinstance(user_ids, list):
         raise VException(500, "操作失败")
     if len(user_ids) == 0:
         return
-    # 清空权限
-    try:
+    id_set = set(user_ids)
+    cache_keys = [PRINCIPAL_CACHE_KEY.format(user_id) for user_id in user_ids]
+
+    def delete_principal():
+        _PRINCIPAL_LOCAL_CACHE.delete_if(lambda key, principal: principal['user_id'] in id_set)
         redis_client = RedisClientInstance.get_storage_instance()
-        for user_id in user_ids:
-            cache_key = 'permissions_cache:user_role:{}'.format(user_id)
-            redis_client.delete_by_name(cache_key)
+        redis_client.multi_delete(cache_keys)
+
+    # 清空权限, 一次往返, redis 不可用时操作失败
+    try:
+        delete_principal()
     except Exception as e:
         logger.error("clean permission error {}".format(e))
         raise VException(500, "操作失败，服务器正忙，请稍后再试")
 
+    # 事务提交前其他请求可能按旧数据重新生成缓存, 提交后再清空一次
+    def delete_principal_on_commit():
+        try:
+            delete_principal()
+        except Exception as e:
+            logger.error("clean permission error {}".format(e))
+
+    transaction.on_commit(delete_principal_on_commit)
+
+
+# 编辑角色后递增角色版本号, 该角色用户的权限缓存随之失效
+def invalidate_role_permission(role_id):
+    _PRINCIPAL_LOCAL_CACHE.delete_if(lambda key, principal: principal['user'].get('role_id', None) == role_id)
+
+    def increase_role_version():
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.increase_by(ROLE_VERSION_KEY.format(role_id))
+        except Exception as e:
+            logger.error("role permission invalidate error {}".format(e))
+
+    transaction.on_commit(increase_role_version)
+
 
 # 删除用户关联数据
 def clean_user_related_data(user_id):
@@ -170,22 +376,30 @@ def clean_user_related_data(user_id):
         warehouse.save()
 
 
-# 获取权限的所有父级
-def get_full_tree_permission(permission_id):
+# 获取多个权限及其全部父级(去重)
+def get_permission_ancestors(permission_ids):
+    index = PermissionIndexResolver.get_instance().get_index()
     permission_list = []
-
-    def get_parent_permission(parent_id):
-        permission = PermissionGroup.objects.filter(id=parent_id).first()
-        if not permission:
+    permission_set = set()
+    for permission_id in permission_ids:
+        try:
+            path = index.get_path(int(permission_id))
+        except (TypeError, ValueError):
+            path = None
+        if path is None:
             raise VException(500, "所选权限不存在")
-        permission_list.append(permission.id)
-        if permission.parent_id:
-            get_parent_permission(permission.parent_id)
-
-    get_parent_permission(permission_id)
+        for item in path:
+            if item not in permission_set:
+                permission_set.add(item)
+                permission_list.append(item)
     return permission_list
 
 
+# 嵌套权限树
+def get_permission_tree(parent_id=None, permission_type=None, ordering=None):
+    return PermissionIndexResolver.get_instance().get_index().get_tree(parent_id, permission_type, ordering)
+
+
 
 # 编辑配置考勤
 def edit_attendance_config(form_data, user):
@@ -216,45 +430,58 @@ def edit_attendance_config(form_data, user):
     setting.create_user_id = user.id
     setting.update_user_id = user.id
     setting.save()
+    invalidate_attendance_config()
 
 
 # 获取考勤配置
 def get_attendance_config(date:datetime.datetime):
-    attendance_config = {
-        'time_interval_tuple': None,
-        'out_limit': None,
-        'exclude_user': []
-    }
-    time_interval_tuple_config = AttendanceConfig.objects.filter(Q(name='time_interval_tuple'),
-                                                                ~Q(date__gte=date)).order_by('-id').first()
-    if time_interval_tuple_config:
-        try:
-            time_interval_tuple = json.loads(time_interval_tuple_config.value)
-            attendance_config['time_interval_tuple'] = time_interval_tuple
-        except:
-            logger.error("attendance config error {}".format(time_interval_tuple_config))
-            raise VException(500, '上班时间段配置错误')
-
-    out_limit_config = AttendanceConfig.objects.filter(Q(name='out_limit'),
-                                                       ~Q(date__gte=date)).order_by('-id').first()
-    if out_limit_config:
-        try:
-            out_limit = out_limit_config.value
-            attendance_config['out_limit'] = float(out_limit)
-        except:
-            logger.error("attendance config error {}".format(out_limit_config))
-            raise VException(500, '外出时长配置错误')
-
-    exclude_user_config = AttendanceConfig.objects.filter(Q(name='exclude_user')).order_by('-id').first()
-    if exclude_user_config:
-        try:
-            exclude_user = exclude_user_config.value
-            if exclude_user:
-                attendance_config['exclude_user'] = exclude_user.split(',')
-        except:
-            logger.error("attendance config error {}".format(out_limit_config))
-            raise VException(500, '考勤人员配置错误')
-    return attendance_config
+    return AttendanceConfigResolver.get_instance().resolve(date)
+
+
+# 考勤配置变更, 事务提交后通知各进程重新加载
+def invalidate_attendance_config():
+    transaction.on_commit(AttendanceConfigResolver.get_instance().invalidate)
+
+
+# 考勤记录版本, 重新生成、修正考勤记录后递增
+ATTENDANCE_RECORD_VERSION_KEY = 'attendance_record:version'
+
+
+# 考勤记录变更, 事务提交后递增版本号
+def invalidate_attendance_record():
+    transaction.on_commit(increase_attendance_record_version)
+
+
+def increase_attendance_record_version():
+    try:
+        redis_client = RedisClientInstance.get_storage_instance()
+        redis_client.increase_by(ATTENDANCE_RECORD_VERSION_KEY)
+    except Exception as e:
+        logger.error("attendance record invalidate error {}".format(e))
+
+
+# 考勤人员版本(部门、在职状态、离职日期)
+ATTENDANCE_USER_VERSION_KEY = 'attendance_user:version'
+
+
+# 人员变更, 事务提交后递增版本号
+def invalidate_attendance_user():
+    transaction.on_commit(increase_attendance_user_version)
+
+
+def increase_attendance_user_version():
+    try:
+        redis_client = RedisClientInstance.get_storage_instance()
+        redis_client.increase_by(ATTENDANCE_USER_VERSION_KEY)
+    except Exception as e:
+        logger.error("attendance user invalidate error {}".format(e))
+
+
+# 获取考勤人员（未离职）
+def get_attendance_user_queryset(date, exclude_user):
+    return User.objects.filter(Q(quit_date__isnull=True) | Q(quit_date__gt=date),
+                               ~Q(id__in=exclude_user),
+                               Q(status=1)).all()
 
 
 # 判断是否外出过长
@@ -269,26 +496,43 @@ def check_out_limit(out_duration, out_limit):
 
 # 计算规定上班总时长
 def total_duty_time(time_interval_tuple):
-    total_duty = 0
-    for index in range(len(time_interval_tuple)):
-        interval = time_interval_tuple[index]
-        # 上班区间时长
-        duty_interval = datetime.datetime.strptime(interval[1], "%H:%M") - datetime.datetime.strptime(interval[0], "%H:%M")
-        interval_hours = round(duty_interval.seconds / 3600, 2)
-        total_duty += interval_hours
+    return compile_schedule(time_interval_tuple).total_duty
 
-    return total_duty
 
+# 格式化门禁数据
+def format_admit_record(record):
+    return {
+        'admit_type': record.admit_type,
+        'show_time': record.show_time.strftime('%H:%M:%S')
+    }
 
-# 数据库打卡数据
-def summary_database_function(user, input_datetime:datetime.datetime, time_interval_tuple, out_limit):
+
+# 根据门禁数据计算原始考勤结果
+def compute_origin_result(record_list, time_interval_tuple, out_limit):
+    schedule = compile_schedule(time_interval_tuple)
+    result = schedule.evaluate(schedule.punches(record_list))
+    out_duration = result['out_duration']
+    return {
+        'is_late': result['is_late'],
+        'is_leave_early': result['is_leave_early'],
+        'duty_duration': result['duty_duration'],
+        'out_duration': out_duration,
+        'is_out_timeout': check_out_limit(out_duration, out_limit),
+    }
+
+
+# 生成当日考勤信息（不访问数据库）
+# origin_result 为预先计算的原始考勤结果（批量计算时传入）
+# 返回考勤信息和待入库的原始记录
+def build_summary_info(user, input_datetime:datetime.datetime, record_list, origin_record, revise_record,
+                       time_interval_tuple, out_limit, origin_result=None):
     # 初始化数据
     info = {
         'user_id': user.id,
         'name': user.display_name,
         'job_number': user.job_number,
         'date': input_datetime.strftime('%Y-%m-%d'),
-        'record_list': [],
+        'record_list': record_list,
         'origin_first_admit': None,
         'origin_last_admit': None,
         'origin_out_duration': 0,
@@ -304,24 +548,8 @@ def summary_database_function(user, input_datetime:datetime.datetime, time_inter
         'is_leave_early': 0,
         'is_out_timeout': 0,
     }
+    new_record = None
 
-    # 获取门禁数据
-    record_list = []
-    admit_record = AdmitRecord.objects.filter(Q(user_id=user.id) | Q(admit_guid=user.admit_guid),
-                                              show_time__year=input_datetime.year,
-                                              show_time__month=input_datetime.month,
-                                              show_time__day=input_datetime.day).order_by("show_time")
-    for record in admit_record:
-        record_list.append({
-            'admit_type': record.admit_type,
-            'show_time': record.show_time.strftime('%H:%M:%S')
-        })
-    info['record_list'] = record_list
-
-    # 原始记录
-    origin_record = AttendanceRecord.objects.filter(user_id=user.id,
-                                                    date=input_datetime,
-                                                    is_revise=0).first()
     if origin_record:
         # 加载配置信息
         info['origin_first_admit'] = origin_record.first_admit
@@ -340,24 +568,18 @@ def summary_database_function(user, input_datetime:datetime.datetime, time_inter
         if len(record_list) > 0:
             info['origin_first_admit'] = record_list[0]['show_time']
             info['origin_last_admit'] = record_list[-1]['show_time']
-            # 日期格式化
-            first_admit = datetime.datetime.strptime(record_list[0]['show_time'], '%H:%M:%S')
-            last_admit = datetime.datetime.strptime(record_list[-1]['show_time'], '%H:%M:%S')
             # 计算
-            result = check_summary_attendance(first_admit, last_admit, time_interval_tuple)
-            info['is_late'] = result['is_late']
-            info['is_leave_early'] = result['is_leave_early']
-            info['origin_duty_duration'] = result['duty_duration']
+            if origin_result is None:
+                origin_result = compute_origin_result(record_list, time_interval_tuple, out_limit)
+            info['is_late'] = origin_result['is_late']
+            info['is_leave_early'] = origin_result['is_leave_early']
+            info['origin_duty_duration'] = origin_result['duty_duration']
             # 获取统计结果
-            interval_list = result['interval_list']
-            for interval in interval_list:
-                total_out = summary_out(record_list, interval[0], interval[1])
-                out_duration += total_out
-            out_duration = round(out_duration, 2)
+            out_duration = origin_result['out_duration']
             info['origin_out_duration'] = out_duration
             info['result_out_duration'] = out_duration
-            info['result_duty_duration'] = result['duty_duration']
-            info['is_out_timeout'] = check_out_limit(out_duration, out_limit)
+            info['result_duty_duration'] = origin_result['duty_duration']
+            info['is_out_timeout'] = origin_result['is_out_timeout']
 
         # 如果不是当天数据，则入库
         time_now = datetime.datetime.now()
@@ -377,12 +599,8 @@ def summary_database_function(user, input_datetime:datetime.datetime, time_inter
             new_record.time_interval_tuple = json.dumps(time_interval_tuple)
             new_record.out_limit = out_limit
             new_record.is_revise = 0
-            new_record.save()
 
     # 修正记录
-    revise_record = AttendanceRecord.objects.filter(user_id=user.id,
-                                                    date=input_datetime,
-                                                    is_revise=1).first()
     if revise_record:
         info['first_admit'] = revise_record.first_admit
         info['last_admit'] = revise_record.last_admit
@@ -393,14 +611,441 @@ def summary_database_function(user, input_datetime:datetime.datetime, time_inter
         info['is_out_timeout'] = revise_record.is_out_timeout
         info['result_duty_duration'] = revise_record.duty_duration
         if revise_record.out_duration is None:
-            info['result_out_duration'] = origin_record.out_duration
+            info['result_out_duration'] = info['origin_out_duration']
         else:
             info['result_out_duration'] = revise_record.out_duration
     info['valid_duty_duration'] = round(info['result_duty_duration'] - info['result_out_duration'], 2)
 
+    return info, new_record
+
+
+# 数据库打卡数据
+def summary_database_function(user, input_datetime:datetime.datetime, time_interval_tuple, out_limit):
+    # 获取门禁数据
+    start_datetime, end_datetime = compile_schedule(time_interval_tuple).day_range(input_datetime)
+    record_list = []
+    for record in AdmitRecord.objects.user_range(user, start_datetime, end_datetime):
+        record_list.append(format_admit_record(record))
+
+    # 原始记录
+    origin_record = AttendanceRecord.objects.filter(user_id=user.id,
+                                                    date=input_datetime,
+                                                    is_revise=0).first()
+    # 修正记录
+    revise_record = AttendanceRecord.objects.filter(user_id=user.id,
+                                                    date=input_datetime,
+                                                    is_revise=1).first()
+
+    info, new_record = build_summary_info(user, input_datetime, record_list, origin_record, revise_record,
+                                          time_interval_tuple, out_limit)
+    if new_record:
+        new_record.save()
     return info
 
 
+# 批量加载门禁数据, 按人员、考勤日分组
+# window_start 为考勤窗口起点(秒), 夜班的考勤日从窗口起点开始
+# {user_id: {date: [record, ...]}}
+def load_admit_record_map(user_list, start_datetime:datetime.datetime, end_datetime:datetime.datetime,
+                          window_start=0):
+    record_map = {}
+    window_offset = datetime.timedelta(seconds=window_start)
+    user_record_map = AdmitRecord.objects.group_by_user(user_list, start_datetime + window_offset,
+                                                        end_datetime + window_offset)
+    for user_id, admit_record in user_record_map.items():
+        day_map = {}
+        for record in admit_record:
+            day_map.setdefault((record.show_time - window_offset).date(), []).append(format_admit_record(record))
+        record_map[user_id] = day_map
+    return record_map
+
+
+# 批量加载考勤记录, 按人员、日期分组
+# ({(user_id, date): origin_record}, {(user_id, date): revise_record})
+def load_attendance_record_map(user_ids, start_date:datetime.date, end_date:datetime.date):
+    origin_map = {}
+    revise_map = {}
+    if not user_ids:
+        return origin_map, revise_map
+    queryset = AttendanceRecord.objects.filter(user_id__in=user_ids,
+                                               date__gte=start_date,
+                                               date__lt=end_date).order_by('id')
+    for record in queryset.iterator():
+        key = (record.user_id, record.date)
+        if record.is_revise == 1:
+            revise_map.setdefault(key, record)
+        else:
+            origin_map.setdefault(key, record)
+    return origin_map, revise_map
+
+
+# 需统计的考勤日期: 今日和假期不纳入统计
+def get_attendance_day_list(calendar_data, start_date:datetime.date=None):
+    time_now = datetime.datetime.now()
+    today_now_datetime = datetime.datetime(time_now.year, time_now.month, time_now.day)
+    day_list = []
+    for calendar_info in calendar_data:
+        calendar_day = datetime.datetime.strptime(calendar_info['day'], "%Y-%m-%d")
+        if calendar_day >= today_now_datetime or calendar_info['is_holiday'] == 1:
+            continue
+        if start_date and calendar_day.date() < start_date:
+            continue
+        day_list.append(calendar_day)
+    return day_list
+
+
+# 批量计算考勤信息
+# 一次性加载区间内的门禁、考勤记录，在内存中按人员、日期汇总
+# {user_id: [info, ...]} 与 day_list 一一对应
+def summary_days_attendance(user_list, day_list, time_interval_tuple, out_limit):
+    user_list = list(user_list)
+    record_map = {}
+    origin_map = {}
+    revise_map = {}
+    if day_list:
+        start_datetime = day_list[0]
+        end_datetime = day_list[-1] + datetime.timedelta(days=1)
+        record_map = load_admit_record_map(user_list, start_datetime, end_datetime,
+                                           compile_schedule(time_interval_tuple).window_start)
+        origin_map, revise_map = load_attendance_record_map([user.id for user in user_list],
+                                                            start_datetime.date(), end_datetime.date())
+
+    # 缺少原始记录的打卡数据批量计算
+    pending_keys = []
+    pending_record_lists = []
+    for user in user_list:
+        user_record_map = record_map.get(user.id, {})
+        for calendar_day in day_list:
+            day_key = calendar_day.date()
+            record_list = user_record_map.get(day_key, [])
+            if record_list and (user.id, day_key) not in origin_map:
+                pending_keys.append((user.id, day_key))
+                pending_record_lists.append(record_list)
+    origin_result_map = {}
+    if pending_record_lists:
+        result_list = evaluate_record_lists(pending_record_lists, time_interval_tuple, out_limit)
+        origin_result_map = dict(zip(pending_keys, result_list))
+
+    info_map = {}
+    new_record_list = []
+    for user in user_list:
+        user_record_map = record_map.get(user.id, {})
+        info_list = []
+        for calendar_day in day_list:
+            day_key = calendar_day.date()
+            info, new_record = build_summary_info(user, calendar_day,
+                                                  user_record_map.get(day_key, []),
+                                                  origin_map.get((user.id, day_key)),
+                                                  revise_map.get((user.id, day_key)),
+                                                  time_interval_tuple, out_limit,
+                                                  origin_result_map.get((user.id, day_key)))
+            if new_record:
+                new_record_list.append(new_record)
+            info_list.append(info)
+        info_map[user.id] = info_list
+
+    # 缺失的原始记录一次性入库
+    if new_record_list:
+        AttendanceRecord.objects.bulk_create(new_record_list, batch_size=500)
+    return info_map
+
+
+# 考勤异常筛选 {参数: 字段}
+ABNORMAL_FIELDS = {
+    'late': ['is_late'],
+    'leave_early': ['is_leave_early'],
+    'out_timeout': ['is_out_timeout'],
+    'abnormal': ['is_late', 'is_leave_early', 'is_out_timeout'],
+}
+
+
+# 考勤信息是否异常
+def is_abnormal_info(info, abnormal):
+    for field in ABNORMAL_FIELDS[abnormal]:
+        if info[field] == 1:
+            return True
+    return False
+
+
+# 补齐人员当天缺失的原始记录
+def ensure_origin_records(user_queryset, input_datetime:datetime.datetime, time_interval_tuple, out_limit):
+    origin_queryset = AttendanceRecord.objects.filter(date=input_datetime, is_revise=0).values('user_id')
+    user_list = list(user_queryset.exclude(id__in=origin_queryset))
+    if user_list:
+        summary_days_attendance(user_list, [input_datetime], time_interval_tuple, out_limit)
+
+
+# 按当天考勤结果筛选人员（修正记录优先）
+def filter_abnormal_user_queryset(user_queryset, input_datetime:datetime.datetime, abnormal):
+    condition = Q()
+    for field in ABNORMAL_FIELDS[abnormal]:
+        condition |= Q(**{field: 1})
+    record_queryset = AttendanceRecord.objects.filter(user_id=OuterRef('id'), date=input_datetime)
+    revise_queryset = record_queryset.filter(is_revise=1)
+    origin_queryset = record_queryset.filter(is_revise=0)
+    return user_queryset.filter(Q(Exists(revise_queryset.filter(condition))) |
+                                (~Q(Exists(revise_queryset)) & Q(Exists(origin_queryset.filter(condition)))))
+
+
+# 单日考勤分页统计，只计算当前页人员
+# user_queryset 需已排序, 返回 (总数, 当前页考勤信息)
+def summary_day_attendance(user_queryset, input_datetime:datetime.datetime, time_interval_tuple, out_limit,
+                           start, end, abnormal=None):
+    time_now = datetime.datetime.now()
+    today_now_datetime = datetime.datetime(time_now.year, time_now.month, time_now.day)
+    if abnormal and input_datetime >= today_now_datetime:
+        # 当天没有统计记录，计算全部人员后筛选
+        user_list = list(user_queryset)
+        info_map = summary_days_attendance(user_list, [input_datetime], time_interval_tuple, out_limit)
+        info_list = [info_map[user.id][0] for user in user_list
+                     if is_abnormal_info(info_map[user.id][0], abnormal)]
+        return len(info_list), info_list[start:end]
+
+    if abnormal:
+        # 历史日期先补齐统计记录，在数据库中筛选
+        ensure_origin_records(user_queryset, input_datetime, time_interval_tuple, out_limit)
+        user_queryset = filter_abnormal_user_queryset(user_queryset, input_datetime, abnormal)
+    count = user_queryset.count()
+    user_list = list(user_queryset[start:end])
+    info_map = summary_days_attendance(user_list, [input_datetime], time_interval_tuple, out_limit)
+    return count, [info_map[user.id][0] for user in user_list]
+
+
+# 月度汇总字段
+MONTH_SUMMARY_FIELDS = ['duty_days', 'late_days', 'leave_early_days', 'out_timeout_days', 'abnormal_days',
+                        'duty_duration_hours', 'out_duration_hours']
+
+
+# 单日考勤对月度汇总的贡献
+def month_summary_contribution(info):
+    is_late = info['is_late']
+    is_leave_early = info['is_leave_early']
+    is_out_timeout = info['is_out_timeout']
+    return {
+        'duty_days': 1 if info['result_duty_duration'] > 0 else 0,
+        'late_days': 1 if is_late == 1 else 0,
+        'leave_early_days': 1 if is_leave_early == 1 else 0,
+        'out_timeout_days': 1 if is_out_timeout == 1 else 0,
+        'abnormal_days': 1 if is_late == 1 or is_leave_early == 1 or is_out_timeout == 1 else 0,
+        'duty_duration_hours': info['result_duty_duration'],
+        'out_duration_hours': info['result_out_duration'],
+    }
+
+
+# 考勤记录的统计结果（修正记录优先）
+def record_summary_info(origin_record, revise_record):
+    info = {
+        'result_duty_duration': 0,
+        'result_out_duration': 0,
+        'is_late': 0,
+        'is_leave_early': 0,
+        'is_out_timeout': 0,
+    }
+    if origin_record:
+        info['result_duty_duration'] = origin_record.duty_duration
+        info['result_out_duration'] = origin_record.out_duration
+        info['is_late'] = origin_record.is_late
+        info['is_leave_early'] = origin_record.is_leave_early
+        info['is_out_timeout'] = origin_record.is_out_timeout
+    if revise_record:
+        info['result_duty_duration'] = revise_record.duty_duration
+        if revise_record.out_duration is not None:
+            info['result_out_duration'] = revise_record.out_duration
+        info['is_late'] = revise_record.is_late
+        info['is_leave_early'] = revise_record.is_leave_early
+        info['is_out_timeout'] = revise_record.is_out_timeout
+    return info
+
+
+# 累加考勤贡献
+def add_month_summary(summary, contribution, sign=1):
+    for field in MONTH_SUMMARY_FIELDS:
+        value = getattr(summary, field) + sign * (contribution[field] or 0)
+        setattr(summary, field, value)
+
+
+# 累加考勤贡献的增量(不为0的字段)
+def month_summary_delta(contribution_list, sign=1):
+    total = {field: 0 for field in MONTH_SUMMARY_FIELDS}
+    for contribution in contribution_list:
+        for field in MONTH_SUMMARY_FIELDS:
+            total[field] += sign * (contribution[field] or 0)
+    return {field: value for field, value in total.items() if value}
+
+
+# 增量更新表达式, 多个请求同时修改同一汇总行时互不覆盖
+def month_summary_update(delta):
+    return {field: F(field) + value for field, value in delta.items()}
+
+
+# 月度汇总输出
+def format_month_summary(user, month_datetime:datetime.datetime, attendance_days, summary=None):
+    user_attendance_info = {
+        'user_id': user.id,
+        'name': user.display_name,
+        'job_number': user.job_number,
+        'date': month_datetime.strftime('%Y-%m'),
+        # 应打卡天数
+        'attendance_days': attendance_days,
+        # 出勤天数
+        'duty_days': 0,
+        # 出勤时长
+        'duty_duration_hours': 0,
+        # 外出时长
+        'out_duration_hours': 0,
+        # 异常天数
+        'abnormal_days': 0,
+        'late_days': 0,
+        'leave_early_days': 0,
+        'out_timeout_days': 0,
+    }
+    if summary:
+        for field in MONTH_SUMMARY_FIELDS:
+            user_attendance_info[field] = getattr(summary, field)
+    user_attendance_info['duty_duration_hours'] = round(user_attendance_info['duty_duration_hours'], 2)
+    user_attendance_info['out_duration_hours'] = round(user_attendance_info['out_duration_hours'], 2)
+    return user_attendance_info
+
+
+# 月度考勤统计（批量，全量计算）
+def summary_month_attendance(user_list, month_datetime:datetime.datetime, calendar_data, time_interval_tuple, out_limit):
+    user_list = list(user_list)
+    day_list = get_attendance_day_list(calendar_data)
+    info_map = summary_days_attendance(user_list, day_list, time_interval_tuple, out_limit)
+    attendance_data = []
+    for user in user_list:
+        summary = AttendanceMonthSummary(user_id=user.id)
+        for info in info_map[user.id]:
+            add_month_summary(summary, month_summary_contribution(info))
+        attendance_data.append(format_month_summary(user, month_datetime, len(day_list), summary))
+    return attendance_data
+
+
+# 月度考勤统计（读取汇总表）
+# 汇总表记录已汇总至的日期，只补算之后的考勤日期
+def read_month_summary(user_list, month_datetime:datetime.datetime, calendar_data, time_interval_tuple, out_limit):
+    user_list = list(user_list)
+    month = datetime.date(month_datetime.year, month_datetime.month, 1)
+    day_list = get_attendance_day_list(calendar_data)
+    attendance_data = []
+    if not day_list:
+        for user in user_list:
+            attendance_data.append(format_month_summary(user, month_datetime, 0))
+        return attendance_data
+
+    # 汇总至 昨天 或 月末
+    time_now = datetime.datetime.now()
+    month_end = datetime.date(month.year, month.month, calendar.monthrange(month.year, month.month)[1])
+    target_date = min(month_end, time_now.date() - datetime.timedelta(days=1))
+
+    with transaction.atomic():
+        # 锁定汇总行, 补算期间编辑考勤的增量更新等待补算完成
+        summary_map = {}
+        queryset = AttendanceMonthSummary.objects.select_for_update().filter(
+            user_id__in=[user.id for user in user_list], month=month).order_by('user_id')
+        for summary in queryset:
+            summary_map[summary.user_id] = summary
+
+        # 按已汇总日期分组补算
+        pending_map = {}
+        for user in user_list:
+            summary = summary_map.get(user.id, None)
+            if summary and summary.summary_date and summary.summary_date >= target_date:
+                continue
+            start_date = month
+            if summary and summary.summary_date:
+                start_date = summary.summary_date + datetime.timedelta(days=1)
+            pending_map.setdefault(start_date, []).append(user)
+
+        create_list = []
+        update_ids = []
+        for start_date, pending_users in pending_map.items():
+            pending_days = get_attendance_day_list(calendar_data, start_date)
+            info_map = summary_days_attendance(pending_users, pending_days, time_interval_tuple, out_limit)
+            for user in pending_users:
+                contribution_list = [month_summary_contribution(info) for info in info_map[user.id]]
+                summary = summary_map.get(user.id, None)
+                if summary is None:
+                    summary = AttendanceMonthSummary(user_id=user.id, month=month, summary_date=target_date)
+                    for contribution in contribution_list:
+                        add_month_summary(summary, contribution)
+                    summary_map[user.id] = summary
+                    create_list.append(summary)
+                    continue
+                # 按读取时的汇总日期增量写入, 不覆盖其他请求的修改
+                AttendanceMonthSummary.objects.filter(id=summary.id, summary_date=summary.summary_date).update(
+                    summary_date=target_date, **month_summary_update(month_summary_delta(contribution_list)))
+                update_ids.append(summary.id)
+
+        if create_list:
+            AttendanceMonthSummary.objects.bulk_create(create_list, batch_size=500, ignore_conflicts=True)
+        # 重新读取补算后的汇总
+        if update_ids:
+            for summary in AttendanceMonthSummary.objects.filter(id__in=update_ids):
+                summary_map[summary.user_id] = summary
+
+    for user in user_list:
+        attendance_data.append(format_month_summary(user, month_datetime, len(day_list), summary_map[user.id]))
+    return attendance_data
+
+
+# 判断是否为考勤日
+def check_working_day(day:datetime.date):
+    return WorkCalendar.get_instance().is_working_day(day)
+
+
+# 考勤记录变化后增量更新月度汇总
+def update_month_summary_day(user_id, day, old_info, new_info):
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    old_contribution = month_summary_contribution(old_info)
+    new_contribution = month_summary_contribution(new_info)
+    delta = {}
+    for field in MONTH_SUMMARY_FIELDS:
+        value = (new_contribution[field] or 0) - (old_contribution[field] or 0)
+        if value:
+            delta[field] = F(field) + value
+    if not delta:
+        return
+    if not check_working_day(day):
+        return
+    # 只更新已汇总该日期的记录，未汇总的在读取时补算
+    AttendanceMonthSummary.objects.filter(user_id=user_id,
+                                          month=datetime.date(day.year, day.month, 1),
+                                          summary_date__gte=day).update(**delta)
+
+
+# 日历变化后更新月度汇总
+def update_month_summary_calendar(day:datetime.date, old_is_holiday, new_is_holiday):
+    if old_is_holiday == new_is_holiday:
+        return
+    month = datetime.date(day.year, day.month, 1)
+    summary_list = list(AttendanceMonthSummary.objects.filter(month=month,
+                                                              summary_date__gte=day).values_list('id', 'user_id'))
+    if not summary_list:
+        return
+    # 放假 -> 上班 加上当天考勤，上班 -> 放假 减去当天考勤
+    sign = 1 if new_is_holiday == 0 else -1
+    day_datetime = datetime.datetime(day.year, day.month, day.day)
+    attendance_config = get_attendance_config(datetime.datetime(month.year, month.month, 1))
+    user_list = User.objects.filter(id__in=[user_id for summary_id, user_id in summary_list])
+    info_map = summary_days_attendance(user_list, [day_datetime],
+                                       attendance_config['time_interval_tuple'],
+                                       attendance_config['out_limit'])
+    # 增量相同的汇总行合并为一次更新
+    delta_map = {}
+    for summary_id, user_id in summary_list:
+        contribution_list = [month_summary_contribution(info) for info in info_map.get(user_id, [])]
+        delta = month_summary_delta(contribution_list, sign)
+        if not delta:
+            continue
+        delta_key = tuple(sorted(delta.items()))
+        delta_map.setdefault(delta_key, []).append(summary_id)
+    for delta_key, summary_ids in delta_map.items():
+        AttendanceMonthSummary.objects.filter(id__in=summary_ids, summary_date__gte=day).update(
+            **month_summary_update(dict(delta_key)))
+
+
 # 生成统计记录
 def generate_origin_database(user, date, time_interval_tuple, out_limit):
     # 不生成未来统计
@@ -413,18 +1058,15 @@ def generate_origin_database(user, date, time_interval_tuple, out_limit):
                                                  is_revise=0).first()
     if not new_record:
         new_record = AttendanceRecord()
+    revise_record = AttendanceRecord.objects.filter(code=code,
+                                                    is_revise=1).first()
+    old_info = record_summary_info(new_record if new_record.pk else None, revise_record)
 
     # 获取门禁数据
+    start_datetime, end_datetime = compile_schedule(time_interval_tuple).day_range(date)
     record_list = []
-    admit_record = AdmitRecord.objects.filter(Q(user_id=user.id) | Q(admit_guid=user.admit_guid),
-                                              show_time__year=date.year,
-                                              show_time__month=date.month,
-                                              show_time__day=date.day).order_by("show_time")
-    for record in admit_record:
-        record_list.append({
-            'admit_type': record.admit_type,
-            'show_time': record.show_time.strftime('%H:%M:%S')
-        })
+    for record in AdmitRecord.objects.user_range(user, start_datetime, end_datetime):
+        record_list.append(format_admit_record(record))
 
     new_record.code = "{}{}".format(date.strftime('%Y%m%d'), user.id)
     new_record.date = date
@@ -434,64 +1076,63 @@ def generate_origin_database(user, date, time_interval_tuple, out_limit):
     out_duration = 0
 
     if len(record_list):
-        first_admit = datetime.datetime.strptime(record_list[0]['show_time'], '%H:%M:%S')
-        last_admit = datetime.datetime.strptime(record_list[-1]['show_time'], '%H:%M:%S')
         # 计算
-        new_record.first_admit = first_admit
-        new_record.last_admit = last_admit
-        result = check_summary_attendance(first_admit, last_admit, time_interval_tuple)
+        new_record.first_admit = record_list[0]['show_time']
+        new_record.last_admit = record_list[-1]['show_time']
+        result = compute_origin_result(record_list, time_interval_tuple, out_limit)
         new_record.is_late = result['is_late']
         new_record.is_leave_early = result['is_leave_early']
-        new_record.origin_duty_duration = result['duty_duration']
         new_record.duty_duration = result['duty_duration']
-        # 获取统计结果
-        interval_list = result['interval_list']
-        for interval in interval_list:
-            total_out = summary_out(record_list, interval[0], interval[1])
-            out_duration += total_out
-        out_duration = round(out_duration, 2)
+        out_duration = result['out_duration']
     new_record.out_duration = out_duration
     new_record.is_out_timeout = check_out_limit(out_duration, out_limit)
     new_record.is_revise = 0
     new_record.time_interval_tuple = json.dumps(time_interval_tuple)
     new_record.out_limit = out_limit
     new_record.save()
+    # 更新月度汇总
+    update_month_summary_day(user.id, date, old_info, record_summary_info(new_record, revise_record))
 
 
 
 # 生成修正记录
 def generate_revise_database(origin_record, revise_record, form_data):
+    if apply_revise_result(origin_record, revise_record, form_data):
+        revise_record.save()
+        invalidate_attendance_record()
+
+
+# 根据修正的签到、签退、外出时长重新计算修正记录(不保存), 没有修正数据时返回 False
+def apply_revise_result(origin_record, revise_record, form_data):
     first_admit = form_data.get('first_admit', None)
     last_admit = form_data.get('last_admit', None)
     out_duration = form_data.get('out_duration', None)
     # 都为空则不做修改
     if first_admit is None and last_admit is None and out_duration is None:
         logger.info('revise no data')
-        return
+        return False
     # 考勤时间
     origin_first_admit = origin_record.first_admit
     origin_last_admit = origin_record.last_admit
     # 配置信息
-    time_interval_tuple = json.loads(origin_record.time_interval_tuple)
+    schedule = compile_schedule(json.loads(origin_record.time_interval_tuple))
     out_limit = origin_record.out_limit
     # 修正时间
     if first_admit is None:
         first_admit = origin_first_admit
     if last_admit is None:
         last_admit = origin_last_admit
-    # 判断数据类型
-    if first_admit and last_admit is None:
-        first_admit = datetime.datetime.strptime(first_admit.strftime('%H:%M:%S'), '%H:%M:%S')
-        last_admit = first_admit
-    elif first_admit is None and last_admit:
-        last_admit = datetime.datetime.strptime(last_admit.strftime('%H:%M:%S'), '%H:%M:%S')
+    # 只有一个时间时签到、签退相同
+    if first_admit is None:
         first_admit = last_admit
-    elif first_admit and last_admit:
-        first_admit = datetime.datetime.strptime(first_admit.strftime('%H:%M:%S'), '%H:%M:%S')
-        last_admit = datetime.datetime.strptime(last_admit.strftime('%H:%M:%S'), '%H:%M:%S')
+    elif last_admit is None:
+        last_admit = first_admit
 
     # 计算
-    result = check_summary_attendance(first_admit, last_admit, time_interval_tuple)
+    if first_admit is None:
+        result = schedule.check(None, None)
+    else:
+        result = schedule.check(schedule.to_seconds(first_admit), schedule.to_seconds(last_admit))
     revise_record.is_late = result['is_late']
     revise_record.is_leave_early = result['is_leave_early']
     revise_record.origin_duty_duration = result['duty_duration']
@@ -500,126 +1141,130 @@ def generate_revise_database(origin_record, revise_record, form_data):
         revise_record.is_out_timeout= check_out_limit(origin_record.out_duration, out_limit)
     else:
         revise_record.is_out_timeout= check_out_limit(revise_record.out_duration, out_limit)
+    return True
+
+
+# 由原始记录复制修正记录
+def copy_revise_record(origin_record):
+    revise_record = AttendanceRecord()
+    revise_record.code = origin_record.code
+    revise_record.user_id = origin_record.user_id
+    revise_record.date = origin_record.date
+    revise_record.out_duration = None
+    revise_record.duty_duration = origin_record.duty_duration
+    revise_record.is_late = origin_record.is_late
+    revise_record.is_leave_early = origin_record.is_leave_early
+    revise_record.is_out_timeout = origin_record.is_out_timeout
+    revise_record.time_interval_tuple = origin_record.time_interval_tuple
+    revise_record.out_limit = origin_record.out_limit
+    revise_record.is_revise = 1
+    return revise_record
+
+
+# 修正记录可编辑字段
+REVISE_EDIT_FIELDS = ['first_admit', 'last_admit', 'out_duration', 'comment']
+
+# 修正记录批量更新字段
+REVISE_UPDATE_FIELDS = REVISE_EDIT_FIELDS + ['duty_duration', 'is_late', 'is_leave_early', 'is_out_timeout',
+                                             'update_user_id', 'updated_time']
+
+
+# 批量修正考勤记录
+# edit_list: [{'user_id', 'date', 'first_admit', 'last_admit', 'out_duration', 'comment'}, ...] 未传的字段不修改
+# 按顺序修正，同一人员同一天多次修正时依次生效，返回每条的结果
+def batch_revise_attendance(edit_list, update_user):
+    time_now = datetime.datetime.now()
+    today_now_datetime = datetime.datetime(time_now.year, time_now.month, time_now.day)
+    codes = set()
+    for edit in edit_list:
+        edit['code'] = "{}{}".format(edit['date'].strftime('%Y%m%d'), edit['user_id'])
+        codes.add(edit['code'])
+    user_ids = set(User.objects.filter(id__in={edit['user_id'] for edit in edit_list}).values_list('id', flat=True))
+
+    # 一次加载原始、修正记录
+    origin_map = {}
+    revise_map = {}
+    for record in AttendanceRecord.objects.filter(code__in=codes).order_by('id'):
+        if record.is_revise == 1:
+            revise_map.setdefault(record.code, record)
+        else:
+            origin_map.setdefault(record.code, record)
+
+    result_list = []
+    # 修正前的统计结果 {code: info}
+    old_info_map = {}
+    create_map = {}
+    update_map = {}
+    for edit in edit_list:
+        code = edit['code']
+        result = {
+            'user_id': edit['user_id'],
+            'date': edit['date'].strftime('%Y-%m-%d'),
+            'success': False,
+            'detail': '更新成功',
+        }
+        result_list.append(result)
+        if edit['user_id'] not in user_ids:
+            result['detail'] = '员工不存在'
+            continue
+        # 不允许修改大于等于今天日期的
+        if edit['date'] >= today_now_datetime:
+            result['detail'] = '当前日期不支持编辑'
+            continue
+        origin_record = origin_map.get(code, None)
+        if not origin_record:
+            result['detail'] = '尚未有统计数据'
+            continue
+        revise_record = revise_map.get(code, None)
+        if not revise_record:
+            revise_record = copy_revise_record(origin_record)
+            revise_map[code] = revise_record
+            create_map[code] = revise_record
+        elif code not in create_map:
+            update_map[code] = revise_record
+        if code not in old_info_map:
+            old_info_map[code] = record_summary_info(origin_record, revise_record)
+
+        form_data = {field: edit[field] for field in REVISE_EDIT_FIELDS if field in edit}
+        for field, value in form_data.items():
+            setattr(revise_record, field, value)
+        apply_revise_result(origin_record, revise_record, form_data)
+        revise_record.update_user_id = update_user.id
+        revise_record.updated_time = time_now
+        result['success'] = True
+
+    with transaction.atomic():
+        if create_map:
+            AttendanceRecord.objects.bulk_create(list(create_map.values()), batch_size=500)
+        if update_map:
+            AttendanceRecord.objects.bulk_update(list(update_map.values()), REVISE_UPDATE_FIELDS, batch_size=500)
+        # 更新月度汇总
+        for code, old_info in old_info_map.items():
+            origin_record = origin_map[code]
+            update_month_summary_day(origin_record.user_id, origin_record.date, old_info,
+                                     record_summary_info(origin_record, revise_map[code]))
+        if old_info_map:
+            invalidate_attendance_record()
+    return result_list
 
-    revise_record.save()
 
 # 判断迟到、早退、工作时间 datetime
 def check_summary_attendance(first_admit_time, last_admit_time, time_interval_tuple):
-    result = {
-        'is_late': 0,
-        'is_leave_early': 0,
-        'duty_duration': 0,
-        'interval_list': []
-    }
-
-    if last_admit_time is None and last_admit_time is None:
-        return result
-
-    if last_admit_time < first_admit_time:
-        return result
-
-    try:
-        # 有效时区
-        morning_start_time = datetime.datetime.strptime(time_interval_tuple[0][0], "%H:%M")
-        morning_end_time = datetime.datetime.strptime(time_interval_tuple[0][1], "%H:%M")
-        afternoon_start_time = datetime.datetime.strptime(time_interval_tuple[1][0], "%H:%M")
-        afternoon_end_time = datetime.datetime.strptime(time_interval_tuple[1][1], "%H:%M")
-
-        # 节点判断
-        # 打卡时区还包括迟到，早退
-        if first_admit_time > afternoon_end_time or last_admit_time < morning_start_time:
-            # 1. 签到打卡在下班后
-            # 2. 签退在上班前
-            # 缺勤 工作时间 0， 外出时间 0
-            is_late = 1
-            is_leave_early = 1
-            total_duty = 0
-            interval_list = []
-            # 添加异常判断
-            if first_admit_time <= morning_start_time:
-                is_late = 0
-        elif last_admit_time in Interval(morning_start_time, afternoon_start_time):
-            is_late = 0
-            is_leave_early = 1
-            # 在下午之前签退
-            # 下午缺勤, 只计算上午的时间
-            # 判断是否 迟到、早退
-            if first_admit_time > morning_start_time:
-                # 迟到
-                is_late = 1
-                today_start_time = first_admit_time
-            else:
-                today_start_time = morning_start_time
-            if last_admit_time < morning_end_time:
-                today_end_time = last_admit_time
-            else:
-                today_end_time = morning_end_time
-            # 计算工作时间
-            total_duty = (today_end_time - today_start_time).seconds
-            interval_list = [(today_start_time, today_end_time)]
-
-        elif first_admit_time in Interval(morning_end_time, afternoon_end_time):
-            is_late = 1
-            is_leave_early = 0
-            # 在上午结束后打卡
-            # 上午缺勤
-            if first_admit_time > afternoon_start_time:
-                # 迟到
-                today_start_time = first_admit_time
-            else:
-                today_start_time = afternoon_start_time
-
-            if last_admit_time < afternoon_end_time:
-                # 早退
-                is_leave_early = 1
-                today_end_time = last_admit_time
-            else:
-                today_end_time = afternoon_end_time
-            # 计算工作时间
-            total_duty = (today_end_time - today_start_time).seconds
-            interval_list = [(today_start_time, today_end_time)]
-
-        else:
-            is_late = 0
-            is_leave_early = 0
-            interval_list = []
-            # 正常上班
-            if first_admit_time > morning_start_time:
-                # 迟到
-                is_late = 1
-                today_start_time = first_admit_time
-            else:
-                today_start_time = morning_start_time
-
-            today_end_time = morning_end_time
-            # 单独计算上午
-            morning_total_duty = (today_end_time - today_start_time).seconds
-            interval_list.append((today_start_time, today_end_time))
-
-            # 计算下午
-            today_start_time = afternoon_start_time
-            if last_admit_time < afternoon_end_time:
-                # 早退
-                is_leave_early = 1
-                today_end_time = last_admit_time
-            else:
-                today_end_time = afternoon_end_time
-
-            afternoon_total_duty = (today_end_time - today_start_time).seconds
-            total_duty = morning_total_duty + afternoon_total_duty
-            interval_list.append((today_start_time, today_end_time))
-
-        total_duty = round(total_duty / 3600, 2)
-        result = {
-            'is_late': is_late,
-            'is_leave_early': is_leave_early,
-            'duty_duration': total_duty,
-            'interval_list': interval_list
+    if first_admit_time is None or last_admit_time is None:
+        return {
+            'is_late': 0,
+            'is_leave_early': 0,
+            'duty_duration': 0,
+            'interval_list': []
         }
-        return result
-    except Exception as e:
-        logger.error("获取考勤结果 error {}".format(e))
-        raise VException(500, "获取考勤结果错误")
+    schedule = compile_schedule(time_interval_tuple)
+    result = schedule.check(schedule.to_seconds(first_admit_time), schedule.to_seconds(last_admit_time))
+    # 区间转为 datetime, 与 summary_out 一致
+    base_datetime = datetime.datetime(1900, 1, 1)
+    result['interval_list'] = [(base_datetime + datetime.timedelta(seconds=start),
+                                base_datetime + datetime.timedelta(seconds=end))
+                               for start, end in result['interval_list']]
+    return result
 
 
 # 统计时区内出去时长
@@ -655,27 +1300,10 @@ def summary_out(admit_list, today_start_time, today_end_time):
 
 # 获取考勤日历
 def get_attendance_calendar(month_date:datetime.datetime):
-    data = []
-    year = month_date.year
-    month = month_date.month
-    # 计算当月天数
-    num_days = calendar.monthrange(year, month)[1]
-    # weekday 0-4 周一到周五    5,6 周六周天
-    for day in range(1, num_days + 1):
-        day_datetime = datetime.date(year, month, day)
-        # 判断是否有修改记录
-        record = CalendarEditRecord.objects.filter(day=day_datetime).first()
-        if record:
-            is_holiday = record.is_holiday
-        else:
-            weekday = day_datetime.weekday()
-            if weekday <= 4:
-                is_holiday = 0
-            else:
-                is_holiday = 1
-        data.append({
-            'day': day_datetime.strftime("%Y-%m-%d"),
-            'is_holiday': is_holiday
-        })
-    return data
+    return WorkCalendar.get_instance().month_calendar(month_date)
+
 
+# 日历变更
+def invalidate_attendance_calendar():
+    # 事务提交后再失效缓存，避免其他进程读到未提交的数据
+    transaction.on_commit(WorkCalendar.get_instance().invalidate)
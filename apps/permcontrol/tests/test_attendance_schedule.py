@@ -0,0 +1,139 @@
+import datetime
+from django.test import SimpleTestCase
+from core.framework.v_exception import VException
+from permcontrol.attendance_schedule import compile_schedule, DAY_SECONDS, ADMIT_IN, ADMIT_OUT
+
+STANDARD_INTERVAL = [["08:30", "12:00"], ["13:00", "17:30"]]
+THREE_SHIFT_INTERVAL = [["08:00", "12:00"], ["13:00", "17:00"], ["18:00", "20:00"]]
+NIGHT_INTERVAL = [["22:00", "02:00"], ["03:00", "06:00"]]
+
+
+def seconds(value, next_day=False):
+    hour, minute, second = [int(item) for item in value.split(':')]
+    return hour * 3600 + minute * 60 + second + (DAY_SECONDS if next_day else 0)
+
+
+def evaluate(time_interval_tuple, punch_list):
+    schedule = compile_schedule(time_interval_tuple)
+    record_list = [{'show_time': show_time, 'admit_type': admit_type} for show_time, admit_type in punch_list]
+    result = schedule.evaluate(schedule.punches(record_list))
+    return (result['is_late'], result['is_leave_early'], result['duty_duration'], result['out_duration'],
+            result['interval_list'])
+
+
+# 两个班次, 与原 check_summary_attendance / summary_out 结果一致
+class StandardScheduleTest(SimpleTestCase):
+
+    def test_compile(self):
+        schedule = compile_schedule(STANDARD_INTERVAL)
+        self.assertEqual(schedule.shifts, ((seconds('08:30:00'), seconds('12:00:00')),
+                                           (seconds('13:00:00'), seconds('17:30:00'))))
+        self.assertTrue(schedule.is_standard)
+        self.assertEqual(schedule.total_duty, 8.0)
+        self.assertEqual(schedule.window_start, 0)
+        self.assertIs(compile_schedule([tuple(interval) for interval in STANDARD_INTERVAL]), schedule)
+
+    def test_normal(self):
+        result = evaluate(STANDARD_INTERVAL, [('08:20:00', ADMIT_IN), ('10:00:00', ADMIT_OUT),
+                                              ('10:30:00', ADMIT_IN), ('17:40:00', ADMIT_OUT)])
+        self.assertEqual(result, (0, 0, 8.0, 0.5, [(seconds('08:30:00'), seconds('12:00:00')),
+                                                   (seconds('13:00:00'), seconds('17:30:00'))]))
+
+    def test_late_and_leave_early(self):
+        result = evaluate(STANDARD_INTERVAL, [('09:00:00', ADMIT_IN), ('16:00:00', ADMIT_OUT)])
+        self.assertEqual(result, (1, 1, 6.0, 0, [(seconds('09:00:00'), seconds('12:00:00')),
+                                                 (seconds('13:00:00'), seconds('16:00:00'))]))
+
+    def test_one_shift(self):
+        result = evaluate(STANDARD_INTERVAL, [('12:30:00', ADMIT_IN), ('17:30:00', ADMIT_OUT)])
+        self.assertEqual(result, (1, 0, 4.5, 0, [(seconds('13:00:00'), seconds('17:30:00'))]))
+        result = evaluate(STANDARD_INTERVAL, [('08:00:00', ADMIT_IN), ('12:30:00', ADMIT_OUT)])
+        self.assertEqual(result, (0, 1, 3.5, 0, [(seconds('08:30:00'), seconds('12:00:00'))]))
+
+    def test_absent(self):
+        self.assertEqual(evaluate(STANDARD_INTERVAL, [('18:00:00', ADMIT_IN), ('19:00:00', ADMIT_OUT)]),
+                         (1, 1, 0.0, 0, []))
+        self.assertEqual(evaluate(STANDARD_INTERVAL, [('07:00:00', ADMIT_IN), ('08:00:00', ADMIT_OUT)]),
+                         (0, 1, 0.0, 0, []))
+
+    def test_single_punch(self):
+        self.assertEqual(evaluate(STANDARD_INTERVAL, [('09:00:00', ADMIT_IN)]),
+                         (1, 1, 0.0, 0, [(seconds('09:00:00'), seconds('09:00:00'))]))
+
+    def test_boundary(self):
+        # 打卡正好在上下班时间
+        result = evaluate(STANDARD_INTERVAL, [('08:30:00', ADMIT_IN), ('12:00:00', ADMIT_OUT),
+                                              ('13:00:00', ADMIT_IN), ('17:30:00', ADMIT_OUT)])
+        self.assertEqual(result, (0, 0, 8.0, 0, [(seconds('08:30:00'), seconds('12:00:00')),
+                                                 (seconds('13:00:00'), seconds('17:30:00'))]))
+        result = evaluate(STANDARD_INTERVAL, [('12:00:00', ADMIT_IN), ('13:00:00', ADMIT_OUT)])
+        self.assertEqual(result, (1, 1, 0.0, 0, [(seconds('12:00:00'), seconds('12:00:00'))]))
+        result = evaluate(STANDARD_INTERVAL, [('17:30:00', ADMIT_IN), ('18:00:00', ADMIT_OUT)])
+        self.assertEqual(result, (1, 0, 0.0, 0, [(seconds('17:30:00'), seconds('17:30:00'))]))
+
+    def test_out_boundary(self):
+        # 外出区间只统计有效区间内的 出门 -> 进门
+        result = evaluate(STANDARD_INTERVAL, [('08:30:00', ADMIT_IN), ('12:00:00', ADMIT_OUT),
+                                              ('13:00:00', ADMIT_IN), ('15:00:00', ADMIT_OUT),
+                                              ('15:30:00', ADMIT_IN), ('17:30:00', ADMIT_OUT)])
+        self.assertEqual(result[3], 0.5)
+
+
+class ThreeShiftScheduleTest(SimpleTestCase):
+
+    def test_compile(self):
+        schedule = compile_schedule(THREE_SHIFT_INTERVAL)
+        self.assertEqual(len(schedule.shifts), 3)
+        self.assertFalse(schedule.is_standard)
+        self.assertEqual(schedule.total_duty, 10.0)
+
+    def test_evaluate(self):
+        result = evaluate(THREE_SHIFT_INTERVAL, [('07:50:00', ADMIT_IN), ('14:00:00', ADMIT_OUT),
+                                                 ('14:30:00', ADMIT_IN), ('19:00:00', ADMIT_OUT)])
+        self.assertEqual(result, (0, 1, 9.0, 0.5, [(seconds('08:00:00'), seconds('12:00:00')),
+                                                   (seconds('13:00:00'), seconds('17:00:00')),
+                                                   (seconds('18:00:00'), seconds('19:00:00'))]))
+
+    def test_boundary(self):
+        result = evaluate(THREE_SHIFT_INTERVAL, [('08:00:00', ADMIT_IN), ('20:00:00', ADMIT_OUT)])
+        self.assertEqual(result[:3], (0, 0, 10.0))
+        # 签退正好在第三班次上班时间, 不计第三班次
+        result = evaluate(THREE_SHIFT_INTERVAL, [('08:00:00', ADMIT_IN), ('18:00:00', ADMIT_OUT)])
+        self.assertEqual(result[:3], (0, 1, 8.0))
+
+
+# 跨零点的夜班
+class NightScheduleTest(SimpleTestCase):
+
+    def test_compile(self):
+        schedule = compile_schedule(NIGHT_INTERVAL)
+        self.assertEqual(schedule.shifts, ((seconds('22:00:00'), seconds('02:00:00', True)),
+                                           (seconds('03:00:00', True), seconds('06:00:00', True))))
+        self.assertFalse(schedule.is_standard)
+        self.assertEqual(schedule.total_duty, 7.0)
+        # 窗口起点为 06:00 与 22:00 的中点
+        self.assertEqual(schedule.window_start, seconds('14:00:00'))
+        self.assertEqual(schedule.day_range(datetime.date(2026, 9, 1)),
+                         (datetime.datetime(2026, 9, 1, 14), datetime.datetime(2026, 9, 2, 14)))
+
+    def test_window_boundary(self):
+        schedule = compile_schedule(NIGHT_INTERVAL)
+        self.assertEqual(schedule.to_seconds('14:00:00'), seconds('14:00:00'))
+        self.assertEqual(schedule.to_seconds('13:59:59'), seconds('13:59:59', True))
+        self.assertEqual(schedule.to_seconds(datetime.time(1, 0)), seconds('01:00:00', True))
+
+    def test_evaluate(self):
+        result = evaluate(NIGHT_INTERVAL, [('22:10:00', ADMIT_IN), ('01:00:00', ADMIT_OUT),
+                                           ('01:30:00', ADMIT_IN), ('06:05:00', ADMIT_OUT)])
+        self.assertEqual(result, (1, 0, 6.83, 0.5, [(seconds('22:10:00'), seconds('02:00:00', True)),
+                                                    (seconds('03:00:00', True), seconds('06:00:00', True))]))
+
+    def test_boundary(self):
+        result = evaluate(NIGHT_INTERVAL, [('22:00:00', ADMIT_IN), ('06:00:00', ADMIT_OUT)])
+        self.assertEqual(result[:3], (0, 0, 7.0))
+        result = evaluate(NIGHT_INTERVAL, [('22:00:00', ADMIT_IN), ('02:00:00', ADMIT_OUT)])
+        self.assertEqual(result, (0, 1, 4.0, 0, [(seconds('22:00:00'), seconds('02:00:00', True))]))
+
+    def test_too_long(self):
+        with self.assertRaises(VException):
+            compile_schedule([["08:00", "20:00"], ["21:00", "09:00"]])
@@ -0,0 +1,49 @@
+from django.contrib.auth.hashers import PBKDF2PasswordHasher as DjangoPBKDF2PasswordHasher
+from django.test import SimpleTestCase, override_settings
+from core.framework.hashers import check_password_pooled, get_hasher, get_work_factor, make_password
+
+PBKDF2_HASHERS = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
+
+
+# 登录重新加密不降低加密强度
+@override_settings(PASSWORD_HASHERS=PBKDF2_HASHERS)
+class RehashWorkFactorTest(SimpleTestCase):
+
+    def encode(self, iterations):
+        hasher = get_hasher()
+        return hasher.encode('secret', hasher.salt(), iterations)
+
+    def check(self, encoded, password='secret'):
+        updated = []
+        is_correct = check_password_pooled(password, encoded, updated.append)
+        return is_correct, updated
+
+    def test_default_iterations(self):
+        # 未覆盖参数时不低于 django 默认值
+        self.assertGreaterEqual(get_hasher().iterations, DjangoPBKDF2PasswordHasher.iterations)
+
+    @override_settings(PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': 2000}})
+    def test_rehash_raises_iterations(self):
+        is_correct, updated = self.check(self.encode(1000))
+        self.assertTrue(is_correct)
+        self.assertEqual(len(updated), 1)
+        self.assertEqual(get_work_factor(updated[0]), ('pbkdf2_sha256', 2000))
+        self.assertEqual(self.check(updated[0]), (True, []))
+
+    @override_settings(PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': 2000}})
+    def test_rehash_never_lowers_iterations(self):
+        for iterations in [2000, 3000, 260000]:
+            is_correct, updated = self.check(self.encode(iterations))
+            self.assertTrue(is_correct)
+            self.assertEqual(updated, [])
+
+    @override_settings(PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': 2000}})
+    def test_wrong_password(self):
+        self.assertEqual(self.check(self.encode(1000), 'other'), (False, []))
+
+    @override_settings(PASSWORD_HASHERS=PBKDF2_HASHERS + ['django.contrib.auth.hashers.MD5PasswordHasher'],
+                       PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': 2000}})
+    def test_rehash_other_algorithm(self):
+        is_correct, updated = self.check(make_password('secret', hasher='md5'))
+        self.assertTrue(is_correct)
+        self.assertEqual(get_work_factor(updated[0]), ('pbkdf2_sha256', 2000))
@@ -1,5 +1,3 @@
-import json
-import time
 import calendar
 
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,19 +6,26 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
 from django.db import transaction
-from django.db.models import Q
 
 # swagger
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from config.config import WOModuleConfig
 from core.framework.v_exception import VException
-from core.framework.hashers import make_password
+from core.framework.hashers import check_password_pooled, make_password_pooled
 from core.utils.functions import generate_token
 from permcontrol.filter import PermissionFilter, RoleFilter, DepartmentFilter
-from permcontrol.models import Token, AdmitRecord
+from permcontrol.models import Token
 from permcontrol.service import cache_user_expire_token, clean_user_expire_token, clean_cache_role_permission, \
-    clean_user_related_data, summary_database_function, generate_revise_database, get_attendance_calendar,edit_attendance_config, get_attendance_config
+    clean_user_related_data, summary_database_function, generate_revise_database, get_attendance_calendar,edit_attendance_config, get_attendance_config, \
+    read_month_summary, record_summary_info, get_attendance_user_queryset, update_month_summary_day, update_month_summary_calendar, \
+    invalidate_attendance_calendar, summary_day_attendance, is_abnormal_info, ABNORMAL_FIELDS, copy_revise_record, \
+    batch_revise_attendance, invalidate_permission_index, get_permission_tree, invalidate_role_permission, \
+    revoke_user_tokens, invalidate_attendance_user
+from permcontrol.admit_event import parse_face_event, push_face_event
+from permcontrol.attendance_live import summary_live_attendance
+from permcontrol.attendance_department import summary_department_attendance, department_subtree_map
+from permcontrol.attendance_export import iter_day_summary_rows, iter_month_summary_rows, export_response, \
+    DAY_EXPORT_COLUMNS, MONTH_EXPORT_COLUMNS, EXPORT_FILE_TYPES
 from core.framework.ordering_filter import CustomStandardOrdering, StandardOrdering
 from permcontrol.serializers import *
 from common.models import CustomField
@@ -44,6 +49,9 @@ class UserBasicView(viewsets.GenericViewSet):
 
     authentication_classes = ()
 
+    # 登录单独限流
+    throttle_scope = {'login_handler': 'login'}
+
     @swagger_auto_schema(
         operation_description="登陆获取token",
         request_body=openapi.Schema(
@@ -90,6 +98,7 @@ class UserBasicView(viewsets.GenericViewSet):
         user.save()
         # 缓存token信息
         cache_user_expire_token(token.key, user.id, time_now)
+        clean_cache_role_permission([user.id])
         return Response({"detail": "登录成功", "data": token.key}, status=status.HTTP_200_OK)
 
 
@@ -114,18 +123,24 @@ class PermissionView(mixins.ListModelMixin,
         return PermissionGroup.objects.all()
 
     @swagger_auto_schema(
-        operation_description="权限列表",
+        operation_description="权限列表(嵌套树, children 为下级权限; type 筛选时节点挂在最近的同类型上级下; parent_id=0 为根节点)",
         query_serializer=None,
         responses={200: openapi.Response('description', PermissionSerializer)},
         tags=['role_permission'],
     )
     def list(self, request, *args, **kwargs):
+        # 嵌套权限树, 由权限索引生成
         try:
-            queryset = self.filter_queryset(self.get_queryset())
+            parent_id = request.query_params.get('parent_id', None)
+            parent_id = int(parent_id) if parent_id else None
+            permission_type = request.query_params.get('type', None)
+            permission_type = int(permission_type) if permission_type else None
         except Exception as e:
             raise VException(500, '没有数据')
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({'data': serializer.data}, status=status.HTTP_200_OK)
+        # 同级节点排序
+        ordering = StandardOrdering().get_ordering(request, self.get_queryset(), self)
+        data = get_permission_tree(parent_id, permission_type, ordering)
+        return Response({'data': data}, status=status.HTTP_200_OK)
 
 
 '''
@@ -208,6 +223,7 @@ class RoleView(mixins.CreateModelMixin,
         role.name = form_data['name']
         role.create_user_id = request.user.id
         role.save()
+        invalidate_permission_index()
         serializer = RoleInfoSerializer(role)
         return Response({"detail": "创建成功", "data": serializer.data}, status=status.HTTP_200_OK)
 
@@ -230,13 +246,9 @@ class RoleView(mixins.CreateModelMixin,
         serializer.is_valid(raise_exception=True)
         role = serializer.save(update_user_id=request.user.id)
         ser = RoleInfoSerializer(role)
+        invalidate_permission_index()
         # 更新权限缓存
-        user_list = User.objects.filter(role_id=instance.id,
-                                        is_delete=0).all()
-        id_list = []
-        for user in user_list:
-            id_list.append(user.id)
-        clean_cache_role_permission(id_list)
+        invalidate_role_permission(instance.id)
         return Response({"detail": "更新成功", "data": ser.data}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -274,6 +286,7 @@ class RoleView(mixins.CreateModelMixin,
         instance.is_delete = 1
         instance.update_user_id = request.user.id
         instance.save()
+        invalidate_permission_index()
         return Response({"detail": "删除成功"}, status=status.HTTP_200_OK)
 
 
@@ -454,22 +467,21 @@ class PersonalInfoView(viewsets.GenericViewSet):
         serializer.is_valid(raise_exception=True)
         # 密码校验
         form_data = serializer.validated_data
-        user = request.user
+        # request.user 为缓存的快照, 不含密码
+        user = User.objects.get(id=request.user.id)
         new_password = form_data['new_password']
         old_password = form_data['old_password']
         # 密码校验
-        pwd_valid = check_password(old_password, user.password)
+        pwd_valid = check_password_pooled(old_password, user.password)
 
         if not pwd_valid:
             raise VException(500, "原密码错误")
         with transaction.atomic():
-            user.password = make_password(new_password)
-            user.save()
+            user.password = make_password_pooled(new_password)
+            user.save(update_fields=['password', 'updated_time'])
             # 删除之前的token（pc, mobile）
-            token_list = Token.objects.filter(user_id=user.id).all()
-            for token in token_list:
-                clean_user_expire_token(token.key)
-                token.delete()
+            revoke_user_tokens([user.id])
+        clean_cache_role_permission([user.id])
         return Response({"detail": "修改密码成功"}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -505,10 +517,12 @@ class PersonalInfoView(viewsets.GenericViewSet):
     )
     @action(methods=['put'], detail=False, url_path='edit')
     def person_edit(self, request, *args, **kwargs):
-        user = request.user
+        # request.user 为缓存的快照, 按数据库记录修改
+        user = User.objects.get(id=request.user.id)
         serializer = PersonEditSerializer(instance=user, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        clean_cache_role_permission([user.id])
         return Response({"detail": "修改成功", "data": serializer.data}, status=status.HTTP_200_OK)
 
 
@@ -534,7 +548,7 @@ class UserView(mixins.CreateModelMixin,
 
     module_perms = ['department_user']
 
-    edit_perms = ['reset_password', 'quit', 'sync_database']
+    edit_perms = ['reset_password', 'quit', 'sync_database', 'revoke_token']
 
     def get_queryset(self):
         return User.objects.filter(is_delete=0).all()
@@ -603,13 +617,14 @@ class UserView(mixins.CreateModelMixin,
         serializer.is_valid(raise_exception=True)
         with transaction.atomic():
             user = serializer.save(create_user_id=request.user.id,
-                                   password=make_password('111111'))
+                                   password=make_password_pooled('111111'))
             # 添加人事信息
             record = PersonnelRecord()
             record.user_id = user.id
             record.type = 1
             record.create_user_id = request.user.id
             record.save()
+            invalidate_attendance_user()
         return Response({"detail": "创建成功, 默认密码：111111", "data": serializer.data}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -641,6 +656,8 @@ class UserView(mixins.CreateModelMixin,
         serializer = UserSerializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         serializer.save(update_user_id=request.user.id)
+        # 部门、离职日期可能变化
+        invalidate_attendance_user()
         # 清除权限缓存
         clean_cache_role_permission([instance.id])
         return Response({"detail": "更新成功", "data": serializer.data}, status=status.HTTP_200_OK)
@@ -682,14 +699,12 @@ class UserView(mixins.CreateModelMixin,
     def reset_password(self, request, *args, **kwargs):
         instance = self.get_object()
         with transaction.atomic():
-            instance.password = make_password('111111')
+            instance.password = make_password_pooled('111111')
             instance.update_user_id = request.user.id
             instance.save()
             # 删除token记录
-            token_list = Token.objects.filter(user_id=instance.id).all()
-            for token in token_list:
-                clean_user_expire_token(token.key)
-                token.delete()
+            revoke_user_tokens([instance.id])
+        clean_cache_role_permission([instance.id])
         return Response({"detail": "重置成功，密码为：111111"}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -727,10 +742,8 @@ class UserView(mixins.CreateModelMixin,
                 record.comment = form_date['comment']
             record.save()
             # 删除token记录
-            token_list = Token.objects.filter(user_id=instance.id).all()
-            for token in token_list:
-                clean_user_expire_token(token.key)
-                token.delete()
+            revoke_user_tokens([instance.id])
+            invalidate_attendance_user()
         # 清除关联数据
         clean_user_related_data(instance.id)
         # 清除权限缓存
@@ -752,8 +765,40 @@ class UserView(mixins.CreateModelMixin,
         instance.is_delete = 1
         instance.update_user_id = request.user.id
         instance.save()
+        invalidate_attendance_user()
+        clean_cache_role_permission([instance.id])
         return Response({"detail": "彻底删除用户成功"}, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(
+        operation_description="批量注销登录(按角色、部门, 部门包含下级部门), count 为注销的登录数",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=[],
+            properties={
+                'role_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='角色id'),
+                'department_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='部门id(含下级部门)'),
+            },
+        ),
+        tags=['department_user'],
+    )
+    @action(methods=['post'], detail=False, url_path='revoke_token')
+    def revoke_token(self, request, *args, **kwargs):
+        serializer = RevokeTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        form_data = serializer.validated_data
+        queryset = User.objects.filter(is_delete=0)
+        if form_data.get('role_id', None) is not None:
+            queryset = queryset.filter(role_id=form_data['role_id'])
+        if form_data.get('department_id', None) is not None:
+            # 部门及全部下级部门
+            subtree_map = department_subtree_map(list(Department.objects.filter(is_delete=0)))
+            if form_data['department_id'] not in subtree_map:
+                raise VException(500, '部门不存在')
+            queryset = queryset.filter(department_id__in=subtree_map[form_data['department_id']])
+        # 注销的登录(token)数
+        count = revoke_user_tokens(list(queryset.values_list('id', flat=True)))
+        return Response({"detail": "注销成功", "data": {"count": count}}, status=status.HTTP_200_OK)
+
 
     @swagger_auto_schema(
         operation_description="同步系统字段",
@@ -824,35 +869,10 @@ class WOServiceView(viewsets.GenericViewSet):
         event_msg = request.data.get('eventMsg', "")
         if event_msg:
             try:
-                # 解码
-                msg_dict = json.loads(event_msg)
-                result = int(msg_dict['result'])
-                # 识别为注册用户
-                if result == 1:
-                    user_id = None
-                    user = User.objects.filter(admit_guid=msg_dict['admitGuid'],
-                                               is_delete=0).first()
-                    if user:
-                        user_id = user.id
-                    admit_record = AdmitRecord()
-                    admit_record.admit_name = msg_dict['admitName']
-                    admit_record.user_id = user_id
-                    admit_record.admit_guid = msg_dict['admitGuid']
-                    admit_record.device_name = msg_dict['deviceName']
-                    admit_record.device_no = msg_dict['deviceNo']
-                    if msg_dict['deviceNo'] in WOModuleConfig.in_device_no:
-                        admit_record.admit_type = 0
-                    elif msg_dict['deviceNo'] in WOModuleConfig.out_device_no:
-                        admit_record.admit_type = 1
-                    else:
-                        admit_record.admit_type = 2
-                    # 1:人像识别, 2:刷卡识别 ,3:人卡合一 4,人证比对 7:密码识别 8 二维码识别
-                    admit_record.rec_mode = int(msg_dict['recMode'])
-                    admit_record.file_path = msg_dict.get('filePath', '')
-                    show_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(msg_dict['showTime'] / 1000)))
-                    show_datetime = datetime.datetime.strptime(show_time, "%Y-%m-%d %H:%M:%S")
-                    admit_record.show_time = show_datetime
-                    admit_record.save()
+                # 解码后写入队列, 由 consume_admit_event 批量入库
+                event = parse_face_event(event_msg)
+                if event:
+                    push_face_event(event)
             except Exception as e:
                 logger.error('门禁回调数据异常, error {}'.format(e))
 
@@ -872,15 +892,24 @@ class AttendanceView(viewsets.GenericViewSet):
 
     module_perms = ['attendance']
 
-    edit_perms = ['edit_record', 'edit_calendar', 'edit_config']
+    edit_perms = ['edit_record', 'batch_edit_record', 'edit_calendar', 'edit_config']
+
+    retrieve_perms = ['summary_attendance', 'get_calendar', 'month_summary', 'get_config', 'export_summary',
+                      'export_month_summary', 'live_attendance', 'department_summary']
 
-    retrieve_perms = ['summary_attendance', 'get_calendar', 'month_summary', 'get_config']
+    # 考勤统计排序
+    ordering = ('id',)
+
+    ordering_fields = ('id', 'job_number', 'display_name', 'department_id')
 
     @swagger_auto_schema(
         operation_description="查看考勤统计",
         manual_parameters=[
             openapi.Parameter(name='date', in_=openapi.IN_QUERY, description="日期(Y-m-d)", type=openapi.TYPE_STRING),
-            openapi.Parameter(name='user_id', in_=openapi.IN_QUERY, description="用户id", type=openapi.TYPE_NUMBER)],
+            openapi.Parameter(name='user_id', in_=openapi.IN_QUERY, description="用户id", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(name='department_id', in_=openapi.IN_QUERY, description="部门id", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(name='abnormal', in_=openapi.IN_QUERY, description="异常状态(late 迟到, leave_early 早退, out_timeout 外出过长, abnormal 任一异常)", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='ordering', in_=openapi.IN_QUERY, description="排序(id, job_number, display_name, department_id)", type=openapi.TYPE_STRING)],
         responses={200: openapi.Response('description')},
         tags=['attendance'],
     )
@@ -889,6 +918,8 @@ class AttendanceView(viewsets.GenericViewSet):
         # 查看统计
         today_date = request.GET.get('date', None)
         user_id = request.GET.get('user_id', None)
+        department_id = request.GET.get('department_id', None)
+        abnormal = request.GET.get('abnormal', None)
         size = request.GET.get('size', 10)
         page = request.GET.get('page', 1)
 
@@ -901,6 +932,18 @@ class AttendanceView(viewsets.GenericViewSet):
             today_date = datetime.datetime.strptime(today_date, "%Y-%m-%d")
         except:
             raise VException(500, '日期格式错误')
+        if abnormal is not None and abnormal not in ABNORMAL_FIELDS:
+            raise VException(500, '异常状态参数错误')
+        # 分页参数
+        try:
+            per_page_count = int(size)
+            current_page = int(page)
+        except:
+            raise VException(500, '分页参数错误')
+        if per_page_count < 1 or current_page < 1:
+            raise VException(500, '分页参数错误')
+        start = (current_page - 1) * per_page_count
+        end = current_page * per_page_count
 
         # 考勤配置
         attendance_config = get_attendance_config(today_date)
@@ -908,30 +951,75 @@ class AttendanceView(viewsets.GenericViewSet):
         out_limit = attendance_config['out_limit']
         exclude_user = attendance_config['exclude_user']
 
-        admit_summary = []
         # 没有人员参数，则显示所有人
         if user_id is None:
             # 查找未离职的人员考勤记录
-            user_queryset = User.objects.filter(Q(quit_date__isnull=True) | Q(quit_date__gt=today_date),
-                                                ~Q(id__in=exclude_user),
-                                                Q(status=1)).all()
-            for user in user_queryset:
-                info = summary_database_function(user, today_date, time_interval_tuple, out_limit)
-                admit_summary.append(info)
+            user_queryset = get_attendance_user_queryset(today_date, exclude_user)
+            if department_id is not None:
+                try:
+                    user_queryset = user_queryset.filter(department_id=int(department_id))
+                except ValueError:
+                    raise VException(500, '部门参数错误')
+            # 数据库排序分页，只计算当前页
+            user_queryset = StandardOrdering().filter_queryset(request, user_queryset, self)
+            count, admit_summary = summary_day_attendance(user_queryset, today_date, time_interval_tuple, out_limit,
+                                                          start, end, abnormal)
         else:
             user = User.objects.filter(id=user_id).first()
             if not user:
                 raise VException(500, '员工不存在')
             info = summary_database_function(user, today_date, time_interval_tuple, out_limit)
-            admit_summary.append(info)
-        # 列表分页
-        per_page_count = int(size)
-        current_page = int(page)
+            admit_summary = [info]
+            if abnormal is not None and not is_abnormal_info(info, abnormal):
+                admit_summary = []
+            count = len(admit_summary)
+            admit_summary = admit_summary[start:end]
+        data = {
+            'count': count,
+            'results': admit_summary
+        }
+        return Response({"data": data}, status=status.HTTP_200_OK)
+
+
+    @swagger_auto_schema(
+        operation_description="当天实时考勤",
+        manual_parameters=[
+            openapi.Parameter(name='department_id', in_=openapi.IN_QUERY, description="部门id", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(name='ordering', in_=openapi.IN_QUERY, description="排序(id, job_number, display_name, department_id)", type=openapi.TYPE_STRING)],
+        responses={200: openapi.Response('description')},
+        tags=['attendance'],
+    )
+    @action(methods=['get'], detail=False, url_path='live')
+    def live_attendance(self, request, *args, **kwargs):
+        department_id = request.GET.get('department_id', None)
+        size = request.GET.get('size', 10)
+        page = request.GET.get('page', 1)
+        try:
+            per_page_count = int(size)
+            current_page = int(page)
+        except:
+            raise VException(500, '分页参数错误')
+        if per_page_count < 1 or current_page < 1:
+            raise VException(500, '分页参数错误')
         start = (current_page - 1) * per_page_count
         end = current_page * per_page_count
+
+        time_now = datetime.datetime.now()
+        today_datetime = datetime.datetime(time_now.year, time_now.month, time_now.day)
+        attendance_config = get_attendance_config(today_datetime)
+        time_interval_tuple = attendance_config['time_interval_tuple']
+        out_limit = attendance_config['out_limit']
+        exclude_user = attendance_config['exclude_user']
+        user_queryset = get_attendance_user_queryset(today_datetime, exclude_user)
+        if department_id is not None:
+            try:
+                user_queryset = user_queryset.filter(department_id=int(department_id))
+            except ValueError:
+                raise VException(500, '部门参数错误')
+        user_queryset = StandardOrdering().filter_queryset(request, user_queryset, self)
         data = {
-            'count': len(admit_summary),
-            'results': admit_summary[start:end]
+            'count': user_queryset.count(),
+            'results': summary_live_attendance(user_queryset[start:end], time_interval_tuple, out_limit)
         }
         return Response({"data": data}, status=status.HTTP_200_OK)
 
@@ -981,30 +1069,53 @@ class AttendanceView(viewsets.GenericViewSet):
                                                         is_revise=1).first()
         if not revise_record:
             # 复制原打卡记录
-            revise_record = AttendanceRecord()
-            revise_record.code = code
-            revise_record.user_id = user_id
-            revise_record.date = date
-            revise_record.out_duration = None
-            revise_record.duty_duration = origin_record.duty_duration
-            revise_record.is_late = origin_record.is_late
-            revise_record.is_leave_early = origin_record.is_leave_early
-            revise_record.is_out_timeout = origin_record.is_out_timeout
-            revise_record.time_interval_tuple = origin_record.time_interval_tuple
-            revise_record.out_limit = origin_record.out_limit
-            revise_record.is_revise = 1
+            revise_record = copy_revise_record(origin_record)
             revise_record.save()
 
+        old_info = record_summary_info(origin_record, revise_record)
         ser = EditAttendanceSerializer(instance=revise_record, data=request.data, partial=True)
         ser.is_valid(raise_exception=True)
         form_data = ser.validated_data
         ser.save()
         # 重新生成判断数据
         generate_revise_database(origin_record, revise_record, form_data)
+        # 更新月度汇总
+        update_month_summary_day(user_id, date, old_info, record_summary_info(origin_record, revise_record))
         return Response({"detail": "更新成功"}, status=status.HTTP_200_OK)
 
 
 
+    @swagger_auto_schema(
+        operation_description="批量修正考勤数据, 返回每条的修正结果",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['records'],
+            properties={
+                'records': openapi.Schema(type=openapi.TYPE_ARRAY, description='修正数组, 单次最多500条', items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    required=['user_id', 'date'],
+                    properties={
+                        'user_id': openapi.Schema(type=openapi.TYPE_NUMBER, description='员工id'),
+                        'date': openapi.Schema(type=openapi.TYPE_STRING, description='日期'),
+                        'first_admit': openapi.Schema(type=openapi.TYPE_STRING, description='签到时间'),
+                        'last_admit': openapi.Schema(type=openapi.TYPE_STRING, description='签退时间'),
+                        'out_duration': openapi.Schema(type=openapi.TYPE_NUMBER, description='外出时长'),
+                        'comment': openapi.Schema(type=openapi.TYPE_STRING, description='备注'),
+                    },
+                )),
+            },
+        ),
+        tags=['attendance'],
+    )
+    @action(methods=['put'], detail=False, url_path='batch_edit_record')
+    def batch_edit_record(self, request, *args, **kwargs):
+        serializer = BatchEditAttendanceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result_list = batch_revise_attendance(serializer.validated_data['records'], request.user)
+        return Response({"detail": "更新成功", "data": result_list}, status=status.HTTP_200_OK)
+
+
+
     @swagger_auto_schema(
         operation_description="编辑考勤日历",
         request_body=openapi.Schema(
@@ -1027,15 +1138,20 @@ class AttendanceView(viewsets.GenericViewSet):
         comment = form_data.get('comment', None)
         record = CalendarEditRecord.objects.filter(day=day).first()
         if not record:
+            old_is_holiday = 0 if day.weekday() <= 4 else 1
             record = CalendarEditRecord()
             record.day = day
             record.create_user_id = request.user.id
         else:
+            old_is_holiday = record.is_holiday
             record.update_user_id = request.user.id
         if not comment is None:
             record.comment = comment
         record.is_holiday = is_holiday
         record.save()
+        invalidate_attendance_calendar()
+        # 更新月度汇总
+        update_month_summary_calendar(day, old_is_holiday, is_holiday)
 
         data = {
             'day': day.strftime("%Y-%m-%d"),
@@ -1067,6 +1183,43 @@ class AttendanceView(viewsets.GenericViewSet):
         return Response({"data": data}, status=status.HTTP_200_OK)
 
 
+    @swagger_auto_schema(
+        operation_description="部门考勤汇总, 上级部门包含下级部门",
+        manual_parameters=[
+            openapi.Parameter(name='start_date', in_=openapi.IN_QUERY, description="开始日期(Y-m-d), 默认当月1日", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='end_date', in_=openapi.IN_QUERY, description="结束日期(Y-m-d), 默认昨天", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='period', in_=openapi.IN_QUERY, description="统计周期(week 周, month 月), 默认week", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='department_id', in_=openapi.IN_QUERY, description="部门id", type=openapi.TYPE_NUMBER)],
+        responses={200: openapi.Response('description')},
+        tags=['attendance'],
+    )
+    @action(methods=['get'], detail=False, url_path='department_summary')
+    def department_summary(self, request, *args, **kwargs):
+        start_date = request.GET.get('start_date', None)
+        end_date = request.GET.get('end_date', None)
+        period = request.GET.get('period', 'week')
+        department_id = request.GET.get('department_id', None)
+        today = datetime.date.today()
+        try:
+            if start_date is None:
+                start_date = datetime.date(today.year, today.month, 1)
+            else:
+                start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+            if end_date is None:
+                end_date = today - datetime.timedelta(days=1)
+            else:
+                end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
+        except:
+            raise VException(500, '日期格式错误')
+        if department_id is not None:
+            try:
+                department_id = int(department_id)
+            except ValueError:
+                raise VException(500, '部门参数错误')
+        data = summary_department_attendance(start_date, end_date, period, department_id)
+        return Response({"data": data}, status=status.HTTP_200_OK)
+
+
     @swagger_auto_schema(
         operation_description="月度统计结果",
         manual_parameters=[
@@ -1096,64 +1249,10 @@ class AttendanceView(viewsets.GenericViewSet):
         out_limit = attendance_config['out_limit']
         exclude_user = attendance_config['exclude_user']
         # 获取考勤人员
-        attendance_data = []
-        user_queryset = User.objects.filter(Q(quit_date__isnull=True) | Q(quit_date__gt=today_datetime),
-                                            ~Q(id__in=exclude_user),
-                                            Q(status=1)).all()
-        for user in user_queryset:
-            duty_days = 0
-            user_attendance_info = {
-                'user_id': user.id,
-                'name': user.display_name,
-                'job_number': user.job_number,
-                'date': today_datetime.strftime('%Y-%m'),
-                # 应打卡天数
-                'attendance_days': duty_days,
-                # 出勤天数
-                'duty_days': 0,
-                # 出勤时长
-                'duty_duration_hours': 0,
-                # 外出时长
-                'out_duration_hours': 0,
-                # 异常天数
-                'abnormal_days': 0,
-                'late_days': 0,
-                'leave_early_days': 0,
-                'out_timeout_days': 0,
-            }
-
-            # 考勤统计
-            for calendar_info in calendar_data:
-                calendar_day = datetime.datetime.strptime(calendar_info['day'], "%Y-%m-%d")
-                # 今日和假期不纳入统计
-                today_now_datetime = datetime.datetime(time_now.year, time_now.month, time_now.day)
-                if calendar_day >= today_now_datetime or calendar_info['is_holiday'] == 1:
-                    continue
-                duty_days += 1
-                info = summary_database_function(user, calendar_day,time_interval_tuple, out_limit)
-                result_out_duration = info['result_out_duration']
-                result_duty_duration = info['result_duty_duration']
-                is_late = info['is_late']
-                is_leave_early = info['is_leave_early']
-                is_out_timeout = info['is_out_timeout']
-                if result_duty_duration > 0:
-                    user_attendance_info['duty_days'] += 1
-                if is_late == 1:
-                    user_attendance_info['late_days'] += 1
-                if is_leave_early == 1:
-                    user_attendance_info['leave_early_days'] += 1
-                if is_out_timeout == 1:
-                    user_attendance_info['out_timeout_days'] += 1
-                if is_late == 1 or is_leave_early == 1 or is_out_timeout == 1:
-                    user_attendance_info['abnormal_days'] += 1
-
-                user_attendance_info['duty_duration_hours'] += result_duty_duration
-                user_attendance_info['out_duration_hours'] += result_out_duration
-
-            user_attendance_info['duty_duration_hours'] = round(user_attendance_info['duty_duration_hours'], 2)
-            user_attendance_info['out_duration_hours'] = round(user_attendance_info['out_duration_hours'], 2)
-            user_attendance_info['attendance_days'] = duty_days
-            attendance_data.append(user_attendance_info)
+        user_queryset = get_attendance_user_queryset(today_datetime, exclude_user)
+        # 读取月度汇总
+        attendance_data = read_month_summary(user_queryset, today_datetime, calendar_data,
+                                             time_interval_tuple, out_limit)
 
         # 列表分页
         per_page_count = int(size)
@@ -1167,6 +1266,90 @@ class AttendanceView(viewsets.GenericViewSet):
 
         return Response({"data": data}, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(
+        operation_description="导出考勤统计",
+        manual_parameters=[
+            openapi.Parameter(name='date', in_=openapi.IN_QUERY, description="日期(Y-m-d)", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='department_id', in_=openapi.IN_QUERY, description="部门id", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(name='abnormal', in_=openapi.IN_QUERY, description="异常状态(late 迟到, leave_early 早退, out_timeout 外出过长, abnormal 任一异常)", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='file_type', in_=openapi.IN_QUERY, description="文件类型(xlsx, csv)", type=openapi.TYPE_STRING)],
+        tags=['attendance'],
+    )
+    @action(methods=['get'], detail=False, url_path='export_summary')
+    def export_summary(self, request, *args, **kwargs):
+        today_date = request.GET.get('date', None)
+        department_id = request.GET.get('department_id', None)
+        abnormal = request.GET.get('abnormal', None)
+        file_type = request.GET.get('file_type', 'xlsx')
+
+        if today_date is None:
+            time_now = datetime.datetime.now()
+            today_date = time_now.strftime('%Y-%m-%d')
+        try:
+            today_date = datetime.datetime.strptime(today_date, "%Y-%m-%d")
+        except:
+            raise VException(500, '日期格式错误')
+        if abnormal is not None and abnormal not in ABNORMAL_FIELDS:
+            raise VException(500, '异常状态参数错误')
+        if file_type not in EXPORT_FILE_TYPES:
+            raise VException(500, '文件类型错误')
+
+        # 考勤配置
+        attendance_config = get_attendance_config(today_date)
+        time_interval_tuple = attendance_config['time_interval_tuple']
+        out_limit = attendance_config['out_limit']
+        exclude_user = attendance_config['exclude_user']
+        user_queryset = get_attendance_user_queryset(today_date, exclude_user)
+        if department_id is not None:
+            try:
+                user_queryset = user_queryset.filter(department_id=int(department_id))
+            except ValueError:
+                raise VException(500, '部门参数错误')
+        rows = iter_day_summary_rows(user_queryset, today_date, time_interval_tuple, out_limit, abnormal)
+        file_name = 'attendance_{}'.format(today_date.strftime('%Y-%m-%d'))
+        return export_response(rows, DAY_EXPORT_COLUMNS, file_type, file_name)
+
+
+    @swagger_auto_schema(
+        operation_description="导出月度统计",
+        manual_parameters=[
+            openapi.Parameter(name='date', in_=openapi.IN_QUERY, description="日期(%Y-%m)", type=openapi.TYPE_STRING),
+            openapi.Parameter(name='department_id', in_=openapi.IN_QUERY, description="部门id", type=openapi.TYPE_NUMBER),
+            openapi.Parameter(name='file_type', in_=openapi.IN_QUERY, description="文件类型(xlsx, csv)", type=openapi.TYPE_STRING)],
+        tags=['attendance'],
+    )
+    @action(methods=['get'], detail=False, url_path='export_month_summary')
+    def export_month_summary(self, request, *args, **kwargs):
+        today_date = request.GET.get('date', None)
+        department_id = request.GET.get('department_id', None)
+        file_type = request.GET.get('file_type', 'xlsx')
+
+        time_now = datetime.datetime.now()
+        if today_date is None:
+            today_date = time_now.strftime("%Y-%m")
+        try:
+            today_datetime = datetime.datetime.strptime(today_date, "%Y-%m")
+        except:
+            raise VException(500, '输入的日期格式错误')
+        if file_type not in EXPORT_FILE_TYPES:
+            raise VException(500, '文件类型错误')
+
+        calendar_data = get_attendance_calendar(today_datetime)
+        attendance_config = get_attendance_config(today_datetime)
+        time_interval_tuple = attendance_config['time_interval_tuple']
+        out_limit = attendance_config['out_limit']
+        exclude_user = attendance_config['exclude_user']
+        user_queryset = get_attendance_user_queryset(today_datetime, exclude_user)
+        if department_id is not None:
+            try:
+                user_queryset = user_queryset.filter(department_id=int(department_id))
+            except ValueError:
+                raise VException(500, '部门参数错误')
+        rows = iter_month_summary_rows(user_queryset, today_datetime, calendar_data, time_interval_tuple, out_limit)
+        file_name = 'attendance_{}'.format(today_datetime.strftime('%Y-%m'))
+        return export_response(rows, MONTH_EXPORT_COLUMNS, file_type, file_name)
+
+
     @swagger_auto_schema(
         operation_description="编辑考勤配置",
         request_body=openapi.Schema(
@@ -0,0 +1,169 @@
+'''
+考勤日历
+
+每年的假期按年内天数存为位图(bit = 1 为放假)，一次查询加载全年的日历编辑记录。
+位图缓存在进程内和 redis 中，redis 中的版本号在编辑日历后递增，各进程据此失效本地缓存。
+'''
+import time
+import datetime
+import threading
+from core.utils.redis_client import RedisClientInstance
+from permcontrol.models import CalendarEditRecord
+
+import logging
+
+logger = logging.getLogger("django")
+
+# 日历版本
+CALENDAR_VERSION_KEY = 'work_calendar:version'
+# 年度假期位图 year:version
+CALENDAR_CACHE_KEY = 'work_calendar:holiday:{}:{}'
+# 位图缓存时间
+CALENDAR_CACHE_EXPIRE = 7 * 24 * 60 * 60
+# 本地校验版本号间隔(秒)
+VERSION_CHECK_INTERVAL = 5
+
+
+# 年内第几天(0开始)
+def day_of_year(day):
+    return day.timetuple().tm_yday - 1
+
+
+# 根据日历编辑记录生成年度假期位图
+def build_holiday_bits(year):
+    bits = 0
+    day = datetime.date(year, 1, 1)
+    while day.year == year:
+        # weekday 0-4 周一到周五    5,6 周六周天
+        if day.weekday() > 4:
+            bits |= 1 << day_of_year(day)
+        day += datetime.timedelta(days=1)
+    # 同一天有多条记录时以第一条为准
+    edited = set()
+    queryset = CalendarEditRecord.objects.filter(day__gte=datetime.date(year, 1, 1),
+                                                 day__lt=datetime.date(year + 1, 1, 1)).order_by('id')
+    for record in queryset.values_list('day', 'is_holiday'):
+        day, is_holiday = record
+        if day in edited:
+            continue
+        edited.add(day)
+        if is_holiday:
+            bits |= 1 << day_of_year(day)
+        else:
+            bits &= ~(1 << day_of_year(day))
+    return bits
+
+
+class WorkCalendar(object):
+    # 线程锁
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.version = None
+        self.checked_time = 0
+        self.year_map = {}
+
+    @classmethod
+    def get_instance(cls):
+        if not hasattr(WorkCalendar, '_instance'):
+            with WorkCalendar._instance_lock:
+                if not hasattr(WorkCalendar, '_instance'):
+                    WorkCalendar._instance = WorkCalendar()
+        return WorkCalendar._instance
+
+    # 校验版本号, 版本变化则清空本地缓存
+    def check_version(self):
+        now = time.time()
+        if self.version is not None and now - self.checked_time < VERSION_CHECK_INTERVAL:
+            return self.version
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            value = redis_client.get_by_name(CALENDAR_VERSION_KEY)
+            version = int(value) if value else 0
+        except Exception as e:
+            logger.error("work calendar version error {}".format(e))
+            # redis 不可用时不使用本地缓存
+            self.version = None
+            self.year_map = {}
+            return None
+        if version != self.version:
+            self.year_map = {}
+            self.version = version
+        self.checked_time = now
+        return version
+
+    # 年度假期位图
+    def holiday_bits(self, year):
+        version = self.check_version()
+        bits = self.year_map.get(year, None)
+        if bits is not None:
+            return bits
+        if version is None:
+            return build_holiday_bits(year)
+        cache_key = CALENDAR_CACHE_KEY.format(year, version)
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            cache_value = redis_client.get_by_name(cache_key)
+            if cache_value:
+                bits = int(cache_value, 16)
+        except Exception as e:
+            logger.error("work calendar cache error {}".format(e))
+        if bits is None:
+            bits = build_holiday_bits(year)
+            try:
+                redis_client = RedisClientInstance.get_storage_instance()
+                redis_client.single_set_string_with_expire_time(cache_key, 'second', CALENDAR_CACHE_EXPIRE,
+                                                                format(bits, 'x'))
+            except Exception as e:
+                logger.error("work calendar cache error {}".format(e))
+        self.year_map[year] = bits
+        return bits
+
+    # 是否放假
+    def is_holiday(self, day):
+        bits = self.holiday_bits(day.year)
+        return (bits >> day_of_year(day)) & 1
+
+    # 是否为考勤日
+    def is_working_day(self, day):
+        return self.is_holiday(day) == 0
+
+    # 区间内的考勤日 [start, end]
+    def working_days(self, start, end):
+        if isinstance(start, datetime.datetime):
+            start = start.date()
+        if isinstance(end, datetime.datetime):
+            end = end.date()
+        day_list = []
+        day = start
+        while day <= end:
+            if self.is_working_day(day):
+                day_list.append(day)
+            day += datetime.timedelta(days=1)
+        return day_list
+
+    # 区间内的考勤天数 [start, end]
+    def count_working_days(self, start, end):
+        return len(self.working_days(start, end))
+
+    # 月度日历
+    def month_calendar(self, month_date):
+        data = []
+        day = datetime.date(month_date.year, month_date.month, 1)
+        while day.month == month_date.month:
+            data.append({
+                'day': day.strftime("%Y-%m-%d"),
+                'is_holiday': self.is_holiday(day)
+            })
+            day += datetime.timedelta(days=1)
+        return data
+
+    # 日历变更, 递增版本号
+    def invalidate(self):
+        self.year_map = {}
+        self.version = None
+        try:
+            redis_client = RedisClientInstance.get_storage_instance()
+            redis_client.increase_by(CALENDAR_VERSION_KEY)
+        except Exception as e:
+            logger.error("work calendar invalidate error {}".format(e))
@@ -89,6 +89,8 @@ CORS_ALLOW_HEADERS = (
 MIDDLEWARE = [
     # 安全设置，比如XSS脚本过滤
     'django.middleware.security.SecurityMiddleware',
+    # 访问日志
+    'apps.core.middleware.access_log.AccessLogMiddleware',
     # URL转义
     'django.middleware.common.CommonMiddleware',
     # 跨域请求
@@ -162,6 +164,8 @@ ROOT_URLCONF = 'swallow.urls'
 # 用户验证配置
 ######################################
 AUTH_USER_MODEL = "permcontrol.User"
+# 密码加密线程池大小
+PASSWORD_HASH_WORKERS = 4
 
 
 ######################################
@@ -205,6 +209,10 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_CLASSES': [
         'apps.core.framework.throttle.UserRateThrottle',
     ],
+    # 视图 throttle_scope 对应的频率
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/m',
+    },
     # 错误处理 展示在接口返回数据里
     'EXCEPTION_HANDLER': 'apps.core.framework.exception.custom_exception_handler',
 }
@@ -221,6 +229,10 @@ if not os.path.exists(LOG_DIR):
    except:
        pass
 
+# 访问日志采样比例、请求体截断长度
+ACCESS_LOG_SAMPLE_RATE = 1.0
+ACCESS_LOG_BODY_LIMIT = 2048
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -254,6 +266,13 @@ LOGGING = {
             'encoding': 'utf-8',
 
         },
+        'access': {
+            'level': 'INFO',
+            'class': 'apps.core.middleware.access_log.AccessQueueHandler',  # 队列异步写入
+            'filename': os.path.join(LOG_DIR, 'access.log'),
+            'maxBytes': 1024 * 1024 * 5,
+            'backupCount': CommonConfig.log_max_counts,
+        },
         'error': {
             'level': 'ERROR',
             'class': 'logging.handlers.RotatingFileHandler',  # 保存到文件，自动切
@@ -271,6 +290,11 @@ LOGGING = {
             'level': "INFO",
             'propagate': True,
         },
+        'access': {
+            'handlers': ['access'],
+            'level': "INFO",
+            'propagate': False,
+        },
         "gunicorn.access": {
             "handlers": ["debug_file"],
             "level": "INFO",